@@ -3,3 +3,24 @@ __author__ = "Mathieu Renzo"
 from .compare_inlists import compare_inlists
 from .compare_all_workdir_inlists import compare_all_workdir_inlists
 from .merge_column_lists import merge_column_lists
+from .benchmark import benchmark_compare_workdir
+from .regression import test_suite_regression
+from .validate_inlists import validate_inlists
+from .flatten_inlists import flatten_inlists
+from .fingerprint import fingerprint_inlists
+from .cluster_inlists import cluster_inlists
+from .defaults_delta import compare_mesa_defaults
+from .defaults_snapshot import snapshot_mesa_defaults
+from .catalog import catalog_inlists, query_inlists
+from .changelog import changelog_inlists
+from .diff_cache import cached_diff_inlists
+from .comparator import Comparator
+from .errors import (
+    CompareWorkdirError,
+    MESADirNotFound,
+    DefaultsNotFound,
+    BadSnapshot,
+    InlistNotFound,
+    GitError,
+    ArchiveError,
+)
@@ -0,0 +1,163 @@
+#!/usr/bin/python3
+# author: Mathieu Renzo
+
+# Author: Mathieu Renzo <mathren90@gmail.com>
+# Keywords: files
+
+# Copyright (C) 2019-2021 Mathieu Renzo
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or (at
+# your option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see http://www.gnu.org/licenses/.
+
+import io
+import sys
+import contextlib
+import multiprocessing
+
+# pip install -U termcolor
+from termcolor import colored
+
+from .compare_inlists import get_MESA_DIR, diff_inlists
+from .compare_all_workdir_inlists import check_folders_consistency
+from .profiling import is_profiling, reset_profile, get_profile, merge_profile
+from .file_access import is_file, is_dir
+
+
+# ------------------------- read the list of pairs ----------------------------------
+
+
+def read_batch_lines(batch_file: "str") -> "list":
+    """
+    returns the (line number, line) in batch_file, or stdin if "-",
+    skipping empty lines and lines starting with #
+    """
+    if batch_file == "-":
+        lines = sys.stdin.readlines()
+    else:
+        with open(batch_file, "r") as F:
+            lines = F.readlines()
+    batch_lines = []
+    for i, line in enumerate(lines):
+        l = line.strip("\n\r").rstrip().lstrip()
+        if (l == "") or (l[0] == "#"):
+            continue
+        batch_lines.append((i, l))
+    return batch_lines
+
+
+def read_paths(batch_file: "str") -> "list":
+    """reads the inlists or work directories listed in batch_file, one per line. Use "-" to read from stdin."""
+    return [l for i, l in read_batch_lines(batch_file)]
+
+
+def read_pairs(batch_file: "str", malformed=None) -> "list":
+    """
+    reads the pairs of inlists or work directories to compare from batch_file,
+    one pair per line separated by white spaces. Use "-" to read from stdin.
+    Empty lines and lines starting with # are skipped.
+    If a list malformed is given, the (line number, line) of the lines that are not pairs are appended to it.
+    """
+    pairs = []
+    for i, l in read_batch_lines(batch_file):
+        paths = l.split()
+        if len(paths) != 2:
+            print(colored(f"line {i+1} of {batch_file} is not a pair, skipping it: {l}", "yellow"))
+            if malformed is not None:
+                malformed.append((i, l))
+            continue
+        pairs.append((paths[0], paths[1]))
+    return pairs
+
+
+# ----------------------------- do the comparison ----------------------------------
+
+
+def compare_pair(pair: "tuple", do_pgstar=False, MESA_DIR="", vb=False, MESA_DIR2=""):
+    """
+    compare a pair of inlists or a pair of work directories,
+    printing the same output as compare_inlists or compare_all_workdir_inlists.
+    Returns True if the comparison could be done.
+    """
+    path1, path2 = pair
+    print(colored(f"*** {path1} vs. {path2} ***", "blue"))
+    try:
+        if is_dir(path1) and is_dir(path2):
+            check_folders_consistency(path1, path2, do_pgstar=do_pgstar, MESA_DIR=MESA_DIR, vb=vb, MESA_DIR2=MESA_DIR2)
+        elif is_file(path1) and is_file(path2):
+            diff_inlists(path1, path2, do_pgstar=do_pgstar, MESA_DIR=MESA_DIR, vb=vb, MESA_DIR2=MESA_DIR2)
+        else:
+            print(colored("Need two inlists or two work directories, skipping", "yellow"))
+            return False
+    except (Exception, SystemExit) as e:
+        # one broken pair should not stop the whole batch
+        print(colored(f"FAILED: {path1} {path2} ({type(e).__name__}: {e})", "yellow"))
+        return False
+    print("")
+    return True
+
+
+def _compare_pair_captured(args):
+    """runs compare_pair in a worker process and returns (success, output, profile)"""
+    pair, do_pgstar, MESA_DIR, vb, MESA_DIR2 = args
+    out = io.StringIO()
+    # the worker inherits the profiling flag, send back only what this pair recorded
+    reset_profile()
+    with contextlib.redirect_stdout(out):
+        success = compare_pair(pair, do_pgstar=do_pgstar, MESA_DIR=MESA_DIR, vb=vb, MESA_DIR2=MESA_DIR2)
+    profile = get_profile() if is_profiling() else None
+    return success, out.getvalue(), profile
+
+
+def compare_batch(batch_file: "str", do_pgstar=False, MESA_DIR="", vb=False, jobs=1, MESA_DIR2="") -> "int":
+    """
+    Compare all the pairs listed in batch_file (or stdin if "-") in a single process,
+    sharing the defaults and inlists caches between pairs. If jobs > 1, the pairs are
+    distributed over a pool of worker processes, and the output is still printed in
+    the order of batch_file. Returns the number of pairs that could not be compared,
+    counting the lines that are not pairs.
+    If MESA_DIR2 is given, the second of each pair is for the MESA version in MESA_DIR2.
+    """
+    if MESA_DIR == "":
+        MESA_DIR = get_MESA_DIR()
+    malformed = []
+    pairs = read_pairs(batch_file, malformed=malformed)
+    # the lines that are not pairs could not be compared either
+    failed = len(malformed)
+    if MESA_DIR2 != "":
+        from .defaults_delta import warm_defaults_delta
+
+        # computed once here, and inherited by the worker processes
+        warm_defaults_delta(MESA_DIR, MESA_DIR2)
+    if jobs > 1 and len(pairs) > 1:
+        from .shared_defaults import shared_defaults, attach_shared_defaults
+
+        tasks = [(pair, do_pgstar, MESA_DIR, vb, MESA_DIR2) for pair in pairs]
+        # the workers map the same read-only defaults instead of each reading them
+        with shared_defaults([MESA_DIR] + ([MESA_DIR2] if MESA_DIR2 != "" else [])) as defaults_file:
+            with multiprocessing.Pool(
+                min(jobs, len(pairs)), initializer=attach_shared_defaults, initargs=(defaults_file,)
+            ) as pool:
+                # imap keeps the order of the pairs
+                for success, output, profile in pool.imap(_compare_pair_captured, tasks):
+                    sys.stdout.write(output)
+                    if profile is not None:
+                        merge_profile(profile)
+                    if not success:
+                        failed += 1
+    else:
+        for pair in pairs:
+            if not compare_pair(pair, do_pgstar=do_pgstar, MESA_DIR=MESA_DIR, vb=vb, MESA_DIR2=MESA_DIR2):
+                failed += 1
+    n_pairs = len(pairs) + len(malformed)
+    print(colored(f"compared {n_pairs - failed} of {n_pairs} pairs", "blue"))
+    return failed
@@ -0,0 +1,286 @@
+#!/usr/bin/python3
+# author: Mathieu Renzo
+
+# Author: Mathieu Renzo <mathren90@gmail.com>
+# Keywords: files
+
+# Copyright (C) 2019-2021 Mathieu Renzo
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or (at
+# your option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see http://www.gnu.org/licenses/.
+
+# Benchmarks on synthetic $MESA_DIR and work directories, so that no
+# MESA installation is needed to spot performance regressions.
+
+import os
+import sys
+import json
+import time
+import random
+import platform
+import tempfile
+import contextlib
+
+# pip install -U termcolor
+from termcolor import colored
+
+# pip install -U click
+import click
+
+from .compare_inlists import (
+    DEFAULTS_FILES,
+    clear_caches,
+    get_defaults,
+    get_job_namelist,
+    get_controls_namelist,
+    get_eos_namelist,
+    get_kap_namelist,
+    get_pgstar_namelist,
+    diff_starjob,
+    diff_controls,
+    diff_eos,
+    diff_kap,
+    diff_pgstar,
+)
+from .compare_all_workdir_inlists import (
+    build_top_star_job,
+    build_top_controls,
+    build_top_eos,
+    build_top_kap,
+    build_top_pgstar,
+    check_folders_consistency,
+)
+
+# namelists of a single star work directory, in the order MESA reads them
+SINGLE_NAMELISTS = ["star_job", "eos", "kap", "controls", "pgstar"]
+
+
+# ------------------------- synthetic MESA trees ----------------------------------
+
+
+def synthetic_key(namelist: "str", i: "int") -> "str":
+    """name of the i-th synthetic option of namelist"""
+    return f"{namelist}_option_{i}"
+
+
+def synthetic_value(rng: "random.Random", i: "int") -> "str":
+    """a value as it would be written in an inlist, cycling through the Fortran types"""
+    kind = i % 4
+    if kind == 0:
+        return f"{rng.uniform(-10, 10):.6e}".replace("e", "d")
+    elif kind == 1:
+        return str(rng.randint(0, 1000))
+    elif kind == 2:
+        return rng.choice([".true.", ".false."])
+    else:
+        return f"'string_{rng.randint(0, 1000)}'"
+
+
+def make_synthetic_mesa_dir(root: "str", n_keys=1000, seed=0) -> "str":
+    """
+    writes the defaults files of all namelists with n_keys options each
+    (plus the options for nested inlists) in root, and returns root to use as MESA_DIR
+    """
+    rng = random.Random(seed)
+    for namelist, fname in DEFAULTS_FILES.items():
+        path = os.path.join(root, fname)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "w") as F:
+            F.write(f"! synthetic {namelist} defaults\n\n")
+            for i in range(n_keys):
+                F.write(f"! documentation of {synthetic_key(namelist, i)}\n")
+                F.write(f"      {synthetic_key(namelist, i)} = {synthetic_value(rng, i)}\n\n")
+            for j in range(1, 6):
+                F.write(f"      read_extra_{namelist}_inlist({j}) = .false.\n")
+                F.write(f"      extra_{namelist}_inlist_name({j}) = 'undefined'\n")
+            if namelist == "binary_job":
+                F.write("      inlist_names(1) = 'inlist1'\n")
+                F.write("      inlist_names(2) = 'inlist2'\n")
+    os.makedirs(os.path.join(root, "data"), exist_ok=True)
+    with open(os.path.join(root, "data", "version_number"), "w") as F:
+        F.write(f"synthetic-{n_keys}-{seed}\n")
+    return root
+
+
+def make_synthetic_work_dir(work_dir: "str", n_keys=1000, depth=2, n_files=2, frac_set=0.2, seed=0) -> "str":
+    """
+    writes a single star work directory where inlist reads n_files (at most 5) nested
+    inlists for each namelist, each starting a chain of depth nested inlists. Each file
+    sets a random fraction frac_set of the n_keys options of each namelist.
+    Returns the path to the top inlist.
+    """
+    rng = random.Random(seed)
+    n_files = min(max(n_files, 1), 5)
+    os.makedirs(work_dir, exist_ok=True)
+
+    def write_inlist(fname: "str", nested: "list"):
+        with open(os.path.join(work_dir, fname), "w") as F:
+            for namelist in SINGLE_NAMELISTS:
+                F.write(f"&{namelist}\n")
+                for j, child in enumerate(nested):
+                    F.write(f"  read_extra_{namelist}_inlist({j+1}) = .true.\n")
+                    F.write(f"  extra_{namelist}_inlist_name({j+1}) = '{child}'\n")
+                for i in sorted(rng.sample(range(n_keys), int(frac_set * n_keys))):
+                    F.write(f"  {synthetic_key(namelist, i)} = {synthetic_value(rng, i)} ! comment\n")
+                F.write(f"/ ! end of {namelist} namelist\n\n")
+
+    for chain in range(1, n_files + 1):
+        for level in range(depth, 0, -1):
+            child = [f"inlist_{chain}_{level+1}"] if level < depth else []
+            write_inlist(f"inlist_{chain}_{level}", child)
+    write_inlist("inlist", [f"inlist_{chain}_1" for chain in range(1, n_files + 1)] if depth > 0 else [])
+    return os.path.join(work_dir, "inlist")
+
+
+# ----------------------------- timing ----------------------------------
+
+
+def time_it(func, repeat=3, cold=True) -> "float":
+    """
+    returns the best time in seconds out of repeat calls of func, with output
+    discarded. If cold, the defaults and inlists caches are cleared before each call.
+    """
+    best = float("inf")
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        for _ in range(repeat):
+            if cold:
+                clear_caches()
+            t_start = time.perf_counter()
+            func()
+            best = min(best, time.perf_counter() - t_start)
+    return best
+
+
+def run_benchmarks(root: "str", n_keys=1000, depth=2, n_files=2, repeat=3, seed=0) -> "dict":
+    """
+    creates the synthetic MESA_DIR and two work directories in root,
+    and returns a dictionary with the timing of each stage
+    """
+    MESA_DIR = make_synthetic_mesa_dir(os.path.join(root, "mesa"), n_keys=n_keys, seed=seed)
+    work1 = os.path.join(root, "work1")
+    work2 = os.path.join(root, "work2")
+    inlist1 = make_synthetic_work_dir(work1, n_keys=n_keys, depth=depth, n_files=n_files, seed=seed)
+    make_synthetic_work_dir(work2, n_keys=n_keys, depth=depth, n_files=n_files, seed=seed + 1)
+    readers = {
+        "star_job": get_job_namelist,
+        "eos": get_eos_namelist,
+        "kap": get_kap_namelist,
+        "controls": get_controls_namelist,
+        "pgstar": get_pgstar_namelist,
+    }
+    builders = {
+        "star_job": build_top_star_job,
+        "eos": build_top_eos,
+        "kap": build_top_kap,
+        "controls": build_top_controls,
+        "pgstar": build_top_pgstar,
+    }
+    differs = {
+        "star_job": diff_starjob,
+        "eos": diff_eos,
+        "kap": diff_kap,
+        "controls": diff_controls,
+        "pgstar": diff_pgstar,
+    }
+    results = {}
+    for namelist in SINGLE_NAMELISTS:
+        reader = readers[namelist]
+        results[f"parse/{namelist}"] = time_it(lambda: reader(inlist1), repeat)
+    for namelist in DEFAULTS_FILES:
+        results[f"defaults/{namelist}"] = time_it(lambda: get_defaults(namelist, MESA_DIR), repeat)
+    for namelist in SINGLE_NAMELISTS:
+        builder = builders[namelist]
+        results[f"build_top/{namelist}"] = time_it(lambda: builder(work1), repeat)
+    for namelist in SINGLE_NAMELISTS:
+        builder = builders[namelist]
+        with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+            nml1 = builder(work1)
+            nml2 = builder(work2)
+            get_defaults(namelist, MESA_DIR)
+        differ = differs[namelist]
+        # defaults stay cached: this is the cost of the comparison itself
+        results[f"diff/{namelist}"] = time_it(lambda: differ(nml1, nml2, "1", "2", MESA_DIR, True), repeat, cold=False)
+    results["total/work_dirs"] = time_it(
+        lambda: check_folders_consistency(work1, work2, do_pgstar=True, MESA_DIR=MESA_DIR, vb=True), repeat
+    )
+    return results
+
+
+def compare_results(old: "dict", new: "dict", threshold=0.2) -> "int":
+    """
+    prints the timing of each stage of new relative to old,
+    in red if slower by more than threshold. Returns the number of regressions.
+    """
+    regressions = 0
+    for name in sorted(new["results"]):
+        t_new = new["results"][name]
+        if name not in old["results"]:
+            print(f"{name:<30}\t{t_new:10.6f} s\t(new)")
+            continue
+        t_old = old["results"][name]
+        ratio = t_new / t_old if t_old > 0 else float("inf")
+        line = f"{name:<30}\t{t_old:10.6f} s -> {t_new:10.6f} s\t{ratio:6.2f}x"
+        if ratio > 1 + threshold:
+            print(colored(line, "red"))
+            regressions += 1
+        elif ratio < 1 - threshold:
+            print(colored(line, "green"))
+        else:
+            print(line)
+    return regressions
+
+
+# command line wrapper
+@click.command(context_settings={"ignore_unknown_options": True})
+@click.option("--keys", default=1000, help="Number of options in each namelist.")
+@click.option("--depth", default=2, help="Depth of the chains of nested inlists.")
+@click.option("--files", default=2, help="Number of nested inlists read by the top inlist (at most 5).")
+@click.option("--repeat", default=3, help="Repetitions of each measurement (the best is kept).")
+@click.option("--seed", default=0, help="Seed for the synthetic inlists.")
+@click.option("--output", default="", help="Save the results as JSON in this file.")
+@click.option("--compare", default="", help="Compare with the results previously saved in this JSON file.")
+@click.option("--threshold", default=0.2, help="Relative slow down reported as a regression with --compare.")
+def benchmark_compare_workdir(keys, depth, files, repeat, seed, output, compare, threshold):
+    with tempfile.TemporaryDirectory() as root:
+        results = run_benchmarks(root, n_keys=keys, depth=depth, n_files=files, repeat=repeat, seed=seed)
+    report = {
+        "meta": {
+            "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "keys": keys,
+            "depth": depth,
+            "files": files,
+            "repeat": repeat,
+            "seed": seed,
+        },
+        "results": results,
+    }
+    if output != "":
+        with open(output, "w") as F:
+            json.dump(report, F, indent=1)
+    if compare != "":
+        with open(compare, "r") as F:
+            old = json.load(F)
+        if {k: v for k, v in old["meta"].items() if k not in ("time", "python", "platform")} != {
+            k: v for k, v in report["meta"].items() if k not in ("time", "python", "platform")
+        }:
+            print(colored("WARNING: the parameters of the two benchmarks differ", "yellow"))
+        regressions = compare_results(old, report, threshold=threshold)
+        sys.exit(1 if regressions else 0)
+    for name in sorted(results):
+        print(f"{name:<30}\t{results[name]:10.6f} s")
+
+
+if __name__ == "__main__":
+    benchmark_compare_workdir()
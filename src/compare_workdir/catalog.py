@@ -0,0 +1,263 @@
+#!/usr/bin/python3
+# author: Mathieu Renzo
+
+# Author: Mathieu Renzo <mathren90@gmail.com>
+# Keywords: files
+
+# Copyright (C) 2019-2021 Mathieu Renzo
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or (at
+# your option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see http://www.gnu.org/licenses/.
+
+
+# A catalog of the options set in many work directories, in a SQLite
+# database with one row (work directory, namelist, option, value, inlist
+# setting it) per option MESA reads, after following the nested inlists.
+# Only the work directories whose inlists changed are read again when
+# updating the catalog, and finding which work directories set an option
+# is then a single indexed query.
+
+import os
+import sys
+import json
+import sqlite3
+import hashlib
+
+# pip install -U termcolor
+from termcolor import colored
+
+# pip install -U click
+import click
+
+from .compare_inlists import iter_options, clean_val, convert_bool
+from .compare_all_workdir_inlists import resolve_work_dir
+from .batch_compare import read_paths
+from .fingerprint import canonical_value
+from .file_access import ExistingPath, file_key, file_stamp, read_bytes, is_dir
+from .errors import report_errors
+
+
+# ------------------------- the database ----------------------------------
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS workdirs (
+    id INTEGER PRIMARY KEY,
+    path TEXT UNIQUE NOT NULL,
+    files TEXT NOT NULL,
+    settings TEXT NOT NULL DEFAULT ''
+);
+CREATE TABLE IF NOT EXISTS options (
+    workdir INTEGER NOT NULL REFERENCES workdirs(id),
+    namelist TEXT NOT NULL,
+    key TEXT NOT NULL,
+    value TEXT NOT NULL,
+    source TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS options_key ON options (key, value);
+CREATE INDEX IF NOT EXISTS options_workdir ON options (workdir);
+"""
+
+
+def open_catalog(database: "str"):
+    """returns a connection to the catalog in database, creating it if needed"""
+    connection = sqlite3.connect(database)
+    connection.executescript(_SCHEMA)
+    columns = [row[1] for row in connection.execute("PRAGMA table_info(workdirs)")]
+    if "settings" not in columns:
+        # catalogs made before the settings were saved: their work directories are read again
+        connection.execute("ALTER TABLE workdirs ADD COLUMN settings TEXT NOT NULL DEFAULT ''")
+    return connection
+
+
+# ------------------------- update the catalog ----------------------------------
+
+
+def catalog_value(val) -> "str":
+    """canonical_value, with the logicals in lowercase (MESA reads .TRUE. as .true.)"""
+    value = canonical_value(val)
+    logical = convert_bool(value.lower())
+    return logical if logical in (".true.", ".false.") else value
+
+
+def file_hash(path: "str") -> "str":
+    return hashlib.sha256(read_bytes(path)).hexdigest()
+
+
+def files_changed(files: "dict") -> "tuple":
+    """
+    checks the inlists in files ({inlist: [stamp, sha256]}) and returns (changed, files)
+    with files updated for the inlists touched without changing their content
+    """
+    updated = {}
+    for inlist, (stamp, sha) in files.items():
+        try:
+            new_stamp = list(file_stamp(inlist))
+        except FileNotFoundError:
+            return True, files
+        if new_stamp != stamp:
+            # touched, but maybe not changed
+            if file_hash(inlist) != sha:
+                return True, files
+        updated[inlist] = [new_stamp, sha]
+    return False, updated
+
+
+# work directories indexed with an older format are read again
+CATALOG_FORMAT = 2
+
+
+def index_settings(do_pgstar: "bool", MESA_DIR: "str") -> "str":
+    """the settings used to read a work directory, which change the options in the catalog"""
+    # MESA_DIR gives the default inlists of the stars in binaries
+    MESA_DIR = MESA_DIR if MESA_DIR != "" else os.environ.get("MESA_DIR", "")
+    return json.dumps({"do_pgstar": bool(do_pgstar), "MESA_DIR": MESA_DIR, "format": CATALOG_FORMAT}, sort_keys=True)
+
+
+def index_work_dir(connection, work_dir: "str", do_pgstar=False, MESA_DIR="") -> "bool":
+    """
+    adds the options set in work_dir to the catalog, or replaces them if its inlists (or do_pgstar
+    and MESA_DIR) changed since they were last read. Returns True if work_dir was read.
+    """
+    path = file_key(work_dir)
+    settings = index_settings(do_pgstar, MESA_DIR)
+    row = connection.execute("SELECT id, files, settings FROM workdirs WHERE path = ?", (path,)).fetchone()
+    if row is not None and row[2] == settings:
+        changed, files = files_changed(json.loads(row[1]))
+        if not changed:
+            connection.execute("UPDATE workdirs SET files = ? WHERE id = ?", (json.dumps(files), row[0]))
+            return False
+    sources = {}
+    chain = []
+    namelists = resolve_work_dir(work_dir, do_pgstar=do_pgstar, MESA_DIR=MESA_DIR, sources=sources, chain=chain)
+    rows = []
+    # all the inlists read, also those whose options are all overridden by a later inlist
+    inlists = {file_key(work_dir + "/inlist")} | {file_key(inlist) for inlist, _ in chain}
+    for section, namelist in namelists.items():
+        for k, v in iter_options(namelist):
+            source = file_key(sources[section][k])
+            rows.append((section, k, catalog_value(v), source))
+            inlists.add(source)
+    files = {inlist: [list(file_stamp(inlist)), file_hash(inlist)] for inlist in sorted(inlists)}
+    if row is None:
+        cursor = connection.execute(
+            "INSERT INTO workdirs (path, files, settings) VALUES (?, ?, ?)", (path, json.dumps(files), settings)
+        )
+        workdir_id = cursor.lastrowid
+    else:
+        workdir_id = row[0]
+        connection.execute(
+            "UPDATE workdirs SET files = ?, settings = ? WHERE id = ?", (json.dumps(files), settings, workdir_id)
+        )
+        connection.execute("DELETE FROM options WHERE workdir = ?", (workdir_id,))
+    connection.executemany(
+        "INSERT INTO options (workdir, namelist, key, value, source) VALUES (?, ?, ?, ?, ?)",
+        [(workdir_id,) + r for r in rows],
+    )
+    return True
+
+
+def update_catalog(database: "str", work_dirs: "list", do_pgstar=False, MESA_DIR="") -> "tuple":
+    """
+    indexes the work_dirs in the catalog in database, and returns the number
+    of work directories read, unchanged since the last update, and failed
+    """
+    n_read, n_unchanged, n_failed = 0, 0, 0
+    connection = open_catalog(database)
+    try:
+        for work_dir in work_dirs:
+            try:
+                if index_work_dir(connection, work_dir, do_pgstar=do_pgstar, MESA_DIR=MESA_DIR):
+                    n_read += 1
+                else:
+                    n_unchanged += 1
+            except Exception as e:
+                # one broken work directory should not stop the indexing
+                print(colored(f"FAILED: {work_dir} ({type(e).__name__}: {e})", "yellow"))
+                n_failed += 1
+            connection.commit()
+    finally:
+        connection.close()
+    return n_read, n_unchanged, n_failed
+
+
+# ------------------------- query the catalog ----------------------------------
+
+
+def query_catalog(database: "str", key: "str", value=None, namelist="") -> "list":
+    """
+    returns the sorted (work directory, namelist, option, value, inlist) of the options key
+    (with all its elements for arrays, e.g. x_ctrl) in the catalog, only those set to value if given
+    """
+    key = key.strip().lower()
+    query = "SELECT w.path, o.namelist, o.key, o.value, o.source FROM options o JOIN workdirs w ON o.workdir = w.id"
+    query += " WHERE (o.key = ? OR o.key GLOB ?)"
+    args = [key, key + "(*"]
+    if value is not None:
+        query += " AND o.value = ?"
+        args.append(catalog_value(clean_val(value.strip())))
+    if namelist != "":
+        # also star1/controls etc. for binaries
+        query += " AND (o.namelist = ? OR o.namelist GLOB ?)"
+        args += [namelist, "*/" + namelist]
+    connection = open_catalog(database)
+    try:
+        return sorted(connection.execute(query, args).fetchall())
+    finally:
+        connection.close()
+
+
+# command line wrappers
+@click.command(context_settings={"ignore_unknown_options": True})
+@click.argument("database", nargs=1)
+@click.argument("work_dirs", nargs=-1, type=ExistingPath())
+@click.option("--batch", default="", help="Also index the work directories listed in this file (- for stdin).")
+@click.option("--pgstar", default=False, help="Index also the pgstar namelists.")
+@click.option(
+    "--mesa_dir",
+    default="",
+    help="use customized location of $MESA_DIR. Will use environment variable if empty and return an error if empty.",
+)
+@report_errors
+def catalog_inlists(database, work_dirs, batch, pgstar, mesa_dir):
+    work_dirs = list(work_dirs)
+    if batch != "":
+        work_dirs += read_paths(batch)
+    not_dirs = [w for w in work_dirs if not is_dir(w)]
+    for w in not_dirs:
+        print(colored(f"{w} is not a work directory, skipping", "yellow"))
+    work_dirs = [w for w in work_dirs if w not in not_dirs]
+    n_read, n_unchanged, n_failed = update_catalog(database, work_dirs, do_pgstar=pgstar, MESA_DIR=mesa_dir)
+    print(colored(f"read {n_read}, unchanged {n_unchanged}, failed {n_failed} work directories", "blue"))
+    sys.exit(1 if n_failed else 0)
+
+
+@click.command(context_settings={"ignore_unknown_options": True})
+@click.argument("database", nargs=1, type=click.Path(exists=True))
+@click.argument("key", nargs=1)
+@click.argument("value", nargs=1, required=False)
+@click.option("--namelist", default="", help="Only in this namelist (e.g. controls).")
+@click.option("--sources", is_flag=True, help="Print also the inlist setting each option.")
+@report_errors
+def query_inlists(database, key, value, namelist, sources):
+    rows = query_catalog(database, key, value=value, namelist=namelist)
+    for path, section, k, v, source in rows:
+        line = f"{path}\t&{section}\t{k}={v}"
+        if sources:
+            line += f"\t({source})"
+        print(line)
+    n_work_dirs = len({row[0] for row in rows})
+    print(colored(f"{n_work_dirs} work directories", "blue"))
+
+
+if __name__ == "__main__":
+    catalog_inlists()
@@ -0,0 +1,99 @@
+#!/usr/bin/python3
+# author: Mathieu Renzo
+
+# Author: Mathieu Renzo <mathren90@gmail.com>
+# Keywords: files
+
+# Copyright (C) 2019-2021 Mathieu Renzo
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or (at
+# your option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see http://www.gnu.org/licenses/.
+
+
+# Changelog of an ordered sequence of work directories or inlists (e.g.
+# run_v1 ... run_v30): which options changed at each step. Each work
+# directory is read once, and compared only with the previous one.
+
+# pip install -U termcolor
+from termcolor import colored
+
+# pip install -U click
+import click
+
+from .compare_inlists import get_MESA_DIR
+from .batch_compare import read_paths
+from .cluster_inlists import path_options, different_options
+from .file_access import ExistingPath
+from .errors import report_errors
+
+
+# ------------------------- consecutive differences ----------------------------------
+
+
+def sequence_deltas(paths: "list", do_pgstar=False, MESA_DIR=""):
+    """
+    for each step k (from 1) of the sequence of work directories or inlists paths, yields
+    (k, previous path, path, [(namelist/option, old value, new value)]), with None as value
+    for options not set or set to their default
+    """
+    if MESA_DIR == "":
+        MESA_DIR = get_MESA_DIR()
+    previous, previous_options = None, None
+    for k, path in enumerate(paths):
+        options = path_options(path, do_pgstar=do_pgstar, MESA_DIR=MESA_DIR)
+        if previous is not None:
+            changes = [
+                (o, previous_options.get(o), options.get(o)) for o in different_options(previous_options, options)
+            ]
+            yield k, previous, path, changes
+        previous, previous_options = path, options
+
+
+def print_changelog(paths: "list", do_pgstar=False, MESA_DIR="") -> "int":
+    """prints the options changed at each step of the sequence paths, and returns the number of changes"""
+    n_changes = 0
+    for k, previous, path, changes in sequence_deltas(paths, do_pgstar=do_pgstar, MESA_DIR=MESA_DIR):
+        print(colored(f"step {k}: {previous} -> {path}", "blue"))
+        if not changes:
+            print("  no changes")
+        for option, old, new in changes:
+            old = "default" if old is None else old
+            new = "default" if new is None else new
+            print(f"  {option}: {old} -> {new}")
+        n_changes += len(changes)
+    return n_changes
+
+
+# command line wrapper
+@click.command(context_settings={"ignore_unknown_options": True})
+@click.argument("paths", nargs=-1, type=ExistingPath())
+@click.option(
+    "--batch", default="", help="Also the work directories or inlists listed in this file (- for stdin), in order."
+)
+@click.option("--pgstar", default=False, help="Include the pgstar namelists.")
+@click.option(
+    "--mesa_dir",
+    default="",
+    help="use customized location of $MESA_DIR. Will use environment variable if empty and return an error if empty.",
+)
+@report_errors
+def changelog_inlists(paths, batch, pgstar, mesa_dir):
+    paths = list(paths)
+    if batch != "":
+        paths += read_paths(batch)
+    n_changes = print_changelog(paths, do_pgstar=pgstar, MESA_DIR=mesa_dir)
+    print(colored(f"{n_changes} changes in {max(len(paths) - 1, 0)} steps", "blue"))
+
+
+if __name__ == "__main__":
+    changelog_inlists()
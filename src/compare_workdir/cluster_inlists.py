@@ -0,0 +1,239 @@
+#!/usr/bin/python3
+# author: Mathieu Renzo
+
+# Author: Mathieu Renzo <mathren90@gmail.com>
+# Keywords: files
+
+# Copyright (C) 2019-2021 Mathieu Renzo
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or (at
+# your option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see http://www.gnu.org/licenses/.
+
+
+# Find which work directories (or inlists) of a grid differ by only a
+# few options. Each one is turned into the set of its options not set to
+# the default (option=value features, as for the fingerprints). Pairs
+# that can be within max_diff options are found with an inverted index
+# of the features, probing only with the rarest features of each set,
+# instead of comparing all pairs. The close pairs are then joined in clusters.
+
+import multiprocessing
+
+# pip install -U termcolor
+from termcolor import colored
+
+# pip install -U click
+import click
+
+from .compare_inlists import get_MESA_DIR, get_defaults
+from .compare_all_workdir_inlists import resolve_path, defaults_name
+from .batch_compare import read_paths
+from .fingerprint import canonical_options
+from .compact import InternTable, CompactNamelist
+from .serialize import pack_configurations, unpack_configurations
+from .errors import report_errors
+from .file_access import ExistingPath
+
+# ------------------------- options as sparse vectors ----------------------------------
+
+
+def path_options(path: "str", do_pgstar=False, MESA_DIR="") -> "dict":
+    """
+    returns the options not set to their default value in the work directory or inlist path
+    as {namelist/option: value} (values as strings, see canonical_value)
+    """
+    options = {}
+    for section, namelist in resolve_path(path, do_pgstar=do_pgstar, MESA_DIR=MESA_DIR).items():
+        name = section.split("/")[-1]
+        defaults = get_defaults(name, MESA_DIR) if defaults_name(section) == name else {}
+        for option in canonical_options(namelist, defaults):
+            k, _, v = option.partition("=")
+            options[f"{section}/{k}"] = v
+    return options
+
+
+def _path_options_packed(args) -> "bytes":
+    """runs path_options in a worker process, the result packed (see serialize.py)"""
+    path, do_pgstar, MESA_DIR = args
+    return pack_configurations([path_options(path, do_pgstar=do_pgstar, MESA_DIR=MESA_DIR)])
+
+
+def iter_path_options(paths: "list", do_pgstar=False, MESA_DIR="", jobs=1):
+    """yields path_options for each of paths, computed by jobs worker processes if jobs > 1"""
+    if jobs <= 1 or len(paths) <= 1:
+        for path in paths:
+            yield path_options(path, do_pgstar=do_pgstar, MESA_DIR=MESA_DIR)
+        return
+    from .shared_defaults import shared_defaults, attach_shared_defaults
+
+    tasks = [(path, do_pgstar, MESA_DIR) for path in paths]
+    with shared_defaults([MESA_DIR]) as defaults_file:
+        with multiprocessing.Pool(
+            min(jobs, len(paths)), initializer=attach_shared_defaults, initargs=(defaults_file,)
+        ) as pool:
+            # imap keeps the order of the paths
+            for packed in pool.imap(_path_options_packed, tasks, chunksize=8):
+                yield unpack_configurations(packed)[0]
+
+
+def different_options(options1: "dict", options2: "dict") -> "list":
+    """sorted list of the options with different values (or default on one side only)"""
+    diff = options1.keys() ^ options2.keys()
+    diff.update(k for k in options1.keys() & options2.keys() if options1[k] != options2[k])
+    return sorted(diff)
+
+
+def option_features(options) -> "set":
+    """the option=value features of options (as integers for a CompactNamelist)"""
+    if isinstance(options, CompactNamelist):
+        return options.features()
+    return {f"{k}={v}" for k, v in options.items()}
+
+
+# ------------------------- find the close pairs ----------------------------------
+
+
+def close_pairs(options: "list", max_diff=3) -> "dict":
+    """
+    returns a dictionary {(i, j): different options} for the pairs i < j of options
+    (as returned by path_options) that differ in at most max_diff options.
+    Each option differing adds at most 2 to the size of the symmetric difference of the
+    option=value features, so two sets within max_diff options share at least one of the
+    first 2 * max_diff + 1 features of each set, ordered by how rare they are, or have
+    no feature in common at all (and then both are small).
+    """
+    t = 2 * max_diff
+    features = [option_features(o) for o in options]
+    index = {}
+    for i, f in enumerate(features):
+        for feature in f:
+            index.setdefault(feature, []).append(i)
+    # features common to all (e.g. options set the same way in the whole grid) don't change the distances
+    common = {feature for feature, ids in index.items() if len(ids) == len(features)}
+    if common and len(features) > 1:
+        features = [f - common for f in features]
+        for feature in common:
+            del index[feature]
+    by_size = {}
+    for i, f in enumerate(features):
+        if len(f) <= t:
+            by_size.setdefault(len(f), []).append(i)
+    pairs = {}
+    for i, f in enumerate(features):
+        prefix = sorted(f, key=lambda feature: (len(index[feature]), feature))[: t + 1]
+        candidates = set()
+        for feature in prefix:
+            candidates.update(index[feature])
+        if len(f) <= t:
+            for size in range(t - len(f) + 1):
+                candidates.update(by_size.get(size, ()))
+        for j in candidates:
+            if (j <= i) or abs(len(features[j]) - len(f)) > t or len(f ^ features[j]) > t:
+                continue
+            diff = different_options(options[i], options[j])
+            if len(diff) <= max_diff:
+                pairs[(i, j)] = diff
+    return pairs
+
+
+def find_clusters(n: "int", pairs) -> "list":
+    """groups range(n) in clusters joined by the pairs (union-find), returns those with more than one member"""
+    parent = list(range(n))
+
+    def find(i):
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    for i, j in pairs:
+        ri, rj = find(i), find(j)
+        if ri != rj:
+            parent[max(ri, rj)] = min(ri, rj)
+    clusters = {}
+    for i in range(n):
+        clusters.setdefault(find(i), []).append(i)
+    return [c for c in clusters.values() if len(c) > 1]
+
+
+def cluster_paths(paths: "list", max_diff=3, do_pgstar=False, MESA_DIR="", jobs=1) -> "tuple":
+    """
+    returns the clusters of paths (identical configurations are in the same cluster) and
+    for each path the list of (other path, different options) of its closest neighbours.
+    With jobs > 1 the work directories are read by a pool of worker processes.
+    """
+    if MESA_DIR == "":
+        MESA_DIR = get_MESA_DIR()
+    # identical configurations are compared only once, the options of large grids are kept compact
+    table = InternTable()
+    unique = {}
+    for path, options in zip(paths, iter_path_options(paths, do_pgstar=do_pgstar, MESA_DIR=MESA_DIR, jobs=jobs)):
+        options = CompactNamelist(table, options.items())
+        unique.setdefault(options.signature(), (options, []))[1].append(path)
+    options, members = zip(*unique.values()) if unique else ((), ())
+    pairs = close_pairs(list(options), max_diff=max_diff)
+    clusters = [sum((members[i] for i in c), []) for c in find_clusters(len(members), pairs)]
+    clusters += [m for m in members if len(m) > 1 and not any(m[0] in c for c in clusters)]
+    close_to = {}
+    for (i, j), diff in pairs.items():
+        close_to.setdefault(i, []).append((j, diff))
+        close_to.setdefault(j, []).append((i, diff))
+    neighbours = {}
+    for i, group in enumerate(members):
+        close = close_to.get(i, [])
+        for path in group:
+            best = [(other, []) for other in group if other != path]
+            if close and not best:
+                n_min = min(len(diff) for _, diff in close)
+                best = [(other, diff) for j, diff in close if len(diff) == n_min for other in members[j]]
+            if best:
+                neighbours[path] = best
+    return clusters, neighbours
+
+
+# command line wrapper
+@click.command(context_settings={"ignore_unknown_options": True})
+@click.argument("paths", nargs=-1, type=ExistingPath())
+@click.option(
+    "--batch", default="", help="Also cluster the work directories or inlists listed in this file (- for stdin)."
+)
+@click.option("--max_diff", default=3, help="Maximum number of different options between neighbours.")
+@click.option("--pgstar", default=False, help="Include the pgstar namelists.")
+@click.option("--neighbours", is_flag=True, help="Print also the closest neighbours of each work directory.")
+@click.option("--jobs", default=1, help="Number of worker processes reading the work directories.")
+@click.option(
+    "--mesa_dir",
+    default="",
+    help="use customized location of $MESA_DIR. Will use environment variable if empty and return an error if empty.",
+)
+@report_errors
+def cluster_inlists(paths, batch, max_diff, pgstar, neighbours, jobs, mesa_dir):
+    paths = list(paths)
+    if batch != "":
+        paths += read_paths(batch)
+    clusters, closest = cluster_paths(paths, max_diff=max_diff, do_pgstar=pgstar, MESA_DIR=mesa_dir, jobs=jobs)
+    for i, cluster in enumerate(clusters):
+        print(colored(f"cluster {i+1} ({len(cluster)} members):", "blue"))
+        for path in cluster:
+            print("  " + path)
+    if neighbours:
+        for path in paths:
+            for other, diff in closest.get(path, []):
+                what = "identical" if not diff else f"{len(diff)} different: " + " ".join(diff)
+                print(f"{path:<30}\t{other:<30}\t{what}")
+    n_alone = len(paths) - sum(len(c) for c in clusters)
+    print(colored(f"{len(clusters)} clusters within {max_diff} options, {n_alone} work directories alone", "blue"))
+
+
+if __name__ == "__main__":
+    cluster_inlists()
@@ -0,0 +1,143 @@
+#!/usr/bin/python3
+# author: Mathieu Renzo
+
+# Author: Mathieu Renzo <mathren90@gmail.com>
+# Keywords: files
+
+# Copyright (C) 2019-2021 Mathieu Renzo
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or (at
+# your option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see http://www.gnu.org/licenses/.
+
+
+# Compact namelists for holding the configurations of large grids in
+# memory: the option names and values are stored once in an InternTable
+# shared by all the namelists, and each namelist is two arrays of ids
+# (options sorted by id). CompactNamelist is a read-only mapping, so it
+# can be passed to the diff_* functions in place of a dictionary.
+
+import sys
+import array
+import bisect
+import collections.abc
+
+from .compare_inlists import get_MESA_DIR, get_defaults, FortranArray
+from .compare_all_workdir_inlists import resolve_path, defaults_name
+
+
+# ------------------------- interned options and values ----------------------------------
+
+
+def _value_key(value):
+    """hashable key of a value (arrays as their fill and elements)"""
+    if isinstance(value, FortranArray):
+        return (FortranArray, value.fill, tuple(sorted(value.items())))
+    return (value.__class__, value)
+
+
+class InternTable:
+    """option names and values shared by many CompactNamelist, each stored once"""
+
+    def __init__(self):
+        self.keys = []
+        self.key_ids = {}
+        self.values = []
+        self.value_ids = {}
+
+    def key_id(self, key: "str") -> "int":
+        i = self.key_ids.get(key)
+        if i is None:
+            i = self.key_ids[key] = len(self.keys)
+            self.keys.append(sys.intern(key))
+        return i
+
+    def value_id(self, value) -> "int":
+        value_key = _value_key(value)
+        i = self.value_ids.get(value_key)
+        if i is None:
+            i = self.value_ids[value_key] = len(self.values)
+            self.values.append(value)
+        return i
+
+
+class CompactNamelist(collections.abc.Mapping):
+    """
+    read-only namelist with the options and values interned in table.
+    Arrays are shared between namelists: do not modify the values.
+    """
+
+    __slots__ = ("table", "key_ids", "value_ids")
+
+    def __init__(self, table: "InternTable", items=()):
+        pairs = sorted((table.key_id(k), table.value_id(v)) for k, v in items)
+        self.table = table
+        self.key_ids = array.array("I", (k for k, v in pairs))
+        self.value_ids = array.array("I", (v for k, v in pairs))
+
+    def _find(self, key) -> "int":
+        """position of key, or -1"""
+        key_id = self.table.key_ids.get(key)
+        if key_id is None:
+            return -1
+        i = bisect.bisect_left(self.key_ids, key_id)
+        return i if i < len(self.key_ids) and self.key_ids[i] == key_id else -1
+
+    def __getitem__(self, key):
+        i = self._find(key)
+        if i < 0:
+            raise KeyError(key)
+        return self.table.values[self.value_ids[i]]
+
+    def __contains__(self, key):
+        return self._find(key) >= 0
+
+    def __iter__(self):
+        keys = self.table.keys
+        return (keys[k] for k in self.key_ids)
+
+    def __len__(self):
+        return len(self.key_ids)
+
+    def signature(self) -> "bytes":
+        """the same for namelists with the same options and values (in the same table)"""
+        return self.key_ids.tobytes() + self.value_ids.tobytes()
+
+    def features(self) -> "set":
+        """the (option, value) pairs as integers"""
+        return {(k << 32) | v for k, v in zip(self.key_ids, self.value_ids)}
+
+
+# ------------------------- compact configurations ----------------------------------
+
+
+def compact_namelist(namelist: "dict", table: "InternTable", defaults=None) -> "CompactNamelist":
+    """namelist in table, without the options (not arrays) set to their default value"""
+    if defaults is None:
+        defaults = {}
+    items = (
+        (k, v) for k, v in namelist.items() if isinstance(v, FortranArray) or k not in defaults or defaults[k] != v
+    )
+    return CompactNamelist(table, items)
+
+
+def compact_path(path: "str", table: "InternTable", do_pgstar=False, MESA_DIR="") -> "dict":
+    """namelists of the work directory or inlist path (see resolve_path) as CompactNamelist"""
+    if MESA_DIR == "":
+        MESA_DIR = get_MESA_DIR()
+    namelists = {}
+    for section, namelist in resolve_path(path, do_pgstar=do_pgstar, MESA_DIR=MESA_DIR).items():
+        name = section.split("/")[-1]
+        # as in path_options: there are no separate defaults for binary_pgstar
+        defaults = get_defaults(name, MESA_DIR) if defaults_name(section) == name else {}
+        namelists[section] = compact_namelist(namelist, table, defaults)
+    return namelists
@@ -0,0 +1,173 @@
+#!/usr/bin/python3
+# author: Mathieu Renzo
+
+# Author: Mathieu Renzo <mathren90@gmail.com>
+# Keywords: files
+
+# Copyright (C) 2019-2021 Mathieu Renzo
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or (at
+# your option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see http://www.gnu.org/licenses/.
+
+
+# Library API: a Comparator holds the MESA_DIR(s) and the options of the
+# comparisons, and returns the output as a string instead of printing it,
+# so that it can be used from many threads at the same time (e.g., in a
+# service). Errors are raised as the exceptions in errors.py.
+#
+#   comparator = Comparator(MESA_DIR="/path/to/mesa", do_pgstar=True)
+#   text = comparator.compare("work_dir1", "work_dir2")
+
+import io
+import sys
+import threading
+import contextlib
+
+from .compare_inlists import get_MESA_DIR, diff_inlists, clear_caches
+from .compare_all_workdir_inlists import check_folders_consistency, resolve_path
+from .fingerprint import path_fingerprints
+from .diff_cache import structured_diff
+from .serialize import pack_configurations
+from .validate_inlists import validate_paths
+from .errors import CompareWorkdirError
+from .file_access import is_file, is_dir
+
+_install_lock = threading.Lock()
+
+
+class ThreadOutput:
+    """
+    replaces sys.stdout, sending what is printed by each thread to its own buffer
+    if it has one (see capture_output), and to the original stream otherwise
+    """
+
+    def __init__(self, stream):
+        self.stream = stream
+        self.local = threading.local()
+
+    def write(self, s):
+        buffer = getattr(self.local, "buffer", None)
+        return (self.stream if buffer is None else buffer).write(s)
+
+    def flush(self):
+        if getattr(self.local, "buffer", None) is None:
+            self.stream.flush()
+
+    def __getattr__(self, name):
+        return getattr(self.stream, name)
+
+
+def _thread_output() -> "ThreadOutput":
+    """the ThreadOutput writing to sys.stdout, installed the first time it's needed and then kept"""
+    stream = sys.stdout
+    while not isinstance(stream, ThreadOutput):
+        # e.g. profiling.CountingStream installed over it
+        stream = getattr(stream, "stream", None)
+        if stream is None:
+            sys.stdout = ThreadOutput(sys.stdout)
+            return sys.stdout
+    return stream
+
+
+@contextlib.contextmanager
+def capture_output():
+    """collects in a StringIO what the current thread prints in the with block, without affecting other threads"""
+    with _install_lock:
+        out = _thread_output()
+    buffer = io.StringIO()
+    previous = getattr(out.local, "buffer", None)
+    out.local.buffer = buffer
+    try:
+        yield buffer
+    finally:
+        out.local.buffer = previous
+
+
+class Comparator:
+    """
+    compares inlists and work directories with the defaults of MESA_DIR (or $MESA_DIR, read once here),
+    and those of MESA_DIR2 for the second of each pair if given. The caches of the defaults
+    and inlists are shared by all comparators, and safe to use from several threads.
+    """
+
+    def __init__(self, MESA_DIR="", MESA_DIR2="", do_pgstar=False, vb=False):
+        self.MESA_DIR = MESA_DIR if MESA_DIR != "" else get_MESA_DIR()
+        self.MESA_DIR2 = MESA_DIR2
+        self.do_pgstar = do_pgstar
+        self.vb = vb
+
+    def diff_inlists(self, inlist1: "str", inlist2: "str") -> "str":
+        """the output of compare_inlists for inlist1 and inlist2"""
+        with capture_output() as out:
+            diff_inlists(
+                inlist1, inlist2, do_pgstar=self.do_pgstar, MESA_DIR=self.MESA_DIR, vb=self.vb, MESA_DIR2=self.MESA_DIR2
+            )
+        return out.getvalue()
+
+    def diff_work_dirs(self, work_dir1: "str", work_dir2: "str") -> "str":
+        """the output of compare_all_workdir_inlists for work_dir1 and work_dir2"""
+        with capture_output() as out:
+            check_folders_consistency(
+                work_dir1,
+                work_dir2,
+                do_pgstar=self.do_pgstar,
+                MESA_DIR=self.MESA_DIR,
+                vb=self.vb,
+                MESA_DIR2=self.MESA_DIR2,
+            )
+        return out.getvalue()
+
+    def compare(self, path1: "str", path2: "str") -> "str":
+        """compares two inlists or two work directories"""
+        if is_dir(path1) and is_dir(path2):
+            return self.diff_work_dirs(path1, path2)
+        elif is_file(path1) and is_file(path2):
+            return self.diff_inlists(path1, path2)
+        raise CompareWorkdirError(f"Need two inlists or two work directories: {path1} {path2}")
+
+    def resolve(self, path: "str") -> "dict":
+        """namelists of the work directory (after following nested inlists) or inlist path"""
+        with capture_output():
+            return resolve_path(path, do_pgstar=self.do_pgstar, MESA_DIR=self.MESA_DIR)
+
+    def pack(self, paths: "list") -> "bytes":
+        """namelists of the work directories or inlists paths, packed to send them (see serialize.py)"""
+        return pack_configurations([self.resolve(path) for path in paths])
+
+    def fingerprint(self, path: "str") -> "str":
+        """fingerprint of the work directory or inlist path (see fingerprint.py)"""
+        if self.MESA_DIR2 != "":
+            raise CompareWorkdirError("fingerprints are for a single MESA version, this Comparator has MESA_DIR2")
+        with capture_output():
+            return path_fingerprints(path, do_pgstar=self.do_pgstar, MESA_DIR=self.MESA_DIR)[0]
+
+    def structured_diff(self, path1: "str", path2: "str", cache_dir="") -> "list":
+        """options with different values, cached on disk (see diff_cache.structured_diff)"""
+        with capture_output():
+            return structured_diff(
+                path1,
+                path2,
+                do_pgstar=self.do_pgstar,
+                MESA_DIR=self.MESA_DIR,
+                cache_dir=cache_dir,
+                MESA_DIR2=self.MESA_DIR2,
+            )
+
+    def validate(self, paths: "list") -> "dict":
+        """options not in the defaults, see validate_inlists.validate_paths"""
+        with capture_output():
+            return validate_paths(paths, do_pgstar=self.do_pgstar, MESA_DIR=self.MESA_DIR)
+
+    def clear_caches(self):
+        """forget the defaults and inlists read so far (by all comparators)"""
+        clear_caches()
@@ -23,7 +23,12 @@
 # This has been tested with MESA version 15140
 
 import os
+import re
 import sys
+import itertools
+import threading
+import contextlib
+import concurrent.futures
 from pathlib import Path
 
 # pip install -U termcolor
@@ -38,6 +43,12 @@ from .compare_inlists import (
     get_pgstar_namelist,
     get_controls_namelist,
     get_defaults,
+    get_MESA_DIR,
+    get_option,
+    iter_options,
+    equal_with_defaults,
+    merge_namelists,
+    file_digest,
     diff_binary_controls,
     diff_binary_job,
     diff_controls,
@@ -46,6 +57,9 @@ from .compare_inlists import (
     diff_pgstar,
     diff_starjob,
 )
+from .profiling import profiled, profiling, count
+from .errors import CompareWorkdirError, InlistNotFound, report_errors
+from .file_access import ExistingPath, is_file, is_dir, read_bytes
 
 # ------------------------- some auxiliary functions ----------------------------------
 
@@ -64,11 +78,10 @@ def append_inlist_path(path_list: "list", path: "str", work_dir="./") -> "str":
 
 def get_first_inlist(work_dir: "str") -> "str":
     inlist = work_dir + "/inlist"
-    if os.path.isfile(inlist):
+    if is_file(inlist):
         return inlist
     else:
-        print(colored(work_dir + " has no inlist, too complex for me", "yellow"))
-        sys.exit()
+        raise InlistNotFound(work_dir + " has no inlist, too complex for me")
 
 
 def is_folder_binary(work_dir: "str") -> "bool":
@@ -86,35 +99,19 @@ def get_top_binary_inlist(job1: "dict", job2: "dict", MESA_DIR=""):
     reads the inlist for each individual star in a binary
     for both folders we are comparing. If not present, use the default
     """
-    # primary first binary
-    try:
-        main_inlist_star1_b1 = job1["inlist_names(1)"]
-    except KeyError:
-        job_defaults = get_defaults("binary_job", MESA_DIR=MESA_DIR)
-        main_inlist_star1_b1 = job_defaults["inlist_names(1)"]
-    # either way you got it, clean it
-    main_inlist_star1_b1 = main_inlist_star1_b1.strip("'").strip('"')
-    # secondary first binary
-    try:
-        main_inlist_star2_b1 = job1["inlist_names(2)"]
-    except KeyError:
-        job_defaults = get_defaults("binary_job", MESA_DIR=MESA_DIR)
-        main_inlist_star2_b1 = job_defaults["inlist_names(2)"]
-    main_inlist_star2_b1 = main_inlist_star2_b1.strip("'").strip('"')
-    # primary second binary
-    try:
-        main_inlist_star1_b2 = job2["inlist_names(1)"]
-    except KeyError:
-        job_defaults = get_defaults("binary_job", MESA_DIR=MESA_DIR)
-        main_inlist_star1_b2 = job_defaults["inlist_names(1)"]
-    main_inlist_star1_b2 = main_inlist_star1_b2.strip("'").strip('"')
-    # secondary first binary
-    try:
-        main_inlist_star2_b2 = job2["inlist_names(2)"]
-    except KeyError:
-        job_defaults = get_defaults("binary_job", MESA_DIR=MESA_DIR)
-        main_inlist_star2_b2 = job_defaults["inlist_names(2)"]
-    main_inlist_star2_b2 = main_inlist_star2_b2.strip("'").strip('"')
+
+    def inlist_name(job: "dict", i: "int") -> "str":
+        name = get_option(job, f"inlist_names({i})")
+        if name is None:
+            job_defaults = get_defaults("binary_job", MESA_DIR=MESA_DIR)
+            name = get_option(job_defaults, f"inlist_names({i})")
+        # either way you got it, clean it
+        return name.strip("'").strip('"')
+
+    main_inlist_star1_b1 = inlist_name(job1, 1)  # primary first binary
+    main_inlist_star2_b1 = inlist_name(job1, 2)  # secondary first binary
+    main_inlist_star1_b2 = inlist_name(job2, 1)  # primary second binary
+    main_inlist_star2_b2 = inlist_name(job2, 2)  # secondary second binary
     return (
         main_inlist_star1_b1,
         main_inlist_star2_b1,
@@ -125,86 +122,47 @@ def get_top_binary_inlist(job1: "dict", job2: "dict", MESA_DIR=""):
 
 # ------------------ check if there are nested namelists -------------------------------
 
+# read_extra_*_inlist* and extra_*_inlist*_name
+_NESTING_OPTION = re.compile(r"^(read_)?extra_\w+_inlist")
 
-def check_if_more_star_job(job: "dict", work_dir="./") -> "list":
+
+def is_nesting_option(option_name: "str") -> "bool":
+    """True for the options pointing to nested inlists, which don't matter once they are followed"""
+    return _NESTING_OPTION.match(option_name) is not None
+
+
+def check_if_more(namelist: "dict", which: "str", work_dir="./") -> "list":
     """
-    Check if there are more star_job namelists to be read and returns a
-    list of the paths to their inlists
+    Check if there are more namelists of type which (e.g., star_job) to be read
+    and returns a list of the paths to their inlists
     """
-    print(job)
     inlists_to_be_read = []
-    if job.get("read_extra_star_job_inlist1") == ".true.":
-        new_inlist = job.get("extra_star_job_inlist1_name").strip("'").strip('"')
-        inlists_to_be_read = append_inlist_path(inlists_to_be_read, new_inlist, work_dir)
-    if job.get("read_extra_star_job_inlist2") == ".true.":
-        new_inlist = job.get("extra_star_job_inlist2_name").strip("'").strip('"')
-        inlists_to_be_read = append_inlist_path(inlists_to_be_read, new_inlist, work_dir)
-    if job.get("read_extra_star_job_inlist3") == ".true.":
-        new_inlist = job.get("extra_star_job_inlist3_name").strip("'").strip('"')
-        inlists_to_be_read = append_inlist_path(inlists_to_be_read, new_inlist, work_dir)
-    if job.get("read_extra_star_job_inlist4") == ".true.":
-        new_inlist = job.get("extra_star_job_inlist4_name").strip("'").strip('"')
-        inlists_to_be_read = append_inlist_path(inlists_to_be_read, new_inlist, work_dir)
-    if job.get("read_extra_star_job_inlist5") == ".true.":
-        new_inlist = job.get("extra_star_job_inlist5_name").strip("'").strip('"')
-        inlists_to_be_read = append_inlist_path(inlists_to_be_read, new_inlist, work_dir)
+    for i in range(1, 6):
+        if namelist.get(f"read_extra_{which}_inlist{i}") == ".true.":
+            new_inlist = namelist.get(f"extra_{which}_inlist{i}_name").strip("'").strip('"')
+            inlists_to_be_read = append_inlist_path(inlists_to_be_read, new_inlist, work_dir)
     # MESA versions > 23.05.1 turned these into arrays
-    if job.get("read_extra_star_job_inlist(1)") == ".true.":
-        new_inlist = job.get("extra_star_job_inlist_name(1)").strip("'").strip('"')
-        inlists_to_be_read = append_inlist_path(inlists_to_be_read, new_inlist, work_dir)
-    if job.get("read_extra_star_job_inlist(2)") == ".true.":
-        new_inlist = job.get("extra_star_job_inlist_name(2)").strip("'").strip('"')
-        inlists_to_be_read = append_inlist_path(inlists_to_be_read, new_inlist, work_dir)
-    if job.get("read_extra_star_job_inlist(3)") == ".true.":
-        new_inlist = job.get("extra_star_job_inlist_name(3)").strip("'").strip('"')
-        inlists_to_be_read = append_inlist_path(inlists_to_be_read, new_inlist, work_dir)
-    if job.get("read_extra_star_job_inlist(4)") == ".true.":
-        new_inlist = job.get("extra_star_job_inlist_name(4)").strip("'").strip('"')
-        inlists_to_be_read = append_inlist_path(inlists_to_be_read, new_inlist, work_dir)
-    if job.get("read_extra_star_job_inlist(5)") == ".true.":
-        new_inlist = job.get("extra_star_job_inlist_name(5)").strip("'").strip('"')
-        inlists_to_be_read = append_inlist_path(inlists_to_be_read, new_inlist, work_dir)
+    for i in range(1, 6):
+        if get_option(namelist, f"read_extra_{which}_inlist({i})") == ".true.":
+            new_inlist = get_option(namelist, f"extra_{which}_inlist_name({i})").strip("'").strip('"')
+            inlists_to_be_read = append_inlist_path(inlists_to_be_read, new_inlist, work_dir)
     return inlists_to_be_read
 
 
+def check_if_more_star_job(job: "dict", work_dir="./") -> "list":
+    """
+    Check if there are more star_job namelists to be read and returns a
+    list of the paths to their inlists
+    """
+    return check_if_more(job, "star_job", work_dir=work_dir)
+
+
 def check_if_more_eos(eos: "dict", work_dir="./") -> "list":
     """
     Check if there are more eos namelists to be read and returns a
     list of the paths to their inlists
     """
-    inlists_to_be_read = []
-    if eos.get("read_extra_eos_inlist1") == ".true.":
-        new_inlist = eos.get("extra_eos_inlist1_name").strip("'").strip('"')
-        inlists_to_be_read = append_inlist_path(inlists_to_be_read, new_inlist, work_dir)
-    if eos.get("read_extra_eos_inlist2") == ".true.":
-        new_inlist = eos.get("extra_eos_inlist2_name").strip("'").strip('"')
-        inlists_to_be_read = append_inlist_path(inlists_to_be_read, new_inlist, work_dir)
-    if eos.get("read_extra_eos_inlist3") == ".true.":
-        new_inlist = eos.get("extra_eos_inlist3_name").strip("'").strip('"')
-        inlists_to_be_read = append_inlist_path(inlists_to_be_read, new_inlist, work_dir)
-    if eos.get("read_extra_eos_inlist4") == ".true.":
-        new_inlist = eos.get("extra_eos_inlist4_name").strip("'").strip('"')
-        inlists_to_be_read = append_inlist_path(inlists_to_be_read, new_inlist, work_dir)
-    if eos.get("read_extra_eos_inlist5") == ".true.":
-        new_inlist = eos.get("extra_eos_inlist5_name").strip("'").strip('"')
-        inlists_to_be_read = append_inlist_path(inlists_to_be_read, new_inlist, work_dir)
-    # MESA versions > 23.05.1 turned these into arrays
-    if eos.get("read_extra_eos_inlist(1)") == ".true.":
-        new_inlist = eos.get("extra_eos_inlist_name(1)").strip("'").strip('"')
-        inlists_to_be_read = append_inlist_path(inlists_to_be_read, new_inlist, work_dir)
-    if eos.get("read_extra_eos_inlist(2)") == ".true.":
-        new_inlist = eos.get("extra_eos_inlist_name(2)").strip("'").strip('"')
-        inlists_to_be_read = append_inlist_path(inlists_to_be_read, new_inlist, work_dir)
-    if eos.get("read_extra_eos_inlist(3)") == ".true.":
-        new_inlist = eos.get("extra_eos_inlist_name(3)").strip("'").strip('"')
-        inlists_to_be_read = append_inlist_path(inlists_to_be_read, new_inlist, work_dir)
-    if eos.get("read_extra_eos_inlist(4)") == ".true.":
-        new_inlist = eos.get("extra_eos_inlist_name(4)").strip("'").strip('"')
-        inlists_to_be_read = append_inlist_path(inlists_to_be_read, new_inlist, work_dir)
-    if eos.get("read_extra_eos_inlist(5)") == ".true.":
-        new_inlist = eos.get("extra_eos_inlist_name(5)").strip("'").strip('"')
-        inlists_to_be_read = append_inlist_path(inlists_to_be_read, new_inlist, work_dir)
-    return inlists_to_be_read
+    return check_if_more(eos, "eos", work_dir=work_dir)
 
 
 def check_if_more_kap(kap: "dict", work_dir="./") -> "list":
@@ -212,39 +170,7 @@ def check_if_more_kap(kap: "dict", work_dir="./") -> "list":
     Check if there are more kap namelists to be read and returns a
     list of the paths to their inlists
     """
-    inlists_to_be_read = []
-    if kap.get("read_extra_kap_inlist1") == ".true.":
-        new_inlist = kap.get("extra_kap_inlist1_name").strip("'").strip('"')
-        inlists_to_be_read = append_inlist_path(inlists_to_be_read, new_inlist, work_dir)
-    if kap.get("read_extra_kap_inlist2") == ".true.":
-        new_inlist = kap.get("extra_kap_inlist2_name").strip("'").strip('"')
-        inlists_to_be_read = append_inlist_path(inlists_to_be_read, new_inlist, work_dir)
-    if kap.get("read_extra_kap_inlist3") == ".true.":
-        new_inlist = kap.get("extra_kap_inlist3_name").strip("'").strip('"')
-        inlists_to_be_read = append_inlist_path(inlists_to_be_read, new_inlist, work_dir)
-    if kap.get("read_extra_kap_inlist4") == ".true.":
-        new_inlist = kap.get("extra_kap_inlist4_name").strip("'").strip('"')
-        inlists_to_be_read = append_inlist_path(inlists_to_be_read, new_inlist, work_dir)
-    if kap.get("read_extra_kap_inlist5") == ".true.":
-        new_inlist = kap.get("extra_kap_inlist5_name").strip("'").strip('"')
-        inlists_to_be_read = append_inlist_path(inlists_to_be_read, new_inlist, work_dir)
-    # MESA versions > 23.05.1 turned these into arrays
-    if kap.get("read_extra_kap_inlist(1)") == ".true.":
-        new_inlist = kap.get("extra_kap_inlist_name(1)").strip("'").strip('"')
-        inlists_to_be_read = append_inlist_path(inlists_to_be_read, new_inlist, work_dir)
-    if kap.get("read_extra_kap_inlist(2)") == ".true.":
-        new_inlist = kap.get("extra_kap_inlist_name(2)").strip("'").strip('"')
-        inlists_to_be_read = append_inlist_path(inlists_to_be_read, new_inlist, work_dir)
-    if kap.get("read_extra_kap_inlist(3)") == ".true.":
-        new_inlist = kap.get("extra_kap_inlist_name(3)").strip("'").strip('"')
-        inlists_to_be_read = append_inlist_path(inlists_to_be_read, new_inlist, work_dir)
-    if kap.get("read_extra_kap_inlist(4)") == ".true.":
-        new_inlist = kap.get("extra_kap_inlist_name(4)").strip("'").strip('"')
-        inlists_to_be_read = append_inlist_path(inlists_to_be_read, new_inlist, work_dir)
-    if kap.get("read_extra_kap_inlist(5)") == ".true.":
-        new_inlist = kap.get("extra_kap_inlist_name(5)").strip("'").strip('"')
-        inlists_to_be_read = append_inlist_path(inlists_to_be_read, new_inlist, work_dir)
-    return inlists_to_be_read
+    return check_if_more(kap, "kap", work_dir=work_dir)
 
 
 def check_if_more_binary_job(job: "dict", work_dir="./") -> "list":
@@ -252,79 +178,15 @@ def check_if_more_binary_job(job: "dict", work_dir="./") -> "list":
     Check if there are more binary_job namelists to be read and returns a
     list of the paths to their inlists
     """
-    inlists_to_be_read = []
-    if job.get("read_extra_binary_job_inlist1") == ".true.":
-        new_inlist = job.get("extra_binary_job_inlist1_name").strip("'").strip('"')
-        inlists_to_be_read = append_inlist_path(inlists_to_be_read, new_inlist, work_dir)
-    if job.get("read_extra_binary_job_inlist2") == ".true.":
-        new_inlist = job.get("extra_binary_job_inlist2_name").strip("'").strip('"')
-        inlists_to_be_read = append_inlist_path(inlists_to_be_read, new_inlist, work_dir)
-    if job.get("read_extra_binary_job_inlist3") == ".true.":
-        new_inlist = job.get("extra_binary_job_inlist3_name").strip("'").strip('"')
-        inlists_to_be_read = append_inlist_path(inlists_to_be_read, new_inlist, work_dir)
-    if job.get("read_extra_binary_job_inlist4") == ".true.":
-        new_inlist = job.get("extra_binary_job_inlist4_name").strip("'").strip('"')
-        inlists_to_be_read = append_inlist_path(inlists_to_be_read, new_inlist, work_dir)
-    if job.get("read_extra_binary_job_inlist5") == ".true.":
-        new_inlist = job.get("extra_binary_job_inlist5_name").strip("'").strip('"')
-        inlists_to_be_read = append_inlist_path(inlists_to_be_read, new_inlist, work_dir)
-    # MESA versions > 23.05.1 turned these into arrays
-    if job.get("read_extra_binary_job_inlist(1)") == ".true.":
-        new_inlist = job.get("extra_binary_job_inlist_name(1)").strip("'").strip('"')
-        inlists_to_be_read = append_inlist_path(inlists_to_be_read, new_inlist, work_dir)
-    if job.get("read_extra_binary_job_inlist(2)") == ".true.":
-        new_inlist = job.get("extra_binary_job_inlist_name(2)").strip("'").strip('"')
-        inlists_to_be_read = append_inlist_path(inlists_to_be_read, new_inlist, work_dir)
-    if job.get("read_extra_binary_job_inlist(3)") == ".true.":
-        new_inlist = job.get("extra_binary_job_inlist_name(3)").strip("'").strip('"')
-        inlists_to_be_read = append_inlist_path(inlists_to_be_read, new_inlist, work_dir)
-    if job.get("read_extra_binary_job_inlist(4)") == ".true.":
-        new_inlist = job.get("extra_binary_job_inlist_name(4)").strip("'").strip('"')
-        inlists_to_be_read = append_inlist_path(inlists_to_be_read, new_inlist, work_dir)
-    if job.get("read_extra_binary_job_inlist(5)") == ".true.":
-        new_inlist = job.get("extra_binary_job_inlist_name(5)").strip("'").strip('"')
-        inlists_to_be_read = append_inlist_path(inlists_to_be_read, new_inlist, work_dir)
-    return inlists_to_be_read
+    return check_if_more(job, "binary_job", work_dir=work_dir)
 
 
-def check_if_more_controls(controls: "dict", work_dir="./") -> "inlist":
+def check_if_more_controls(controls: "dict", work_dir="./") -> "list":
     """
     Check if there are more controls namelists to be read and returns a
     list of the paths to their inlists
     """
-    inlists_to_be_read = []
-    if controls.get("read_extra_controls_inlist1") == ".true.":
-        new_inlist = controls.get("extra_controls_inlist1_name").strip("'").strip('"')
-        inlists_to_be_read = append_inlist_path(inlists_to_be_read, new_inlist, work_dir)
-    if controls.get("read_extra_controls_inlist2") == ".true.":
-        new_inlist = controls.get("extra_controls_inlist2_name").strip("'").strip('"')
-        inlists_to_be_read = append_inlist_path(inlists_to_be_read, new_inlist, work_dir)
-    if controls.get("read_extra_controls_inlist3") == ".true.":
-        new_inlist = controls.get("extra_controls_inlist3_name").strip("'").strip('"')
-        inlists_to_be_read = append_inlist_path(inlists_to_be_read, new_inlist, work_dir)
-    if controls.get("read_extra_controls_inlist4") == ".true.":
-        new_inlist = controls.get("extra_controls_inlist4_name").strip("'").strip('"')
-        inlists_to_be_read = append_inlist_path(inlists_to_be_read, new_inlist, work_dir)
-    if controls.get("read_extra_controls_inlist5") == ".true.":
-        new_inlist = controls.get("extra_controls_inlist5_name").strip("'").strip('"')
-        inlists_to_be_read = append_inlist_path(inlists_to_be_read, new_inlist, work_dir)
-    # MESA versions > 23.05.1 turned these into arrays
-    if controls.get("read_extra_controls_inlist(1)") == ".true.":
-        new_inlist = controls.get("extra_controls_inlist_name(1)").strip("'").strip('"')
-        inlists_to_be_read = append_inlist_path(inlists_to_be_read, new_inlist, work_dir)
-    if controls.get("read_extra_controls_inlist(2)") == ".true.":
-        new_inlist = controls.get("extra_controls_inlist_name(2)").strip("'").strip('"')
-        inlists_to_be_read = append_inlist_path(inlists_to_be_read, new_inlist, work_dir)
-    if controls.get("read_extra_controls_inlist(3)") == ".true.":
-        new_inlist = controls.get("extra_controls_inlist_name(3)").strip("'").strip('"')
-        inlists_to_be_read = append_inlist_path(inlists_to_be_read, new_inlist, work_dir)
-    if controls.get("read_extra_controls_inlist(4)") == ".true.":
-        new_inlist = controls.get("extra_controls_inlist_name(4)").strip("'").strip('"')
-        inlists_to_be_read = append_inlist_path(inlists_to_be_read, new_inlist, work_dir)
-    if controls.get("read_extra_controls_inlist(5)") == ".true.":
-        new_inlist = controls.get("extra_controls_inlist_name(5)").strip("'").strip('"')
-        inlists_to_be_read = append_inlist_path(inlists_to_be_read, new_inlist, work_dir)
-    return inlists_to_be_read
+    return check_if_more(controls, "controls", work_dir=work_dir)
 
 
 def check_if_more_binary_controls(binary_controls: "dict", work_dir="./") -> "list":
@@ -332,39 +194,7 @@ def check_if_more_binary_controls(binary_controls: "dict", work_dir="./") -> "li
     Check if there are more binary_controls namelists to be read and returns a
     list of the paths to their inlists
     """
-    inlists_to_be_read = []
-    if binary_controls.get("read_extra_binary_controls_inlist1") == ".true.":
-        new_inlist = binary_controls.get("extra_binary_controls_inlist1_name").strip("'").strip('"')
-        inlists_to_be_read = append_inlist_path(inlists_to_be_read, new_inlist, work_dir)
-    if binary_controls.get("read_extra_binary_controls_inlist2") == ".true.":
-        new_inlist = binary_controls.get("extra_binary_controls_inlist2_name").strip("'").strip('"')
-        inlists_to_be_read = append_inlist_path(inlists_to_be_read, new_inlist, work_dir)
-    if binary_controls.get("read_extra_binary_controls_inlist3") == ".true.":
-        new_inlist = binary_controls.get("extra_binary_controls_inlist3_name").strip("'").strip('"')
-        inlists_to_be_read = append_inlist_path(inlists_to_be_read, new_inlist, work_dir)
-    if binary_controls.get("read_extra_binary_controls_inlist4") == ".true.":
-        new_inlist = binary_controls.get("extra_binary_controls_inlist4_name").strip("'").strip('"')
-        inlists_to_be_read = append_inlist_path(inlists_to_be_read, new_inlist, work_dir)
-    if binary_controls.get("read_extra_binary_controls_inlist5") == ".true.":
-        new_inlist = binary_controls.get("extra_binary_controls_inlist5_name").strip("'").strip('"')
-        inlists_to_be_read = append_inlist_path(inlists_to_be_read, new_inlist, work_dir)
-    # MESA versions > 23.05.1 turned these into arrays
-    if binary_controls.get("read_extra_binary_controls_inlist(1)") == ".true.":
-        new_inlist = binary_controls.get("extra_binary_controls_inlist_name(1)").strip("'").strip('"')
-        inlists_to_be_read = append_inlist_path(inlists_to_be_read, new_inlist, work_dir)
-    if binary_controls.get("read_extra_binary_controls_inlist(2)") == ".true.":
-        new_inlist = binary_controls.get("extra_binary_controls_inlist_name(2)").strip("'").strip('"')
-        inlists_to_be_read = append_inlist_path(inlists_to_be_read, new_inlist, work_dir)
-    if binary_controls.get("read_extra_binary_controls_inlist(3)") == ".true.":
-        new_inlist = binary_controls.get("extra_binary_controls_inlist_name(3)").strip("'").strip('"')
-        inlists_to_be_read = append_inlist_path(inlists_to_be_read, new_inlist, work_dir)
-    if binary_controls.get("read_extra_binary_controls_inlist(4)") == ".true.":
-        new_inlist = binary_controls.get("extra_binary_controls_inlist_name(4)").strip("'").strip('"')
-        inlists_to_be_read = append_inlist_path(inlists_to_be_read, new_inlist, work_dir)
-    if binary_controls.get("read_extra_binary_controls_inlist(5)") == ".true.":
-        new_inlist = binary_controls.get("extra_binary_controls_inlist_name(5)").strip("'").strip('"')
-        inlists_to_be_read = append_inlist_path(inlists_to_be_read, new_inlist, work_dir)
-    return inlists_to_be_read
+    return check_if_more(binary_controls, "binary_controls", work_dir=work_dir)
 
 
 def check_if_more_pgstar(pgstar: "dict", work_dir="./") -> "list":
@@ -372,39 +202,7 @@ def check_if_more_pgstar(pgstar: "dict", work_dir="./") -> "list":
     Check if there are more pgstar namelists to be read and returns a
     list of the paths to their inlists
     """
-    inlists_to_be_read = []
-    if pgstar.get("read_extra_pgstar_inlist1") == ".true.":
-        new_inlist = pgstar.get("extra_pgstar_inlist1_name").strip("'").strip('"')
-        inlists_to_be_read = append_inlist_path(inlists_to_be_read, new_inlist, work_dir)
-    if pgstar.get("read_extra_pgstar_inlist2") == ".true.":
-        new_inlist = pgstar.get("extra_pgstar_inlist2_name").strip("'").strip('"')
-        inlists_to_be_read = append_inlist_path(inlists_to_be_read, new_inlist, work_dir)
-    if pgstar.get("read_extra_pgstar_inlist3") == ".true.":
-        new_inlist = pgstar.get("extra_pgstar_inlist3_name").strip("'").strip('"')
-        inlists_to_be_read = append_inlist_path(inlists_to_be_read, new_inlist, work_dir)
-    if pgstar.get("read_extra_pgstar_inlist4") == ".true.":
-        new_inlist = pgstar.get("extra_pgstar_inlist4_name").strip("'").strip('"')
-        inlists_to_be_read = append_inlist_path(inlists_to_be_read, new_inlist, work_dir)
-    if pgstar.get("read_extra_pgstar_inlist5") == ".true.":
-        new_inlist = pgstar.get("extra_pgstar_inlist5_name").strip("'").strip('"')
-        inlists_to_be_read = append_inlist_path(inlists_to_be_read, new_inlist, work_dir)
-    # MESA versions > 23.05.1 turned these into arrays
-    if pgstar.get("read_extra_pgstar_inlist(1)") == ".true.":
-        new_inlist = pgstar.get("extra_pgstar_inlist_name(1)").strip("'").strip('"')
-        inlists_to_be_read = append_inlist_path(inlists_to_be_read, new_inlist, work_dir)
-    if pgstar.get("read_extra_pgstar_inlist(2)") == ".true.":
-        new_inlist = pgstar.get("extra_pgstar_inlist_name(2)").strip("'").strip('"')
-        inlists_to_be_read = append_inlist_path(inlists_to_be_read, new_inlist, work_dir)
-    if pgstar.get("read_extra_pgstar_inlist(3)") == ".true.":
-        new_inlist = pgstar.get("extra_pgstar_inlist_name(3)").strip("'").strip('"')
-        inlists_to_be_read = append_inlist_path(inlists_to_be_read, new_inlist, work_dir)
-    if pgstar.get("read_extra_pgstar_inlist(4)") == ".true.":
-        new_inlist = pgstar.get("extra_pgstar_inlist_name(4)").strip("'").strip('"')
-        inlists_to_be_read = append_inlist_path(inlists_to_be_read, new_inlist, work_dir)
-    if pgstar.get("read_extra_pgstar_inlist(5)") == ".true.":
-        new_inlist = pgstar.get("extra_pgstar_inlist_name(5)").strip("'").strip('"')
-        inlists_to_be_read = append_inlist_path(inlists_to_be_read, new_inlist, work_dir)
-    return inlists_to_be_read
+    return check_if_more(pgstar, "pgstar", work_dir=work_dir)
 
 
 def check_if_more_binary_pgstar(binary_pgstar: "dict", work_dir="./") -> "list":
@@ -412,309 +210,393 @@ def check_if_more_binary_pgstar(binary_pgstar: "dict", work_dir="./") -> "list":
     Check if there are more binary_pgstar namelists to be read and returns a
     list of the paths to their inlists
     """
-    inlists_to_be_read = []
-    if binary_pgstar.get("read_extra_binary_pgstar_inlist1") == ".true.":
-        new_inlist = binary_pgstar.get("extra_binary_pgstar_inlist1_name").strip("'").strip('"')
-        inlists_to_be_read = append_inlist_path(inlists_to_be_read, new_inlist, work_dir)
-    if binary_pgstar.get("read_extra_binary_pgstar_inlist2") == ".true.":
-        new_inlist = binary_pgstar.get("extra_binary_pgstar_inlist2_name").strip("'").strip('"')
-        inlists_to_be_read = append_inlist_path(inlists_to_be_read, new_inlist, work_dir)
-    if binary_pgstar.get("read_extra_binary_pgstar_inlist3") == ".true.":
-        new_inlist = binary_pgstar.get("extra_binary_pgstar_inlist3_name").strip("'").strip('"')
-        inlists_to_be_read = append_inlist_path(inlists_to_be_read, new_inlist, work_dir)
-    if binary_pgstar.get("read_extra_binary_pgstar_inlist4") == ".true.":
-        new_inlist = binary_pgstar.get("extra_binary_pgstar_inlist4_name").strip("'").strip('"')
-        inlists_to_be_read = append_inlist_path(inlists_to_be_read, new_inlist, work_dir)
-    if binary_pgstar.get("read_extra_binary_pgstar_inlist5") == ".true.":
-        new_inlist = binary_pgstar.get("extra_binary_pgstar_inlist5_name").strip("'").strip('"')
-        inlists_to_be_read = append_inlist_path(inlists_to_be_read, new_inlist, work_dir)
-    # MESA versions > 23.05.1 turned these into arrays
-    if binary_pgstar.get("read_extra_binary_pgstar_inlist(1)") == ".true.":
-        new_inlist = binary_pgstar.get("extra_binary_pgstar_inlist_name(1)").strip("'").strip('"')
-        inlists_to_be_read = append_inlist_path(inlists_to_be_read, new_inlist, work_dir)
-    if binary_pgstar.get("read_extra_binary_pgstar_inlist(2)") == ".true.":
-        new_inlist = binary_pgstar.get("extra_binary_pgstar_inlist_name(2)").strip("'").strip('"')
-        inlists_to_be_read = append_inlist_path(inlists_to_be_read, new_inlist, work_dir)
-    if binary_pgstar.get("read_extra_binary_pgstar_inlist(3)") == ".true.":
-        new_inlist = binary_pgstar.get("extra_binary_pgstar_inlist_name(3)").strip("'").strip('"')
-        inlists_to_be_read = append_inlist_path(inlists_to_be_read, new_inlist, work_dir)
-    if binary_pgstar.get("read_extra_binary_pgstar_inlist(4)") == ".true.":
-        new_inlist = binary_pgstar.get("extra_binary_pgstar_inlist_name(4)").strip("'").strip('"')
-        inlists_to_be_read = append_inlist_path(inlists_to_be_read, new_inlist, work_dir)
-    if binary_pgstar.get("read_extra_binary_pgstar_inlist(5)") == ".true.":
-        new_inlist = binary_pgstar.get("extra_binary_pgstar_inlist_name(5)").strip("'").strip('"')
-        inlists_to_be_read = append_inlist_path(inlists_to_be_read, new_inlist, work_dir)
-    return inlists_to_be_read
+    return check_if_more(binary_pgstar, "binary_pgstar", work_dir=work_dir)
+
+
+# ----------------- read nested inlists concurrently ------------------------------
+
+# nested inlists are read ahead in a pool of threads as soon as their parent
+# is read, which helps on file systems with high latency for each open().
+# The results are still merged in the order MESA reads them.
+_io_threads = 8
+_executor = None
+# the pool is created by the first thread needing it (e.g. with several Comparator threads)
+_executor_lock = threading.Lock()
+
+
+def set_io_threads(n: "int"):
+    """maximum number of inlists read at the same time (1 or less to read them one at a time)"""
+    global _io_threads, _executor
+    with _executor_lock:
+        executor, _executor = _executor, None
+        _io_threads = n
+    if executor is not None:
+        executor.shutdown(wait=True)
+
+
+def _forget_executor():
+    """the threads of the pool do not survive a fork"""
+    global _executor, _executor_lock
+    _executor = None
+    # it may have been held by another thread of the parent
+    _executor_lock = threading.Lock()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_forget_executor)
+
+
+def prefetch_inlists(inlists: "list", reader, futures: "dict"):
+    """starts reading the inlists not already in futures with reader, adding them to futures"""
+    global _executor
+    if _io_threads <= 1:
+        return
+    executor = _executor
+    if executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = concurrent.futures.ThreadPoolExecutor(max_workers=_io_threads)
+            executor = _executor
+    for inlist in inlists:
+        if inlist not in futures:
+            futures[inlist] = executor.submit(reader, inlist)
+
+
+def build_top(
+    work_dir: "str",
+    first_inlist: "str",
+    reader,
+    check_if_more_nested,
+    which: "str",
+    vb=True,
+    sources=None,
+    chain=None,
+) -> "dict":
+    """
+    Builds the namelist which (e.g., star_job) starting from first_inlist (reading it with reader)
+    and following the nested inlists found with check_if_more_nested, printing which inlists are read if vb.
+    If a dictionary sources is given, it is filled with the inlist setting each option (as in iter_options).
+    If a list chain is given, (inlist, namelist read in it) are appended to it in the order they are merged.
+    Note: if the same read_extra_* is used in multiple inlists, only the last one
+    works because settings overwrite. That's also how MESA works.
+    """
+    if first_inlist == "":
+        first_inlist = get_first_inlist(work_dir)
+    namelist = reader(first_inlist)
+    if sources is not None:
+        sources.update((k, first_inlist) for k, v in iter_options(namelist))
+    if chain is not None:
+        chain.append((first_inlist, namelist))
+    inlists_to_be_read = check_if_more_nested(namelist, work_dir=work_dir)
+    futures = {}
+    prefetch_inlists(inlists_to_be_read, reader, futures)
+    while inlists_to_be_read:
+        current_inlist = inlists_to_be_read.pop(0)
+        if vb:
+            print("...reading " + current_inlist + " " + which + " namelist")
+        if current_inlist in futures:
+            namelist_to_add = futures.pop(current_inlist).result()
+        else:
+            namelist_to_add = reader(current_inlist)
+        inlists_to_add = check_if_more_nested(namelist_to_add, work_dir=work_dir)
+        prefetch_inlists(inlists_to_add, reader, futures)
+        # merge dictionaries with over-write
+        namelist = merge_namelists(namelist, namelist_to_add)
+        if sources is not None:
+            sources.update((k, current_inlist) for k, v in iter_options(namelist_to_add))
+        if chain is not None:
+            chain.append((current_inlist, namelist_to_add))
+        ## add possible new inlists
+        inlists_to_be_read = inlists_to_be_read + inlists_to_add
+    return namelist
 
 
 # ----------------- build the dictionary that MESA will use ------------------------------
 
 
-def build_top_star_job(work_dir: "str", first_inlist="") -> "dict":
+def _read_job(inlist: "str") -> "dict":
+    return get_job_namelist(inlist)[0]
+
+
+def _read_eos(inlist: "str") -> "dict":
+    return get_eos_namelist(inlist)
+
+
+def _read_kap(inlist: "str") -> "dict":
+    return get_kap_namelist(inlist)
+
+
+def _read_controls(inlist: "str") -> "dict":
+    return get_controls_namelist(inlist)[0]
+
+
+def _read_pgstar(inlist: "str") -> "dict":
+    return get_pgstar_namelist(inlist)
+
+
+@profiled
+def build_top_star_job(work_dir: "str", first_inlist="", vb=True, sources=None, chain=None) -> "dict":
     """
     Builds the star_job namelist by reading the inlists starting from inlist, unless an
     optional different starting inlist is passed.
     """
-    if first_inlist == "":
-        first_inlist = get_first_inlist(work_dir)
-    job = get_job_namelist(first_inlist)[0]
-    inlists_to_be_read = check_if_more_star_job(job, work_dir=work_dir)
-    while inlists_to_be_read:
-        current_inlist = inlists_to_be_read[0]
-        print("...reading " + current_inlist + " star_job namelist")
-        job_to_add = get_job_namelist(current_inlist)[0]
-        inlists_to_add = check_if_more_star_job(job_to_add, work_dir=work_dir)
-        # merge dictionaries with over-write
-        job = {**job, **job_to_add}
-        ## note: if the same read_extra_star_job is used in multiple
-        ## inlists, only the last one works because settings
-        ## overwrites. That's also how MESA works
-        # print(job)
-        ## remove inlist we are doing now from list
-        inlists_to_be_read.remove(current_inlist)
-        ## add possible new inlists
-        if inlists_to_add:
-            try:
-                inlists_to_be_read = inlists_to_be_read + inlists_to_add
-            except TypeError:
-                # could be that inlists_to_be_read is empty
-                # but we still want to add stuff
-                inlists_to_be_read = inlists_to_add
-    return job
+    return build_top(
+        work_dir, first_inlist, _read_job, check_if_more_star_job, "star_job", vb=vb, sources=sources, chain=chain
+    )
 
 
-def build_top_binary_job(work_dir: "str", first_inlist="") -> "dict":
+@profiled
+def build_top_binary_job(work_dir: "str", first_inlist="", vb=True, sources=None, chain=None) -> "dict":
     """
-    Builds the namelist binary_job by reading the inlists starting from inlist, unless an
+    Builds the binary_job namelist by reading the inlists starting from inlist, unless an
     optional different starting inlist is passed.
     """
-    if first_inlist == "":
-        first_inlist = get_first_inlist(work_dir)
-    job = get_job_namelist(first_inlist)[0]
-    inlists_to_be_read = check_if_more_binary_job(job, work_dir=work_dir)
-    # print(inlists_to_be_read)
-    while inlists_to_be_read:
-        current_inlist = inlists_to_be_read[0]
-        print("...reading " + current_inlist + " binary_job namelist")
-        job_to_add = get_job_namelist(current_inlist)[0]
-        inlists_to_add = check_if_more_binary_job(job_to_add, work_dir=work_dir)
-        job = {**job, **job_to_add}
-        ## note: if the same read_extra_binary_job is used in multiple
-        ## inlists, only the last one works because settings
-        ## overwrites. That's also how MESA works
-        # print(job)
-        ## remove inlist we are doing now from list
-        inlists_to_be_read.remove(current_inlist)
-        ## add possible new inlists
-        if inlists_to_add:
-            try:
-                inlists_to_be_read = inlists_to_be_read + inlists_to_add
-            except TypeError:
-                # could be that inlists_to_be_read is empty
-                # but we still want to add stuff
-                inlists_to_be_read = inlists_to_add
-    return job
+    return build_top(
+        work_dir, first_inlist, _read_job, check_if_more_binary_job, "binary_job", vb=vb, sources=sources, chain=chain
+    )
 
 
-def build_top_eos(work_dir: "str", first_inlist="") -> "dict":
+@profiled
+def build_top_eos(work_dir: "str", first_inlist="", vb=True, sources=None, chain=None) -> "dict":
     """
     Builds the eos namelist by reading the inlists starting from inlist, unless an
     optional different starting inlist is passed.
     """
-    if first_inlist == "":
-        first_inlist = get_first_inlist(work_dir)
-    eos = get_eos_namelist(first_inlist)
-    inlists_to_be_read = check_if_more_eos(eos, work_dir=work_dir)
-    # print(inlists_to_be_read)
-    while inlists_to_be_read:
-        current_inlist = inlists_to_be_read[0]
-        print("...reading " + current_inlist + " eos namelist")
-        eos_to_add = get_eos_namelist(current_inlist)
-        inlists_to_add = check_if_more_eos(eos_to_add, work_dir=work_dir)
-        eos = {**eos, **eos_to_add}
-        ## note: if the same read_extra_eos is used in multiple
-        ## inlists, only the last one works because settings
-        ## overwrites. That's also how MESA worksg
-        # print(eos)
-        ## remove inlist we are doing now from list
-        inlists_to_be_read.remove(current_inlist)
-        ## add possible new inlists
-        if inlists_to_add:
-            try:
-                inlists_to_be_read = inlists_to_be_read + inlists_to_add
-            except TypeError:
-                # could be that inlists_to_be_read is empty
-                inlists_to_be_read = inlists_to_add
-    return eos
+    return build_top(work_dir, first_inlist, _read_eos, check_if_more_eos, "eos", vb=vb, sources=sources, chain=chain)
 
 
-def build_top_kap(work_dir: "str", first_inlist="") -> "dict":
+@profiled
+def build_top_kap(work_dir: "str", first_inlist="", vb=True, sources=None, chain=None) -> "dict":
     """
     Builds the kap namelist by reading the inlists starting from inlist, unless an
     optional different starting inlist is passed.
     """
-    if first_inlist == "":
-        first_inlist = get_first_inlist(work_dir)
-    kap = get_kap_namelist(first_inlist)
-    inlists_to_be_read = check_if_more_kap(kap, work_dir=work_dir)
-    # print(inlists_to_be_read)
-    while inlists_to_be_read:
-        current_inlist = inlists_to_be_read[0]
-        print("...reading " + current_inlist + " kap namelist")
-        kap_to_add = get_kap_namelist(current_inlist)
-        inlists_to_add = check_if_more_kap(kap_to_add, work_dir=work_dir)
-        kap = {**kap, **kap_to_add}
-        ## note: if the same read_extra_kap is used in multiple
-        ## inlists, only the last one works because settings
-        ## overwrites. That's also how MESA works
-        # print(kap)
-        ## remove inlist we are doing now from list
-        inlists_to_be_read.remove(current_inlist)
-        ## add possible new inlists
-        if not inlists_to_add:
-            try:
-                inlists_to_be_read = inlists_to_be_read + inlists_to_add
-            except TypeError:
-                # could be that inlists_to_be_read is empty
-                inlists_to_be_read = inlists_to_add
-    return kap
+    return build_top(work_dir, first_inlist, _read_kap, check_if_more_kap, "kap", vb=vb, sources=sources, chain=chain)
 
 
-def build_top_controls(work_dir: "str", first_inlist=""):
+@profiled
+def build_top_controls(work_dir: "str", first_inlist="", vb=True, sources=None, chain=None) -> "dict":
     """
     Builds the controls namelist by reading the inlists starting from inlist, unless an
     optional different starting inlist is passed.
     """
-    if first_inlist == "":
-        first_inlist = get_first_inlist(work_dir)
-    controls = get_controls_namelist(first_inlist)[0]
-    inlists_to_be_read = check_if_more_controls(controls, work_dir=work_dir)
-    # print(inlists_to_be_read)
-    while inlists_to_be_read:
-        current_inlist = inlists_to_be_read[0]
-        print("...reading " + current_inlist + " controls namelist")
-        controls_to_add = get_controls_namelist(current_inlist)[0]
-        controls = {**controls, **controls_to_add}
-        ## note: if the same read_extra_star_controls is used in multiple
-        ## inlists, only the last one works because settings
-        ## overwrites. That's also how MESA works
-        # print(controls)
-        ## remove inlist we are doing now from list
-        inlists_to_be_read.remove(current_inlist)
-        inlists_to_add = check_if_more_controls(controls_to_add, work_dir=work_dir)
-        ## add possible new inlists
-        if inlists_to_add:
-            try:
-                inlists_to_be_read = inlists_to_be_read + inlists_to_add
-            except TypeError:
-                # could be that inlists_to_be_read is empty
-                inlists_to_be_read = inlists_to_add
-    return controls
+    return build_top(
+        work_dir, first_inlist, _read_controls, check_if_more_controls, "controls", vb=vb, sources=sources, chain=chain
+    )
 
 
-def build_top_binary_controls(work_dir: "str", first_inlist=""):
+@profiled
+def build_top_binary_controls(work_dir: "str", first_inlist="", vb=True, sources=None, chain=None) -> "dict":
     """
     Builds the binary_controls namelist by reading the inlists starting from inlist, unless an
     optional different starting inlist is passed.
     """
-    if first_inlist == "":
-        first_inlist = get_first_inlist(work_dir)
-    binary_controls = get_controls_namelist(first_inlist)[0]
-    inlists_to_be_read = check_if_more_binary_controls(binary_controls, work_dir=work_dir)
-    # print(inlists_to_be_read)
-    while inlists_to_be_read:
-        current_inlist = inlists_to_be_read[0]
-        print("...reading " + current_inlist + " binary_controls namelist")
-        binary_controls_to_add = get_controls_namelist(current_inlist)[0]
-        inlists_to_add = check_if_more_binary_controls(binary_controls_to_add, work_dir=work_dir)
-        binary_controls = {**binary_controls, **binary_controls_to_add}
-        ## note: if the same read_extra_star_binary_controls is used in multiple
-        ## inlists, only the last one works because settings
-        ## overwrites. That's also how MESA works
-        # print(binary_controls)
-        ## remove inlist we are doing now from list
-        inlists_to_be_read.remove(current_inlist)
-        ## add possible new inlists
-        if inlists_to_add != None:
-            try:
-                inlists_to_be_read = inlists_to_be_read + inlists_to_add
-            except TypeError:
-                # could be that inlists_to_be_read is empty
-                inlists_to_be_read = inlists_to_add
-    return binary_controls
+    return build_top(
+        work_dir,
+        first_inlist,
+        _read_controls,
+        check_if_more_binary_controls,
+        "binary_controls",
+        vb=vb,
+        sources=sources,
+        chain=chain,
+    )
 
 
-def build_top_pgstar(work_dir: "str", first_inlist=""):
+@profiled
+def build_top_pgstar(work_dir: "str", first_inlist="", vb=True, sources=None, chain=None) -> "dict":
     """
     Builds the pgstar namelist by reading the inlists starting from inlist, unless an
     optional different starting inlist is passed.
     """
-    if first_inlist == "":
-        first_inlist = get_first_inlist(work_dir)
-    pgstar = get_pgstar_namelist(first_inlist)
-    inlists_to_be_read = check_if_more_pgstar(pgstar, work_dir=work_dir)
-    # print(inlists_to_be_read)
-    while inlists_to_be_read:
-        current_inlist = inlists_to_be_read[0]
-        print("...reading " + current_inlist + " pgstar namelist")
-        pgstar_to_add = get_pgstar_namelist(current_inlist)
-        inlists_to_add = check_if_more_pgstar(pgstar_to_add, work_dir=work_dir)
-        pgstar = {**pgstar, **pgstar_to_add}
-        ## note: if the same read_extra_star_pgstar is used in multiple
-        ## inlists, only the last one works because settings
-        ## overwrites. That's also how MESA works
-        # print(pgstar)
-        ## remove inlist we are doing now from list
-        inlists_to_be_read.remove(current_inlist)
-        ## add possible new inlists
-        if inlists_to_add != None:
-            try:
-                inlists_to_be_read = inlists_to_be_read + inlists_to_add
-            except TypeError:
-                # could be that inlists_to_be_read is empty
-                inlists_to_be_read = inlists_to_add
-    return pgstar
+    return build_top(
+        work_dir, first_inlist, _read_pgstar, check_if_more_pgstar, "pgstar", vb=vb, sources=sources, chain=chain
+    )
 
 
-def build_top_binary_pgstar(work_dir: "str", first_inlist=""):
+@profiled
+def build_top_binary_pgstar(work_dir: "str", first_inlist="", vb=True, sources=None, chain=None) -> "dict":
     """
     Builds the binary_pgstar namelist by reading the inlists starting from inlist, unless an
     optional different starting inlist is passed.
     """
-    if first_inlist == "":
-        first_inlist = get_first_inlist(work_dir)
-    binary_pgstar = get_pgstar_namelist(first_inlist)
-    inlists_to_be_read = check_if_more_binary_pgstar(binary_pgstar, work_dir=work_dir)
-    # print(inlists_to_be_read)
-    while inlists_to_be_read:
-        current_inlist = inlists_to_be_read[0]
-        print("...reading " + current_inlist + " binary_pgstar namelist")
-        binary_pgstar_to_add = get_pgstar_namelist(current_inlist)
-        inlists_to_add = check_if_more_binary_pgstar(binary_pgstar_to_add, work_dir=work_dir)
-        binary_pgstar = {**binary_pgstar, **binary_pgstar_to_add}
-        ## note: if the same read_extra_star_binary_pgstar is used in multiple
-        ## inlists, only the last one works because settings
-        ## overwrites. That's also how MESA works
-        # print(binary_pgstar)
-        ## remove inlist we are doing now from list
-        inlists_to_be_read.remove(current_inlist)
-        ## add possible new inlists
-        if inlists_to_add:
-            try:
-                inlists_to_be_read = inlists_to_be_read + inlists_to_add
-            except TypeError:
-                # could be that inlists_to_be_read is empty
-                inlists_to_be_read = inlists_to_add
-    return binary_pgstar
+    return build_top(
+        work_dir,
+        first_inlist,
+        _read_pgstar,
+        check_if_more_binary_pgstar,
+        "binary_pgstar",
+        vb=vb,
+        sources=sources,
+        chain=chain,
+    )
+
+
+def defaults_name(section: "str") -> "str":
+    """name of the defaults to use for a section returned by resolve_work_dir"""
+    namelist = section.split("/")[-1]
+    if namelist == "binary_pgstar":
+        # as in compare_binary_work_dirs
+        return "pgstar"
+    return namelist
+
+
+def iter_work_dir(work_dir: "str", do_pgstar=True, MESA_DIR="", vb=False, sources=None, chain=None):
+    """
+    yields (key, namelist) for each namelist MESA reads in work_dir (see resolve_work_dir),
+    building each namelist only when it's needed
+    """
+
+    def build(section, build_top_namelist, **kwargs):
+        section_sources = None if sources is None else sources.setdefault(section, {})
+        return section, build_top_namelist(work_dir, vb=vb, sources=section_sources, chain=chain, **kwargs)
+
+    if is_folder_binary(work_dir):
+        section, job = build("binary_job", build_top_binary_job)
+        yield section, job
+        yield build("binary_controls", build_top_binary_controls)
+        if do_pgstar:
+            yield build("binary_pgstar", build_top_binary_pgstar)
+        inlist_star1, inlist_star2 = get_top_binary_inlist(job, job, MESA_DIR=MESA_DIR)[:2]
+        stars = [("star1/", work_dir + "/" + inlist_star1), ("star2/", work_dir + "/" + inlist_star2)]
+    else:
+        stars = [("", get_first_inlist(work_dir))]
+    for prefix, first_inlist in stars:
+        yield build(prefix + "star_job", build_top_star_job, first_inlist=first_inlist)
+        yield build(prefix + "eos", build_top_eos, first_inlist=first_inlist)
+        yield build(prefix + "kap", build_top_kap, first_inlist=first_inlist)
+        yield build(prefix + "controls", build_top_controls, first_inlist=first_inlist)
+        if do_pgstar:
+            yield build(prefix + "pgstar", build_top_pgstar, first_inlist=first_inlist)
+
+
+def resolve_work_dir(work_dir: "str", do_pgstar=True, MESA_DIR="", vb=False, sources=None, chain=None) -> "dict":
+    """
+    returns a dictionary with all the namelists MESA reads in work_dir, after following the nested inlists.
+    The keys are star_job, eos, kap, controls, pgstar for a single star, and binary_job,
+    binary_controls, binary_pgstar, star1/star_job, ..., star2/pgstar for binaries.
+    Use defaults_name to get the defaults corresponding to each key.
+    If a dictionary sources is given, it is filled with the same keys and {option: inlist setting it} as values.
+    If a list chain is given, the (inlist, namelist read in it) of all the namelists are appended to it.
+    """
+    return dict(iter_work_dir(work_dir, do_pgstar=do_pgstar, MESA_DIR=MESA_DIR, vb=vb, sources=sources, chain=chain))
+
+
+def read_inlist_namelists(inlist: "str", do_pgstar=True) -> "dict":
+    """
+    returns the namelists of a single inlist, without following nested inlists,
+    with the same keys as resolve_work_dir (only the top level ones for binaries)
+    """
+    job, is_binary = get_job_namelist(inlist)
+    namelists = {
+        "binary_job" if is_binary else "star_job": job,
+        "eos": get_eos_namelist(inlist),
+        "kap": get_kap_namelist(inlist),
+        "binary_controls" if is_binary else "controls": get_controls_namelist(inlist)[0],
+    }
+    if do_pgstar:
+        namelists["binary_pgstar" if is_binary else "pgstar"] = get_pgstar_namelist(inlist)
+    return namelists
+
+
+def resolve_path(path: "str", do_pgstar=True, MESA_DIR="", chain=None) -> "dict":
+    """namelists of a work directory (see resolve_work_dir) or of a single inlist"""
+    if is_dir(path):
+        return resolve_work_dir(path, do_pgstar=do_pgstar, MESA_DIR=MESA_DIR, chain=chain)
+    namelists = read_inlist_namelists(path, do_pgstar=do_pgstar)
+    if chain is not None:
+        chain.extend((path, namelist) for namelist in namelists.values())
+    return namelists
+
+
+# ----------------------------- quick equality check ----------------------------------
+
+
+def paths_equal(path1: "str", path2: "str", do_pgstar=False, MESA_DIR="", MESA_DIR2="") -> "bool":
+    """
+    True if MESA reads the same options in the two inlists or work directories path1 and path2, without
+    printing anything. Stops at the first namelist that differs, and identical inlists are not even parsed.
+    """
+    if MESA_DIR == "":
+        MESA_DIR = get_MESA_DIR()
+    if is_file(path1) and is_file(path2):
+        if (MESA_DIR2 == "") and (read_bytes(path1) == read_bytes(path2)):
+            return True
+        sections1 = iter(read_inlist_namelists(path1, do_pgstar=do_pgstar).items())
+        sections2 = iter(read_inlist_namelists(path2, do_pgstar=do_pgstar).items())
+    elif is_dir(path1) and is_dir(path2):
+        sections1 = iter_work_dir(path1, do_pgstar=do_pgstar, MESA_DIR=MESA_DIR)
+        sections2 = iter_work_dir(path2, do_pgstar=do_pgstar, MESA_DIR=MESA_DIR2 if MESA_DIR2 != "" else MESA_DIR)
+    else:
+        raise CompareWorkdirError(f"Need two inlists or two work directories: {path1} {path2}")
+    for (section1, nml1), (section2, nml2) in itertools.zip_longest(sections1, sections2, fillvalue=("", None)):
+        if section1 != section2:
+            # binary vs. single star
+            return False
+        if not equal_with_defaults(defaults_name(section1), nml1, nml2, MESA_DIR=MESA_DIR, MESA_DIR2=MESA_DIR2):
+            return False
+    return True
+
+
+def quiet_exit_status(pairs: "list", do_pgstar=False, MESA_DIR="", MESA_DIR2="") -> "int":
+    """
+    like cmp -s for the pairs of inlists or work directories: returns 0 if they are all the same,
+    1 as soon as one pair differs, and 2 if a pair can't be compared (printing why on stderr)
+    """
+    try:
+        for path1, path2 in pairs:
+            if not paths_equal(path1, path2, do_pgstar=do_pgstar, MESA_DIR=MESA_DIR, MESA_DIR2=MESA_DIR2):
+                return 1
+    except (Exception, SystemExit) as e:
+        # anything going wrong must not look like a difference
+        print(colored(f"{type(e).__name__}: {e}", "yellow"), file=sys.stderr)
+        return 2
+    return 0
 
 
 # ----------------------------- do the comparison ----------------------------------
 
 
-def compare_single_work_dirs(work1: "str", work2: "str", do_pgstar=False, MESA_DIR="", vb=False):
+def changed_options(nml1: "dict", nml2: "dict", chain1: "list", chain2: "list") -> "tuple":
+    """
+    returns nml1 and nml2 with only the options set in the inlists that differ between
+    chain1 and chain2 (see build_top), the others are the same on both sides. Falls back
+    to the whole namelists if the nested inlists are not the same number.
+    """
+    if len(chain1) != len(chain2):
+        return nml1, nml2
+    keys = set()
+    for (inlist1, added1), (inlist2, added2) in zip(chain1, chain2):
+        if file_digest(inlist1) != file_digest(inlist2):
+            keys.update(added1)
+            keys.update(added2)
+        else:
+            count("identical inlists not compared")
+    return {k: nml1[k] for k in keys if k in nml1}, {k: nml2[k] for k in keys if k in nml2}
+
+
+def build_pair(build_top_namelist, work1: "str", work2: "str", first_inlist1="", first_inlist2="", only_changes=True):
+    """
+    builds a namelist in work1 and work2 with build_top_namelist (e.g., build_top_controls).
+    If only_changes, the options set in inlists identical in both work directories (at the
+    same place in the nested inlists) are left out, since they can't differ.
+    """
+    if not only_changes:
+        return build_top_namelist(work1, first_inlist=first_inlist1), build_top_namelist(
+            work2, first_inlist=first_inlist2
+        )
+    chain1, chain2 = [], []
+    nml1 = build_top_namelist(work1, first_inlist=first_inlist1, chain=chain1)
+    nml2 = build_top_namelist(work2, first_inlist=first_inlist2, chain=chain2)
+    return changed_options(nml1, nml2, chain1, chain2)
+
+
+@profiled
+def compare_single_work_dirs(work1: "str", work2: "str", do_pgstar=False, MESA_DIR="", vb=False, MESA_DIR2=""):
     """
     compare the MESA setup for single stars in two work directories
-    allowing for multiple nested inlists
+    allowing for multiple nested inlists. If MESA_DIR2 is given, work2
+    is for the MESA version in MESA_DIR2.
     """
     if work1.split("/")[-1]:
         name1 = "1: " + work1.split("/")[-1]
@@ -724,46 +606,46 @@ def compare_single_work_dirs(work1: "str", work2: "str", do_pgstar=False, MESA_D
         name2 = "2: " + work2.split("/")[-1]
     else:
         name2 = "2: " + work2.split("/")[-2]
+    # with vb the matching options are printed too, and across versions the defaults can differ
+    only_changes = (not vb) and (MESA_DIR2 == "")
     # star_job
-    job1 = build_top_star_job(work1)
-    job2 = build_top_star_job(work2)
+    job1, job2 = build_pair(build_top_star_job, work1, work2, only_changes=only_changes)
     print("")
     print("&star_job")
-    diff_starjob(job1, job2, name1, name2, MESA_DIR, vb)
+    diff_starjob(job1, job2, name1, name2, MESA_DIR, vb, MESA_DIR2)
     print("/ !end star_job namelist")
     # eos_job
-    eos1 = build_top_eos(work1)
-    eos2 = build_top_eos(work2)
+    eos1, eos2 = build_pair(build_top_eos, work1, work2, only_changes=only_changes)
     print("")
     print("&eos")
-    diff_eos(eos1, eos2, name1, name2, MESA_DIR, vb)
+    diff_eos(eos1, eos2, name1, name2, MESA_DIR, vb, MESA_DIR2)
     print("/ !end eos namelist")
     # kap_job
-    kap1 = build_top_kap(work1)
-    kap2 = build_top_kap(work2)
+    kap1, kap2 = build_pair(build_top_kap, work1, work2, only_changes=only_changes)
     print("")
     print("&kap")
-    diff_kap(kap1, kap2, name1, name2, MESA_DIR, vb)
+    diff_kap(kap1, kap2, name1, name2, MESA_DIR, vb, MESA_DIR2)
     print("/ !end kap namelist")
     # controls
-    controls1 = build_top_controls(work1)
-    controls2 = build_top_controls(work2)
+    controls1, controls2 = build_pair(build_top_controls, work1, work2, only_changes=only_changes)
     print("")
     print("&controls")
-    diff_controls(controls1, controls2, name1, name2, MESA_DIR, vb)
+    diff_controls(controls1, controls2, name1, name2, MESA_DIR, vb, MESA_DIR2)
     print("/ !end controls namelist")
     if do_pgstar:
         pgstar1 = build_top_pgstar(work1)
         pgstar2 = build_top_pgstar(work2)
         print("")
         print("&pgstar")
-        diff_pgstar(pgstar1, pgstar2, name1, name2, MESA_DIR, vb)
+        diff_pgstar(pgstar1, pgstar2, name1, name2, MESA_DIR, vb, MESA_DIR2)
         print("/ !end pgstar")
 
 
-def compare_binary_work_dirs(work1: "str", work2: "str", do_pgstar=False, MESA_DIR="", vb=False):
+@profiled
+def compare_binary_work_dirs(work1: "str", work2: "str", do_pgstar=False, MESA_DIR="", vb=False, MESA_DIR2=""):
     """
-    compares the MESA setup for two binary runs
+    compares the MESA setup for two binary runs. If MESA_DIR2 is given, work2
+    is for the MESA version in MESA_DIR2.
     """
     if work1.split("/")[-1]:
         name1 = "1: " + work1.split("/")[-1]
@@ -773,27 +655,28 @@ def compare_binary_work_dirs(work1: "str", work2: "str", do_pgstar=False, MESA_D
         name2 = "2: " + work2.split("/")[-1]
     else:
         name2 = "2: " + work2.split("/")[-2]
+    # with vb the matching options are printed too, and across versions the defaults can differ
+    only_changes = (not vb) and (MESA_DIR2 == "")
     job1 = build_top_binary_job(work1)
     job2 = build_top_binary_job(work2)
     ## To compare namelist of each star in both folders later
     inlist1_b1, inlist2_b1, inlist1_b2, inlist2_b2 = get_top_binary_inlist(job1, job2, MESA_DIR=MESA_DIR)
     print("")
     print("&binary_job")
-    diff_binary_job(job1, job2, name1, name2, MESA_DIR, vb)
+    diff_binary_job(job1, job2, name1, name2, MESA_DIR, vb, MESA_DIR2)
     print("/ !end binary_job namelist")
     # binary_controls
-    binary_controls1 = build_top_binary_controls(work1)
-    binary_controls2 = build_top_binary_controls(work2)
+    binary_controls1, binary_controls2 = build_pair(build_top_binary_controls, work1, work2, only_changes=only_changes)
     print("")
     print("&binary_controls")
-    diff_binary_controls(binary_controls1, binary_controls2, name1, name2, MESA_DIR, vb)
+    diff_binary_controls(binary_controls1, binary_controls2, name1, name2, MESA_DIR, vb, MESA_DIR2)
     print("/ !end binary_controls namelist")
     if do_pgstar:
         binary_pgstar1 = build_top_binary_pgstar(work1)
         binary_pgstar2 = build_top_binary_pgstar(work2)
         print("")
         print("&binary_pgstar")
-        diff_pgstar(binary_pgstar1, binary_pgstar2, name1, name2, MESA_DIR, vb)
+        diff_pgstar(binary_pgstar1, binary_pgstar2, name1, name2, MESA_DIR, vb, MESA_DIR2)
         print("/ !end binary_pgstar")
     print("")
     print("------------------------------------")
@@ -804,92 +687,96 @@ def compare_binary_work_dirs(work1: "str", work2: "str", do_pgstar=False, MESA_D
     print("* Compare primary stars *")
     print("*************************")
     print("")
-    star_job1 = build_top_star_job(work1, first_inlist=work1 + "/" + inlist1_b1)
-    star_job2 = build_top_star_job(work2, first_inlist=work2 + "/" + inlist1_b2)
+    star_job1, star_job2 = build_pair(
+        build_top_star_job, work1, work2, work1 + "/" + inlist1_b1, work2 + "/" + inlist1_b2, only_changes=only_changes
+    )
     print("")
     print("&star_job")
-    diff_starjob(star_job1, star_job2, name1, name2, MESA_DIR, vb)
+    diff_starjob(star_job1, star_job2, name1, name2, MESA_DIR, vb, MESA_DIR2)
     print("/ !end star_job namelist")
     # eos_job
-    eos1 = build_top_eos(work1)
-    eos2 = build_top_eos(work2)
+    eos1, eos2 = build_pair(build_top_eos, work1, work2, only_changes=only_changes)
     print("")
     print("&eos")
-    diff_eos(eos1, eos2, name1, name2, MESA_DIR, vb)
+    diff_eos(eos1, eos2, name1, name2, MESA_DIR, vb, MESA_DIR2)
     print("/ !end eos namelist")
     # kap_job
-    kap1 = build_top_kap(work1)
-    kap2 = build_top_kap(work2)
+    kap1, kap2 = build_pair(build_top_kap, work1, work2, only_changes=only_changes)
     print("")
     print("&kap")
-    diff_kap(kap1, kap2, name1, name2, MESA_DIR, vb)
+    diff_kap(kap1, kap2, name1, name2, MESA_DIR, vb, MESA_DIR2)
     print("/ !end kap namelist")
     # controls
-    controls1 = build_top_controls(work1, first_inlist=work1 + "/" + inlist1_b1)
-    controls2 = build_top_controls(work2, first_inlist=work2 + "/" + inlist1_b2)
+    controls1, controls2 = build_pair(
+        build_top_controls, work1, work2, work1 + "/" + inlist1_b1, work2 + "/" + inlist1_b2, only_changes=only_changes
+    )
     print("")
     print("&controls")
-    diff_controls(controls1, controls2, name1, name2, MESA_DIR, vb)
+    diff_controls(controls1, controls2, name1, name2, MESA_DIR, vb, MESA_DIR2)
     print("/ !end controls namelist")
     if do_pgstar:
         pgstar1 = build_top_pgstar(work1, first_inlist=work1 + "/" + inlist1_b1)
         pgstar2 = build_top_pgstar(work2, first_inlist=work2 + "/" + inlist1_b2)
         print("")
         print("&pgstar")
-        diff_pgstar(pgstar1, pgstar2, name1, name2, MESA_DIR, vb)
+        diff_pgstar(pgstar1, pgstar2, name1, name2, MESA_DIR, vb, MESA_DIR2)
         print("/ !end pgstar")
     print("**************************")
     print("*  Done with primaries   *")
     print("**************************")
     print(" Compare secondaries now *")
     print("**************************")
-    star_job1 = build_top_star_job(work1, first_inlist=work1 + "/" + inlist2_b1)
-    star_job2 = build_top_star_job(work2, first_inlist=work2 + "/" + inlist2_b2)
+    star_job1, star_job2 = build_pair(
+        build_top_star_job, work1, work2, work1 + "/" + inlist2_b1, work2 + "/" + inlist2_b2, only_changes=only_changes
+    )
     print("")
     print("&star_job")
-    diff_starjob(star_job1, star_job2, name1, name2, MESA_DIR, vb)
+    diff_starjob(star_job1, star_job2, name1, name2, MESA_DIR, vb, MESA_DIR2)
     print("/ !end star_job namelist")
     # eos_job
-    eos1 = build_top_eos(work1)
-    eos2 = build_top_eos(work2)
+    eos1, eos2 = build_pair(build_top_eos, work1, work2, only_changes=only_changes)
     print("")
     print("&eos")
-    diff_eos(eos1, eos2, name1, name2, MESA_DIR, vb)
+    diff_eos(eos1, eos2, name1, name2, MESA_DIR, vb, MESA_DIR2)
     print("/ !end eos namelist")
     # kap_job
-    kap1 = build_top_kap(work1)
-    kap2 = build_top_kap(work2)
+    kap1, kap2 = build_pair(build_top_kap, work1, work2, only_changes=only_changes)
     print("")
     print("&kap")
-    diff_kap(kap1, kap2, name1, name2, MESA_DIR, vb)
+    diff_kap(kap1, kap2, name1, name2, MESA_DIR, vb, MESA_DIR2)
     print("/ !end kap namelist")
     # controls
-    controls1 = build_top_controls(work1, first_inlist=work1 + "/" + inlist2_b1)
-    controls2 = build_top_controls(work2, first_inlist=work2 + "/" + inlist2_b2)
+    controls1, controls2 = build_pair(
+        build_top_controls, work1, work2, work1 + "/" + inlist2_b1, work2 + "/" + inlist2_b2, only_changes=only_changes
+    )
     print("")
     print("&controls")
-    diff_controls(controls1, controls2, name1, name2, MESA_DIR, vb)
+    diff_controls(controls1, controls2, name1, name2, MESA_DIR, vb, MESA_DIR2)
     print("/ !end controls namelist")
     if do_pgstar:
         pgstar1 = build_top_pgstar(work1, first_inlist=work1 + "/" + inlist2_b1)
         pgstar2 = build_top_pgstar(work2, first_inlist=work2 + "/" + inlist2_b2)
         print("")
         print("&pgstar")
-        diff_pgstar(pgstar1, pgstar2, name1, name2, MESA_DIR, vb)
+        diff_pgstar(pgstar1, pgstar2, name1, name2, MESA_DIR, vb, MESA_DIR2)
         print("/ !end pgstar")
     print("**************************")
     print("* Done with secondaries  *")
     print("**************************")
 
 
-def check_folders_consistency(work_dir1: str, work_dir2: str, do_pgstar=False, MESA_DIR="", vb=False):
+def check_folders_consistency(work_dir1: str, work_dir2: str, do_pgstar=False, MESA_DIR="", vb=False, MESA_DIR2=""):
     """checks if both folders are for single or binary stars and calls the right functions"""
     is_binary1 = is_folder_binary(work_dir1)
     is_binary2 = is_folder_binary(work_dir2)
     if is_binary1 and is_binary2:
-        compare_binary_work_dirs(work_dir1, work_dir2, do_pgstar=do_pgstar, MESA_DIR=MESA_DIR, vb=vb)
+        compare_binary_work_dirs(
+            work_dir1, work_dir2, do_pgstar=do_pgstar, MESA_DIR=MESA_DIR, vb=vb, MESA_DIR2=MESA_DIR2
+        )
     elif (not is_binary1) and (not is_binary2):
-        compare_single_work_dirs(work_dir1, work_dir2, do_pgstar=do_pgstar, MESA_DIR=MESA_DIR, vb=vb)
+        compare_single_work_dirs(
+            work_dir1, work_dir2, do_pgstar=do_pgstar, MESA_DIR=MESA_DIR, vb=vb, MESA_DIR2=MESA_DIR2
+        )
     else:
         print(
             colored(
@@ -902,17 +789,65 @@ def check_folders_consistency(work_dir1: str, work_dir2: str, do_pgstar=False, M
 
 # command line wrapper
 @click.command(context_settings={"ignore_unknown_options": True})
-@click.argument("work_dir1", nargs=1, type=click.Path(exists=True))
-@click.argument("work_dir2", nargs=1, type=click.Path(exists=True))
+@click.argument("work_dir1", nargs=1, type=ExistingPath(), required=False)
+@click.argument("work_dir2", nargs=1, type=ExistingPath(), required=False)
 @click.option("--pgstar", default=False, help="Show also diff of pgstar namelists.")
 @click.option(
     "--mesa_dir",
     default="",
     help="use customized location of $MESA_DIR. Will use environment variable if empty and return an error if empty.",
 )
+@click.option(
+    "--mesa_dir2",
+    default="",
+    help="$MESA_DIR of the MESA version of WORK_DIR2, if different from --mesa_dir.",
+)
 @click.option("--vb", default=False, help="Show also matching lines using green.")
-def compare_all_workdir_inlists(work_dir1, work_dir2, pgstar, mesa_dir, vb):
-    check_folders_consistency(work_dir1, work_dir2, do_pgstar=pgstar, MESA_DIR=mesa_dir, vb=vb)
+@click.option(
+    "--batch",
+    default="",
+    help="Compare the pairs of work directories or inlists listed one pair per line in this file (- for stdin).",
+)
+@click.option("--jobs", default=1, help="Number of worker processes to use with --batch.")
+@click.option("--profile", is_flag=True, help="Print the time spent in each stage and other counters at the end.")
+@click.option("--profile_json", default="", help="Save the time spent in each stage and other counters in this file.")
+@click.option(
+    "--quiet",
+    is_flag=True,
+    help="Print nothing, exit with 0 if the same, 1 as soon as a difference is found, 2 if they can't be compared.",
+)
+@click.option("--io_threads", default=8, help="Maximum number of nested inlists read at the same time.")
+@report_errors
+def compare_all_workdir_inlists(
+    work_dir1, work_dir2, pgstar, mesa_dir, mesa_dir2, vb, batch, jobs, profile, profile_json, io_threads, quiet
+):
+    if (batch == "") and ((work_dir1 is None) or (work_dir2 is None)):
+        raise click.UsageError("Need WORK_DIR1 and WORK_DIR2, or --batch")
+    set_io_threads(io_threads)
+    if quiet:
+        from .batch_compare import read_pairs
+
+        malformed = []
+        pairs = read_pairs(batch, malformed=malformed) if batch != "" else [(work_dir1, work_dir2)]
+        if malformed:
+            # lines that are not pairs can't be compared
+            sys.exit(2)
+        sys.exit(quiet_exit_status(pairs, do_pgstar=pgstar, MESA_DIR=mesa_dir, MESA_DIR2=mesa_dir2))
+    if profile or (profile_json != ""):
+        prof = profiling(json_file=profile_json, summary=profile)
+    else:
+        prof = contextlib.nullcontext()
+    with prof:
+        if batch != "":
+            from .batch_compare import compare_batch
+
+            failed = compare_batch(batch, do_pgstar=pgstar, MESA_DIR=mesa_dir, vb=vb, jobs=jobs, MESA_DIR2=mesa_dir2)
+        else:
+            check_folders_consistency(
+                work_dir1, work_dir2, do_pgstar=pgstar, MESA_DIR=mesa_dir, vb=vb, MESA_DIR2=mesa_dir2
+            )
+            failed = 0
+    sys.exit(1 if failed else 0)
 
 
 if __name__ == "__main__":
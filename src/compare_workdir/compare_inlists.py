@@ -23,7 +23,12 @@
 # This has been tested with MESA version 15140
 
 import os
+import re
 import sys
+import mmap
+import hashlib
+import functools
+import contextlib
 from pathlib import Path
 
 # pip install -U termcolor
@@ -32,6 +37,10 @@ from termcolor import colored
 # pip install -U click
 import click
 
+from .profiling import profiled, count, is_profiling, profiling
+from .errors import MESADirNotFound, DefaultsNotFound, report_errors
+from .file_access import ExistingPath, is_virtual, file_key, file_stamp, read_bytes, git_objects_cached
+
 
 # ----- some auxiliary functions ----------------------------------
 
@@ -41,9 +50,10 @@ def get_name_val(line: "str"):
     read the line removing comments and white spaces
     and returns the name of the option and the associated value
     """
-    optionName = line.split("=")[0].rstrip().lstrip()
+    parts = line.split("=")
+    optionName = parts[0].strip()
     optionName = optionName.lower()  ## convert everything to lowercase
-    value = line.split("=")[-1].split("!")[0].rstrip().lstrip()
+    value = parts[-1].split("!")[0].strip()
     return optionName, value
 
 
@@ -77,34 +87,306 @@ def clean_val(val):
     return val
 
 
+# ------------------------- options that are arrays ------------------------------
+
+# e.g. x_ctrl(1), inlist_names(2), x_ctrl(1:3), x_ctrl(:)
+_ARRAY_ELEMENT = re.compile(r"^(\w+)\s*\(([^()]*)\)$")
+
+
+class FortranArray(dict):
+    """
+    elements of an array option set in a namelist, as {index: value}.
+    fill is the value of all the elements not set explicitly, if known
+    (e.g. x_ctrl(:) = 0d0 in the defaults), otherwise None.
+    """
+
+    __slots__ = ("fill",)
+
+    def __init__(self, elements=(), fill=None):
+        super().__init__(elements)
+        self.fill = fill
+
+    def element(self, i):
+        """value of the element i (None if unknown)"""
+        return self.get(i, self.fill)
+
+    def merged(self, other: "FortranArray") -> "FortranArray":
+        """new array with the elements of other overwriting the ones in self, as when MESA reads other after self"""
+        new = FortranArray(self, other.fill if other.fill is not None else self.fill)
+        new.update(other)
+        return new
+
+    def __eq__(self, other):
+        if not isinstance(other, FortranArray):
+            return NotImplemented
+        return (self.fill == other.fill) and dict.__eq__(self, other)
+
+    def __ne__(self, other):
+        eq = self.__eq__(other)
+        return eq if eq is NotImplemented else not eq
+
+    __hash__ = None
+
+    def __reduce__(self):
+        return (FortranArray, (dict(self), self.fill))
+
+    def __repr__(self):
+        elements = ", ".join(f"({i})={v}" for i, v in sorted(self.items()))
+        if self.fill is not None:
+            elements = f"(:)={self.fill}" + (", " + elements if elements else "")
+        return "[" + elements + "]"
+
+
+def split_values(value: "str") -> "list":
+    """
+    splits a comma separated list of values (e.g. for arrays) ignoring commas in strings,
+    and expands Fortran repeat counts (3*0d0)
+    """
+    values = []
+    current = ""
+    quote = ""
+    for c in value:
+        if quote:
+            if c == quote:
+                quote = ""
+        elif c in "'\"":
+            quote = c
+        elif c == ",":
+            values.append(current.strip())
+            current = ""
+            continue
+        current += c
+    values.append(current.strip())
+    expanded = []
+    for v in values:
+        repeat, star, rest = v.partition("*")
+        if star and repeat.isdigit():
+            expanded += [rest.strip()] * int(repeat)
+        elif v != "":
+            expanded.append(v)
+    return expanded
+
+
+def format_indices(indices: "list") -> "str":
+    """compact representation of a list of indices of an array, e.g. [1, 2, 3, 5] -> 1:3,5"""
+    if indices == [":"]:
+        return ":"
+    ranges = []
+    for i in indices:
+        if ranges and ranges[-1][1] == i - 1:
+            ranges[-1][1] = i
+        else:
+            ranges.append([i, i])
+    return ",".join(str(a) if a == b else f"{a}:{b}" for a, b in ranges)
+
+
+def set_array_elements(namelist: "dict", option_name: "str", value: "str", fill_ranges=False) -> "bool":
+    """
+    stores in namelist the elements of an array assigned in one line, e.g. x_ctrl(2) = 1d0,
+    x_ctrl(1:3) = 1d0, 2d0, 3d0, or x_ctrl(:) = 0d0. As in Fortran, the values are assigned to
+    consecutive elements starting from the first index. With fill_ranges (used for the defaults files,
+    where x_ctrl(1:num_x_ctrls) = 0d0 documents all the elements), a single value assigned to a
+    range sets all the elements. Returns False if option_name is not a (1D) array element.
+    """
+    m = _ARRAY_ELEMENT.match(option_name)
+    if m is None:
+        return False
+    name, spec = m.group(1), m.group(2).replace(" ", "")
+    values = split_values(value)
+    if ":" in spec:
+        lower, upper = spec.split(":", 1)
+    else:
+        lower, upper = spec, spec
+    if fill_ranges and (":" in spec) and (len(values) == 1):
+        array = namelist.get(name)
+        if not isinstance(array, FortranArray):
+            array = namelist[name] = FortranArray()
+        array.fill = clean_val(values[0])
+        return True
+    try:
+        lower = int(lower) if lower != "" else 1
+        upper = int(upper) if upper != "" else None
+    except ValueError:
+        # multi-dimensional array or bounds that are names, leave it as it is
+        return False
+    if upper is not None:
+        values = values[: max(upper - lower + 1, 0)]
+    array = namelist.get(name)
+    if not isinstance(array, FortranArray):
+        array = namelist[name] = FortranArray()
+    for i, v in enumerate(values):
+        array[lower + i] = clean_val(v)
+    return True
+
+
+def get_option(namelist: "dict", option_name: "str", default=None):
+    """
+    returns the value of option_name in namelist, looking inside arrays
+    for array elements such as inlist_names(1). Returns default if not set.
+    """
+    option_name = option_name.lower()
+    m = _ARRAY_ELEMENT.match(option_name)
+    if m is not None:
+        array = namelist.get(m.group(1))
+        if isinstance(array, FortranArray):
+            try:
+                value = array.element(int(m.group(2)))
+            except ValueError:
+                value = None
+            return default if value is None else value
+    return namelist.get(option_name, default)
+
+
+def merge_namelists(namelist: "dict", namelist_to_add: "dict") -> "dict":
+    """
+    returns a new namelist with the options of namelist_to_add overwriting those of namelist,
+    element by element for arrays. That's what MESA does reading nested inlists.
+    """
+    merged = {**namelist, **namelist_to_add}
+    for k, v in namelist_to_add.items():
+        old = namelist.get(k)
+        if isinstance(v, FortranArray) and isinstance(old, FortranArray):
+            merged[k] = old.merged(v)
+    return merged
+
+
+def iter_options(namelist: "dict"):
+    """yields (option name, value) for each option in namelist, one per array element, e.g. x_ctrl(1)"""
+    for k, v in namelist.items():
+        if isinstance(v, FortranArray):
+            if v.fill is not None:
+                yield f"{k}(:)", v.fill
+            for i in sorted(v):
+                yield f"{k}({i})", v[i]
+        else:
+            yield k, v
+
+
 def get_MESA_DIR() -> str:
     """
     Read the MESA_DIR in the environment variables if not provided,
-    and returns it as a string.
+    and returns it as a string. Raises MESADirNotFound if not set.
     """
     try:
         MESA_DIR = os.environ["MESA_DIR"]
         return MESA_DIR
     except KeyError:
-        print(colored("Maybe $MESA_DIR environment variabile is not set?", "yellow"))
-        print(colored("I don't know what to do, bye!", "yellow"))
-        sys.exit()
+        raise MESADirNotFound("Maybe $MESA_DIR environment variable is not set? Use --mesa_dir otherwise.")
+
+
+# ------------------------------ caches -------------------------------------------
+
+# defaults are read once per (namelist, MESA_DIR), inlists once per (reader, path),
+# and the positions of the namelists in each inlist are indexed once, as long as
+# the file is not modified. This matters when comparing many pairs in the same
+# process (e.g., --batch). Inlists with the same content as one already read
+# (e.g., the same nested inlist copied in many work directories) are not parsed again.
+_defaults_cache = {}
+_namelist_cache = {}
+_index_cache = {}
+_content_cache = {}
+
+
+def _copy_result(result):
+    """shallow copy the dictionaries returned by the get_*_namelist functions"""
+    if isinstance(result, tuple):
+        return (dict(result[0]),) + result[1:]
+    return dict(result)
+
+
+def cache_by_file(reader):
+    """
+    memoize a function reading a namelist from an inlist, invalidating
+    the cached result if the inlist size or modification time (or git blob) change
+    """
+
+    @functools.wraps(reader)
+    def wrapper(inlist: "str"):
+        # REV:path inlists are read from git once for the stamp, the digest and the parsing
+        with git_objects_cached():
+            return cached_read(inlist)
+
+    def cached_read(inlist: "str"):
+        stamp = file_stamp(inlist)
+        key = (reader.__name__, file_key(inlist))
+        cached = _namelist_cache.get(key)
+        if cached is not None and cached[0] == stamp:
+            count("inlist cache hits")
+            return _copy_result(cached[1])
+        count("inlist cache misses")
+        content_key = (reader.__name__, file_digest(inlist))
+        result = _content_cache.get(content_key)
+        if result is not None:
+            count("identical inlists not parsed")
+        else:
+            result = _content_cache[content_key] = reader(inlist)
+        _namelist_cache[key] = (stamp, result)
+        return _copy_result(result)
+
+    return wrapper
+
+
+def clear_caches():
+    """forget all the defaults and inlists read so far"""
+    _defaults_cache.clear()
+    _namelist_cache.clear()
+    _index_cache.clear()
+    _content_cache.clear()
 
 
 # ----------------------- read the defaults ----------------------------------
 
+# where MESA keeps the defaults of each namelist
+DEFAULTS_FILES = {
+    "star_job": "star/defaults/star_job.defaults",
+    "controls": "star/defaults/controls.defaults",
+    "pgstar": "star/defaults/pgstar.defaults",
+    "eos": "eos/defaults/eos.defaults",
+    "kap": "kap/defaults/kap.defaults",
+    "binary_job": "binary/defaults/binary_job.defaults",
+    "binary_controls": "binary/defaults/binary_controls.defaults",
+}
+
+
+def get_mesa_version(MESA_DIR: "str") -> "str":
+    """version of MESA in MESA_DIR (or of the defaults snapshot MESA_DIR), or MESA_DIR itself if unknown"""
+    if os.path.isfile(MESA_DIR):
+        from .defaults_snapshot import load_defaults_snapshot
+
+        return load_defaults_snapshot(MESA_DIR)["mesa_version"]
+    try:
+        with open(os.path.join(MESA_DIR, "data", "version_number"), "r") as F:
+            return F.read().strip()
+    except OSError:
+        return MESA_DIR
+
 
+@profiled
 def get_defaults(namelist: str, MESA_DIR="") -> "dict":
     """
     read the namelists from the MESA_DIR folder.
     MESA_DIR will be read from the environment variables if it is an empty string
 
     namelist can be either star_job, binary_job, controls, binary_controls, eos, kap, or pgstar
-    returns a dictionary with MESA options as keys and the values set in the default files
+    returns a dictionary with MESA options as keys and the values set in the default files.
+    The dictionary is cached and shared between calls: do not modify it.
+    MESA_DIR can also be a snapshot of all the defaults written by snapshot_mesa_defaults.
     """
     defaults = {}
     if MESA_DIR == "":
         MESA_DIR = get_MESA_DIR()
+    key = (namelist.lower(), MESA_DIR)
+    if key in _defaults_cache:
+        count("defaults cache hits")
+        return _defaults_cache[key]
+    count("defaults cache misses")
+    if os.path.isfile(MESA_DIR):
+        from .defaults_snapshot import load_defaults_snapshot
+
+        snapshot = load_defaults_snapshot(MESA_DIR)["namelists"]
+        if namelist.lower() in snapshot:
+            _defaults_cache[key] = snapshot[namelist.lower()]
+            return _defaults_cache[key]
     if namelist.lower() == "star_job":
         defaultFname = Path(MESA_DIR + "/star/defaults/star_job.defaults")
     elif namelist.lower() == "binary_job":
@@ -117,18 +399,12 @@ def get_defaults(namelist: str, MESA_DIR="") -> "dict":
         if Path(MESA_DIR + "/eos/defaults/eos.defaults").exists():
             defaultFname = Path(MESA_DIR + "/eos/defaults/eos.defaults")
         else:
-            print(colored("***********************************", "yellow"))
-            print(colored("eos namelist not found in " + MESA_DIR, "yellow"))
-            print(colored("***********************************", "yellow"))
-            sys.exit()
+            raise DefaultsNotFound("eos namelist not found in " + MESA_DIR)
     elif namelist.lower() == "kap":
         if Path(MESA_DIR + "/kap/defaults/kap.defaults").exists():
             defaultFname = Path(MESA_DIR + "/kap/defaults/kap.defaults")
         else:
-            print(colored("***********************************", "yellow"))
-            print(colored("kap namelist not found in " + MESA_DIR, "yellow"))
-            print(colored("***********************************", "yellow"))
-            sys.exit()
+            raise DefaultsNotFound("kap namelist not found in " + MESA_DIR)
     elif namelist.lower() == "pgstar":
         defaultFname = Path(MESA_DIR + "/star/defaults/pgstar.defaults")
     else:
@@ -141,58 +417,156 @@ def get_defaults(namelist: str, MESA_DIR="") -> "dict":
         return defaults
     # now if we did not exit already, load a dict
     # print(defaultFname)
-    with open(defaultFname, "r") as f:
-        for i, line in enumerate(f):
-            l = line.strip("\n\r").strip()  # remove \n and white spaces
-            if (l == "") or (l[0] == "!"):
-                # empty line or comment, move on
-                continue
-            else:
-                optionName, value = get_name_val(l)
-                value = clean_val(value)
-                defaults[optionName] = value
+    count("files opened")
+    try:
+        with open(defaultFname, "r") as f:
+            lines = f.read().splitlines()
+    except FileNotFoundError:
+        raise DefaultsNotFound(namelist + " namelist not found in " + MESA_DIR)
+    count("lines scanned", len(lines))
+    defaults = parse_namelist_lines(lines, fill_ranges=True)
     # Note, the longest key is ~45 characters in length, hence the 45 further down in the string formatting
+    _defaults_cache[key] = defaults
     return defaults
 
 
+def cache_defaults(namelist: "str", MESA_DIR: "str", defaults):
+    """
+    use defaults (a dictionary, or any read-only mapping) as the defaults of namelist in MESA_DIR from now on
+    (None to read them again when needed). Returns the defaults cached before, or None.
+    """
+    key = (namelist.lower(), MESA_DIR)
+    previous = _defaults_cache.pop(key, None)
+    if defaults is not None:
+        _defaults_cache[key] = defaults
+    return previous
+
+
 # --------------------- read namelist of the inlists -------------------------
 
 
+# a namelist starts with a line containing only &name and ends at the first line starting with /
+# (the patterns start with a literal character, which the regex engine finds quickly)
+_NAMELIST_START = re.compile(rb"&(\w+)[ \t\r\f\v]*$", re.MULTILINE)
+_NAMELIST_END = re.compile(rb"\n[ \t]*/")
+
+
+def parse_namelist_lines(lines, names=(), fill_ranges=False) -> "dict":
+    """
+    returns a dictionary of options and values from the lines inside a namelist,
+    skipping empty lines, comments, and the &name lines for name in names.
+    Elements of arrays are collected in a FortranArray (see set_array_elements).
+    """
+    namelist = {}
+    for line in lines:
+        l = line.strip()  # remove \n and white spaces
+        if (l == "") or (l[0] == "!"):
+            # skip empty lines and comments
+            continue
+        if l[0] == "&" and l[1:].lower() in names:
+            continue
+        option_name, value = get_name_val(l)
+        if (option_name[-1:] == ")") and set_array_elements(namelist, option_name, value, fill_ranges):
+            continue
+        namelist[option_name] = clean_val(value)
+    return namelist
+
+
+def index_namelists(buf) -> "dict":
+    """
+    returns a dictionary with the (lowercase) name of each namelist in buf (bytes or mmap)
+    as keys and the start and end byte offsets of its content as values.
+    Only the first namelist with a given name is kept, since that's the one read.
+    """
+    index = {}
+    for start in _NAMELIST_START.finditer(buf):
+        line_start = buf.rfind(b"\n", 0, start.start()) + 1
+        if buf[line_start : start.start()].strip() != b"":
+            # & not at the beginning of the line
+            continue
+        name = start.group(1).decode().lower()
+        if name in index:
+            continue
+        end = _NAMELIST_END.search(buf, start.end())
+        index[name] = (start.end(), end.start() if end is not None else len(buf))
+    return index
+
+
+def _indexed(inlist: "str") -> "tuple":
+    """
+    returns (stamp, index, digest) for inlist, with the offsets of the namelists (see index_namelists)
+    and a digest of its content. The file is memory mapped and scanned once, and this is cached
+    until the file size or modification time change. REV:path inlists and archive members are read whole instead.
+    """
+    stamp = file_stamp(inlist)
+    key = file_key(inlist)
+    cached = _index_cache.get(key)
+    if cached is not None and cached[0] == stamp:
+        count("index cache hits")
+        return cached
+    count("index cache misses")
+    index, digest = {}, hashlib.sha1(b"").digest()
+    if is_virtual(inlist):
+        count("files extracted")
+        buf = read_bytes(inlist)
+        index, digest = index_namelists(buf), hashlib.sha1(buf).digest()
+    elif stamp[1] > 0:  # can't mmap empty files
+        count("files opened")
+        with open(inlist, "rb") as F:
+            with mmap.mmap(F.fileno(), 0, access=mmap.ACCESS_READ) as buf:
+                index, digest = index_namelists(buf), hashlib.sha1(buf).digest()
+    _index_cache[key] = (stamp, index, digest)
+    return _index_cache[key]
+
+
+def get_namelist_index(inlist: "str") -> "dict":
+    """returns the offsets of the namelists in inlist (see index_namelists)"""
+    return _indexed(inlist)[1]
+
+
+def file_digest(inlist: "str") -> "bytes":
+    """digest of the content of inlist, the same for identical inlists"""
+    return _indexed(inlist)[2]
+
+
+def scan_namelist(inlist: "str", names: "tuple"):
+    """
+    reads the first namelist in inlist starting with one of the lines &name
+    for name in names (lowercase), and returns a dictionary of its entries and values,
+    and the name of the namelist found (empty string if none).
+    Uses the index of the namelists in inlist to read and decode only that namelist.
+    """
+    index = get_namelist_index(inlist)
+    blocks = [(index[name], name) for name in names if name in index]
+    if not blocks:
+        return {}, ""
+    (start, end), found = min(blocks)
+    if is_virtual(inlist):
+        count("files extracted")
+        lines = read_bytes(inlist)[start:end].decode().splitlines()
+    else:
+        count("files opened")
+        with open(inlist, "rb") as F:
+            F.seek(start)
+            lines = F.read(end - start).decode().splitlines()
+    count("lines scanned", len(lines))
+    return parse_namelist_lines(lines, names), found
+
+
+@profiled
+@cache_by_file
 def get_job_namelist(inlist: "str"):
     """
     returns a dictionary of the star_job or binary_job namelist entries
     inside inlist, and values and a flag for binaries
     """
-    job = {}
-    is_binary = False
-    with open(inlist, "r") as i1:
-        in_job_namelist = False
-        for i, line in enumerate(i1):
-            # print(line.strip('\n\r'))
-            l = line.strip("\n\r").rstrip().lstrip()  # remove \n and white spaces
-            if "&star_job" == l.lower():
-                in_job_namelist = True
-                is_binary = False
-                continue  # to avoid adding the first line
-            elif "&binary_job" == l.lower():
-                in_job_namelist = True
-                is_binary = True
-                continue  # to avoid adding the first line
-            if in_job_namelist:
-                if (l == "") or (l[0] == "!"):
-                    # skip empty lines
-                    pass
-                else:
-                    if l[0] == "/":  # exit
-                        in_job_namelist = False
-                        break
-                    else:
-                        option_name, value = get_name_val(l)
-                        value = clean_val(value)
-                        job[option_name] = value
+    job, found = scan_namelist(inlist, ("star_job", "binary_job"))
+    is_binary = found == "binary_job"
     return job, is_binary
 
 
+@profiled
+@cache_by_file
 def get_controls_namelist(inlist: str):
     """
     returns a dictionary of the controls or binary_controls namelist entries and values
@@ -205,123 +579,42 @@ def get_controls_namelist(inlist: str):
     is_binary: `bool`, was the namelist binary_constrols inlist of not
     -------
     """
-    controls = {}
-    is_binary = False
-    with open(inlist, "r") as i1:
-        in_controls_namelist = False
-        for i, line in enumerate(i1):
-            # print(line.strip('\n\r'))
-            l = line.strip("\n\r").rstrip().lstrip()  # remove \n and white spaces
-            if "&controls" == l.lower():
-                in_controls_namelist = True
-                is_binary = False
-                continue  # to avoid adding the first line
-            elif "&binary_controls" == l.lower():
-                in_controls_namelist = True
-                is_binary = True
-                continue  # to avoid adding the first line
-            if in_controls_namelist:
-                if (l == "") or (l[0] == "!"):
-                    # skip empty lines
-                    pass
-                else:
-                    if l[0] == "/":  # exit
-                        in_controls_namelist = False
-                        break
-                    else:
-                        option_name, value = get_name_val(l)
-                        value = clean_val(value)
-                        controls[option_name] = value
+    controls, found = scan_namelist(inlist, ("controls", "binary_controls"))
+    is_binary = found == "binary_controls"
     return controls, is_binary
 
 
+@profiled
+@cache_by_file
 def get_eos_namelist(inlist: "str") -> "dict":
     """
     returns a dictionary of the eos and values
     """
-    eos = {}
-    with open(inlist, "r") as i1:
-        in_eos_namelist = False
-        for i, line in enumerate(i1):
-            # print(line.strip('\n\r'))
-            l = line.strip("\n\r").rstrip().lstrip()  # remove \n and white spaces
-            if "&eos" == l.lower():
-                in_eos_namelist = True
-                continue  # to avoid adding the first line
-            if in_eos_namelist:
-                if (l == "") or (l[0] == "!"):
-                    # skip empty lines
-                    pass
-                else:
-                    if l[0] == "/":  # exit
-                        in_controls_namelist = False
-                        break
-                    else:
-                        option_name, value = get_name_val(l)
-                        value = clean_val(value)
-                        eos[option_name] = value
-    return eos
+    return scan_namelist(inlist, ("eos",))[0]
 
 
+@profiled
+@cache_by_file
 def get_kap_namelist(inlist: "str") -> "dict":
     """
     returns a dictionary of the kap and values
     """
-    kap = {}
-    with open(inlist, "r") as i1:
-        in_kap_namelist = False
-        for i, line in enumerate(i1):
-            # print(line.strip('\n\r'))
-            l = line.strip("\n\r").rstrip().lstrip()  # remove \n and white spaces
-            if "&kap" == l.lower():
-                in_kap_namelist = True
-                continue  # to avoid adding the first line
-            if in_kap_namelist:
-                if (l == "") or (l[0] == "!"):
-                    # skip empty lines
-                    pass
-                else:
-                    if l[0] == "/":  # exit
-                        in_controls_namelist = False
-                        break
-                    else:
-                        option_name, value = get_name_val(l)
-                        value = clean_val(value)
-                        kap[option_name] = value
-    return kap
+    return scan_namelist(inlist, ("kap",))[0]
 
 
+@profiled
+@cache_by_file
 def get_pgstar_namelist(inlist: "str") -> "dict":
     """
     returns a dictionary of the pgstar namelist entries and values
     """
-    pgstar = {}
-    with open(inlist, "r") as i1:
-        in_pgstar_namelist = False
-        for i, line in enumerate(i1):
-            # print(line.strip('\n\r'))
-            l = line.strip("\n\r").rstrip().lstrip()  # remove \n and white spaces
-            if "&pgstar" == l.lower():
-                in_pgstar_namelist = True
-                continue  # to avoid adding the first line
-            if in_pgstar_namelist:
-                if (l == "") or (l[0] == "!"):
-                    # skip empty lines
-                    pass
-                else:
-                    if l[0] == "/":  # exit
-                        in_pgstar_namelist = False
-                        break
-                    else:
-                        option_name, value = get_name_val(l)
-                        value = clean_val(value)
-                        pgstar[option_name] = value
-    return pgstar
+    return scan_namelist(inlist, ("pgstar",))[0]
 
 
 # ---------- compare namelists entries between each other and defaults -------------------------
 
 
+@profiled
 def compare_and_report(k: "str", dic1: "dict", dic2: "dict", string1: "str", string2: "str", vb=False):
     """
     Given two dictionaries, compares their entry k.
@@ -338,6 +631,7 @@ def compare_and_report(k: "str", dic1: "dict", dic2: "dict", string1: "str", str
         print("")
 
 
+@profiled
 def compare_defaults_and_report(
     k: "str", dic: "dict", dic_defaults: "dict", string: "str", string_other: "str", vb=False
 ):
@@ -364,130 +658,228 @@ def compare_defaults_and_report(
         print("")
 
 
-# --------------do the diff individual namelists ---------------------------
-
-
-def diff_starjob(job1: "dict", job2: "dict", string1: "str", string2: "str", MESA_DIR="", vb=False):
+def compare_arrays_and_report(
+    k: "str",
+    dic1: "dict",
+    dic2: "dict",
+    dic_defaults: "dict",
+    string1: "str",
+    string2: "str",
+    vb=False,
+    dic_defaults2=None,
+):
+    """
+    Compares the array k in dic1 and dic2 (it can be missing in one of them) element by element,
+    using the defaults for elements set only on one side, and prints
+    the differing indices compactly, e.g. x_ctrl(2:4). If dic_defaults2 is given,
+    those are the defaults for dic2 (e.g., from another MESA version).
+    """
+    a1 = dic1.get(k)
+    a2 = dic2.get(k)
+    default = dic_defaults.get(k)
+    if not isinstance(default, FortranArray):
+        default = FortranArray()
+    default2 = default if dic_defaults2 is None else dic_defaults2.get(k)
+    if not isinstance(default2, FortranArray):
+        default2 = FortranArray()
+    elements = [FortranArray() if not isinstance(a, FortranArray) else a for a in (a1, a2)]
+    indices = sorted(set(elements[0]) | set(elements[1]))
+    if any(a.fill is not None for a in elements):
+        indices = [":"] + indices
+    # group consecutive indices with the same values on both sides
+    groups = []
+    for i in indices:
+        if i == ":":
+            values = tuple(a.fill for a in elements) + (default.fill, default2.fill)
+        else:
+            values = tuple(a.element(i) for a in elements) + (default.element(i), default2.element(i))
+        if groups and groups[-1][1] == values and groups[-1][0][-1] != ":" and i != ":" and groups[-1][0][-1] == i - 1:
+            groups[-1][0].append(i)
+        else:
+            groups.append(([i], values))
+    for group, (v1, v2, d1, d2) in groups:
+        key = f"{k}({format_indices(group)})"
+        if (v1 is not None) and (v2 is not None):
+            compare_and_report(key, {key: v1}, {key: v2}, string1, string2, vb)
+        elif v1 is not None:
+            # the element is missing on side 2, which uses its default
+            compare_defaults_and_report(key, {key: v1}, {} if d2 is None else {key: d2}, string1, string2, vb)
+        elif v2 is not None:
+            compare_defaults_and_report(key, {key: v2}, {} if d1 is None else {key: d1}, string2, string1, vb)
+
+
+def diff_namelist(
+    nml1: "dict", nml2: "dict", defaults: "dict", string1: "str", string2: "str", vb=False, defaults2=None
+):
+    """
+    prints the differences between two namelists, checking the defaults for options set only in one,
+    and comparing arrays element by element. If defaults2 is given, those are the defaults
+    for nml2 (e.g., from another MESA version), otherwise both use defaults.
+    """
+    if defaults2 is None:
+        defaults2 = defaults
+    if is_profiling():
+        count("keys compared", len(nml1.keys() | nml2.keys()))
     # check the keys appearing in both
-    for k in job1.keys() & job2.keys():
-        compare_and_report(k, job1, job2, string1, string2, vb)
+    for k in nml1.keys() & nml2.keys():
+        if isinstance(nml1[k], FortranArray) and isinstance(nml2[k], FortranArray):
+            compare_arrays_and_report(k, nml1, nml2, defaults, string1, string2, vb, defaults2)
+        else:
+            compare_and_report(k, nml1, nml2, string1, string2, vb)
     # check keys that are not in both and check if they are different than defaults
-    defaults = get_defaults("star_job", MESA_DIR)
-    # keys in job1 but not job2
-    k1 = set(job1.keys()).difference(set(job2.keys()))
+    # keys in nml1 but not nml2
+    k1 = set(nml1.keys()).difference(set(nml2.keys()))
     for k in k1:
-        compare_defaults_and_report(k, job1, defaults, string1, string2, vb)
-    # keys in job2 but not job1
-    k2 = set(job2.keys()).difference(set(job1.keys()))
+        if isinstance(nml1[k], FortranArray):
+            compare_arrays_and_report(k, nml1, nml2, defaults, string1, string2, vb, defaults2)
+        else:
+            # nml2 uses its default
+            compare_defaults_and_report(k, nml1, defaults2, string1, string2, vb)
+    # keys in nml2 but not nml1
+    k2 = set(nml2.keys()).difference(set(nml1.keys()))
     for k in k2:
-        compare_defaults_and_report(k, job2, defaults, string2, string1, vb)
+        if isinstance(nml2[k], FortranArray):
+            compare_arrays_and_report(k, nml1, nml2, defaults, string1, string2, vb, defaults2)
+        else:
+            compare_defaults_and_report(k, nml2, defaults, string2, string1, vb)
+
+
+def arrays_equal(a1, a2, default1: "dict", default2: "dict") -> "bool":
+    """True if compare_arrays_and_report would find no difference between the arrays a1 and a2"""
+    arrays = [a if isinstance(a, FortranArray) else FortranArray() for a in (a1, a2)]
+    if arrays[0] == arrays[1]:
+        return True
+    defaults = [d if isinstance(d, FortranArray) else FortranArray() for d in (default1, default2)]
+    indices = sorted(set(arrays[0]) | set(arrays[1]))
+    if any(a.fill is not None for a in arrays):
+        indices = [":"] + indices
+    for i in indices:
+        if i == ":":
+            v1, v2, d1, d2 = (a.fill for a in arrays + defaults)
+        else:
+            v1, v2, d1, d2 = (a.element(i) for a in arrays + defaults)
+        if (v1 is not None) and (v2 is not None):
+            if v1 != v2:
+                return False
+        elif v1 is not None:
+            if (d2 is None) or (v1 != d2):
+                return False
+        elif v2 is not None:
+            if (d1 is None) or (v2 != d1):
+                return False
+    return True
+
+
+def namelists_equal(nml1: "dict", nml2: "dict", get_defaults1, get_defaults2=None) -> "bool":
+    """
+    True if diff_namelist would find no difference between nml1 and nml2 (options not in
+    the defaults count as differences), stopping at the first difference. The defaults
+    are given as functions, called only if an option is set on one side only.
+    """
+    if nml1 == nml2:
+        return True
+    defaults = []
+
+    def get(side: "int") -> "dict":
+        if not defaults:
+            defaults.append(get_defaults1())
+            defaults.append(defaults[0] if get_defaults2 is None else get_defaults2())
+        return defaults[side]
+
+    for k in nml1.keys() | nml2.keys():
+        v1, v2 = nml1.get(k), nml2.get(k)
+        if isinstance(v1, FortranArray) or isinstance(v2, FortranArray):
+            if (v1 != v2) and not arrays_equal(v1, v2, get(0).get(k), get(1).get(k)):
+                return False
+        elif (v1 is not None) and (v2 is not None):
+            if v1 != v2:
+                return False
+        elif v1 is not None:
+            # nml2 uses its default
+            if (k not in get(1)) or (v1 != get(1)[k]):
+                return False
+        elif (k not in get(0)) or (v2 != get(0)[k]):
+            return False
+    return True
 
 
-def diff_eos(eos1: "dict", eos2: "dict", string1: "str", string2: "str", MESA_DIR="", vb=False):
-    # check the keys appearing in both
-    for k in eos1.keys() & eos2.keys():
-        compare_and_report(k, eos1, eos2, string1, string2, vb)
-    # check keys that are not in both and check if they are different than defaults
-    defaults = get_defaults("eos", MESA_DIR)
-    # keys in job1 but not job2
-    k1 = set(eos1.keys()).difference(set(eos2.keys()))
-    for k in k1:
-        compare_defaults_and_report(k, eos1, defaults, string1, string2, vb)
-    # keys in job2 but not job1
-    k2 = set(eos2.keys()).difference(set(eos1.keys()))
-    for k in k2:
-        compare_defaults_and_report(k, eos2, defaults, string2, string1, vb)
+# --------------do the diff individual namelists ---------------------------
 
 
-def diff_kap(kap1: "dict", kap2: "dict", string1: "str", string2: "str", MESA_DIR="", vb=False):
-    # check the keys appearing in both
-    for k in kap1.keys() & kap2.keys():
-        compare_and_report(k, kap1, kap2, string1, string2, vb)
-    # check keys that are not in both and check if they are different than defaults
-    defaults = get_defaults("kap", MESA_DIR)
-    # keys in job1 but not job2
-    k1 = set(kap1.keys()).difference(set(kap2.keys()))
-    for k in k1:
-        compare_defaults_and_report(k, kap1, defaults, string1, string2, vb)
-    # keys in job2 but not job1
-    k2 = set(kap2.keys()).difference(set(kap1.keys()))
-    for k in k2:
-        compare_defaults_and_report(k, kap2, defaults, string2, string1, vb)
+def diff_with_defaults(
+    namelist: "str", nml1: "dict", nml2: "dict", string1: "str", string2: "str", MESA_DIR="", vb=False, MESA_DIR2=""
+):
+    """
+    diff of two namelists of type namelist (e.g., controls) with the defaults from MESA_DIR,
+    or if MESA_DIR2 is given, nml2 comes from the (possibly different) MESA version in MESA_DIR2
+    """
+    if MESA_DIR2 == "":
+        diff_namelist(nml1, nml2, get_defaults(namelist, MESA_DIR), string1, string2, vb)
+    else:
+        from .defaults_delta import diff_across_versions
 
+        diff_across_versions(namelist, nml1, nml2, string1, string2, MESA_DIR, MESA_DIR2, vb)
 
-def diff_controls(controls1: "dict", controls2: "dict", string1: "str", string2: "str", MESA_DIR="", vb=False):
-    # check the keys appearing in both
-    for k in controls1.keys() & controls2.keys():
-        compare_and_report(k, controls1, controls2, string1, string2, vb)
-    # check keys that are not in both and check if they are different than defaults
-    defaults = get_defaults("controls", MESA_DIR)
-    # keys in controls1 but not controls2
-    k1 = set(controls1.keys()).difference(set(controls2.keys()))
-    for k in k1:
-        compare_defaults_and_report(k, controls1, defaults, string1, string2, vb)
-    # keys in controls2 but not controls1
-    k2 = set(controls2.keys()).difference(set(controls1.keys()))
-    for k in k2:
-        compare_defaults_and_report(k, controls2, defaults, string2, string1, vb)
 
+def equal_with_defaults(namelist: "str", nml1: "dict", nml2: "dict", MESA_DIR="", MESA_DIR2="") -> "bool":
+    """True if diff_with_defaults would find no difference, without printing anything"""
+    if MESA_DIR2 == "":
+        return namelists_equal(nml1, nml2, lambda: get_defaults(namelist, MESA_DIR))
+    from .defaults_delta import equal_across_versions
 
-def diff_pgstar(pgstar1: "dict", pgstar2: "dict", string1: "str", string2: "str", MESA_DIR="", vb=False):
-    # check the keys appearing in both
-    for k in pgstar1.keys() & pgstar2.keys():
-        compare_and_report(k, pgstar1, pgstar2, string1, string2, vb)
-    # check keys that are not in both and check if they are different than defaults
-    defaults = get_defaults("pgstar", MESA_DIR)
-    # keys in pgstar1 but not pgstar2
-    k1 = set(pgstar1.keys()).difference(set(pgstar2.keys()))
-    for k in k1:
-        compare_defaults_and_report(k, pgstar1, defaults, string1, string2, vb)
-    # keys in pgstar2 but not pgstar1
-    k2 = set(pgstar2.keys()).difference(set(pgstar1.keys()))
-    for k in k2:
-        compare_defaults_and_report(k, pgstar2, defaults, string2, string1, vb)
+    return equal_across_versions(namelist, nml1, nml2, MESA_DIR, MESA_DIR2)
 
 
-def diff_binary_job(job1: "dict", job2: "dict", string1: "str", string2: "str", MESA_DIR="", vb=False):
-    # check the keys appearing in both
-    for k in job1.keys() & job2.keys():
-        compare_and_report(k, job1, job2, string1, string2, vb)
-    # check keys that are not in both and check if they are different than defaults
-    defaults = get_defaults("binary_job", MESA_DIR)
-    # keys in job1 but not job2
-    k1 = set(job1.keys()).difference(set(job2.keys()))
-    for k in k1:
-        compare_defaults_and_report(k, job1, defaults, string1, string2, vb)
-    # keys in job2 but not job1
-    k2 = set(job2.keys()).difference(set(job1.keys()))
-    for k in k2:
-        compare_defaults_and_report(k, job2, defaults, string2, string1, vb)
+@profiled
+def diff_starjob(job1: "dict", job2: "dict", string1: "str", string2: "str", MESA_DIR="", vb=False, MESA_DIR2=""):
+    diff_with_defaults("star_job", job1, job2, string1, string2, MESA_DIR, vb, MESA_DIR2)
 
 
-def diff_binary_controls(controls1: "dict", controls2: "dict", string1: "str", string2: "str", MESA_DIR="", vb=False):
-    # check the keys appearing in both
-    for k in controls1.keys() & controls2.keys():
-        compare_and_report(k, controls1, controls2, string1, string2, vb)
-    # check keys that are not in both and check if they are different than defaults
-    defaults = get_defaults("binary_controls", MESA_DIR)
-    # keys in controls1 but not controls2
-    k1 = set(controls1.keys()).difference(set(controls2.keys()))
-    for k in k1:
-        compare_defaults_and_report(k, controls1, defaults, string1, string2, vb)
-    # keys in controls2 but not controls1
-    k2 = set(controls2.keys()).difference(set(controls1.keys()))
-    for k in k2:
-        compare_defaults_and_report(k, controls2, defaults, string2, string1, vb)
+@profiled
+def diff_eos(eos1: "dict", eos2: "dict", string1: "str", string2: "str", MESA_DIR="", vb=False, MESA_DIR2=""):
+    diff_with_defaults("eos", eos1, eos2, string1, string2, MESA_DIR, vb, MESA_DIR2)
+
+
+@profiled
+def diff_kap(kap1: "dict", kap2: "dict", string1: "str", string2: "str", MESA_DIR="", vb=False, MESA_DIR2=""):
+    diff_with_defaults("kap", kap1, kap2, string1, string2, MESA_DIR, vb, MESA_DIR2)
+
+
+@profiled
+def diff_controls(
+    controls1: "dict", controls2: "dict", string1: "str", string2: "str", MESA_DIR="", vb=False, MESA_DIR2=""
+):
+    diff_with_defaults("controls", controls1, controls2, string1, string2, MESA_DIR, vb, MESA_DIR2)
+
+
+@profiled
+def diff_pgstar(pgstar1: "dict", pgstar2: "dict", string1: "str", string2: "str", MESA_DIR="", vb=False, MESA_DIR2=""):
+    diff_with_defaults("pgstar", pgstar1, pgstar2, string1, string2, MESA_DIR, vb, MESA_DIR2)
+
+
+@profiled
+def diff_binary_job(job1: "dict", job2: "dict", string1: "str", string2: "str", MESA_DIR="", vb=False, MESA_DIR2=""):
+    diff_with_defaults("binary_job", job1, job2, string1, string2, MESA_DIR, vb, MESA_DIR2)
+
+
+@profiled
+def diff_binary_controls(
+    controls1: "dict", controls2: "dict", string1: "str", string2: "str", MESA_DIR="", vb=False, MESA_DIR2=""
+):
+    diff_with_defaults("binary_controls", controls1, controls2, string1, string2, MESA_DIR, vb, MESA_DIR2)
 
 
 # ----------- do the diff of the whole inlists ----------------------------
 
 
-def diff_inlists(inlist1: "str", inlist2: "str", do_pgstar=False, MESA_DIR="", vb=False):
+@profiled
+def diff_inlists(inlist1: "str", inlist2: "str", do_pgstar=False, MESA_DIR="", vb=False, MESA_DIR2=""):
     """
     Takes the path of two inlists and compares them taking care of
     comments and missing entries set to default.
     Prints a pretty diff of the inlists, or nothing if they are the same (unless vb=True).
     Will ignore order, comments, and empty lines. Works for single stars and binaries.
+    If MESA_DIR2 is given, inlist2 is for the MESA version in MESA_DIR2.
     """
     if MESA_DIR == "":
         MESA_DIR = get_MESA_DIR()
@@ -504,26 +896,26 @@ def diff_inlists(inlist1: "str", inlist2: "str", do_pgstar=False, MESA_DIR="", v
         if is_binary1 == False:
             print("")
             print("&star_job")
-            diff_starjob(job1, job2, name1, name2, MESA_DIR, vb)
+            diff_starjob(job1, job2, name1, name2, MESA_DIR, vb, MESA_DIR2)
             print("/ !end star_job namelist")
         else:
             print("")
             print("&binary_job")
-            diff_binary_job(job1, job2, name1, name2, MESA_DIR, vb)
+            diff_binary_job(job1, job2, name1, name2, MESA_DIR, vb, MESA_DIR2)
             print("/ !end binary_job namelist")
     ## check eos
     eos1 = get_eos_namelist(inlist1)
     eos2 = get_eos_namelist(inlist2)
     print("")
     print("&eos")
-    diff_eos(eos1, eos2, name1, name2, MESA_DIR, vb)
+    diff_eos(eos1, eos2, name1, name2, MESA_DIR, vb, MESA_DIR2)
     print("/ !end eos namelist")
     ## check kap
     kap1 = get_kap_namelist(inlist1)
     kap2 = get_kap_namelist(inlist2)
     print("")
     print("&kap")
-    diff_kap(kap1, kap2, name1, name2, MESA_DIR, vb)
+    diff_kap(kap1, kap2, name1, name2, MESA_DIR, vb, MESA_DIR2)
     print("/ !end kap namelist")
     ## check controls
     controls1, is_binary1 = get_controls_namelist(inlist1)
@@ -542,6 +934,7 @@ def diff_inlists(inlist1: "str", inlist2: "str", do_pgstar=False, MESA_DIR="", v
                 name2,
                 MESA_DIR,
                 vb,
+                MESA_DIR2,
             )
         else:
             print("")
@@ -553,6 +946,7 @@ def diff_inlists(inlist1: "str", inlist2: "str", do_pgstar=False, MESA_DIR="", v
                 name2,
                 MESA_DIR,
                 vb,
+                MESA_DIR2,
             )
     print("/ !end controls namelist")
     if do_pgstar:
@@ -562,67 +956,95 @@ def diff_inlists(inlist1: "str", inlist2: "str", do_pgstar=False, MESA_DIR="", v
         print("&pgstar")
         pgstar1 = get_pgstar_namelist(inlist1)
         pgstar2 = get_pgstar_namelist(inlist2)
-        diff_pgstar(pgstar1, pgstar2, name1, name2, MESA_DIR, vb)
+        diff_pgstar(pgstar1, pgstar2, name1, name2, MESA_DIR, vb, MESA_DIR2)
         print("/ !end pgstar")
 
 
 # # ----------------- for testing on the MESA test_suite -------------------------------
 
 
-def test_diff_inlists(outfile="", MESA_DIR=""):
+def test_diff_inlists(outfile="", MESA_DIR="", shard="0/1"):
     """
-    Run all possible pairs of inlists from the test_suite as a test
+    Run all possible pairs of inlists from the test_suite as a test,
+    without asking anything. Records of each pair are appended to outfile
+    (if given), which is also used to resume. See regression.py for sharding and
+    merging the results from several machines. Returns the number of failed pairs.
     """
-    import time
+    from .regression import run_regression
 
-    failed = 0
-    go_on = input("Do you want to do this very long test? [Y/y]")
-    if go_on == "Y" or go_on == "y":
-        t_start = time.time()
-        import glob
-        import itertools
-
-        if MESA_DIR == "":
-            MESA_DIR = get_MESA_DIR()
-        inlists_single = glob.glob(MESA_DIR + "/star/test_suite/*/inlist*")
-        inlists_binary = glob.glob(MESA_DIR + "/binary/test_suite/*/inlist*")
-        inlists = list(set().union(inlists_binary, inlists_single))
-        print(inlists)
-        input("go on?")
-        # this below could be parallelized
-        for pair in itertools.combinations_with_replacement(inlists, 2):
-            inlist1 = pair[0]
-            inlist2 = pair[1]
-            try:
-                diff_inlists(inlist1, inlist2, do_pgstar=True)
-            except:
-                print(colored("FAILED: " + inlist1 + " " + inlist2, "yellow"))
-                if outfile != "":
-                    with open(outfile, "a") as F:
-                        F.writelines("FAILED: " + inlist1 + " " + inlist2 + "\n")
-                failed += 1
-        t_end = time.time()
-    else:
-        t_start = 0
-        t_end = 0
-        print("If you don't try nothing fails...that's perfect!")
-    print("...test took", t_end - t_start, "seconds")
-    return failed
+    if outfile == "":
+        outfile = os.devnull
+    return run_regression(outfile, shard=shard, MESA_DIR=MESA_DIR)
 
 
 # command line wrapper
 @click.command(context_settings={"ignore_unknown_options": True})
-@click.argument("inlist1", nargs=1, type=click.Path(exists=True))
-@click.argument("inlist2", nargs=1, type=click.Path(exists=True))
+@click.argument("inlist1", nargs=1, type=ExistingPath(), required=False)
+@click.argument("inlist2", nargs=1, type=ExistingPath(), required=False)
 @click.option("--pgstar", default=False, help="Show also diff of pgstar namelists.")
 @click.option(
     "--mesa_dir",
     default="",
     help="use customized location of $MESA_DIR. Will use environment variable if empty and return an error if empty.",
 )
+@click.option(
+    "--mesa_dir2",
+    default="",
+    help="$MESA_DIR of the MESA version of INLIST2, if different from --mesa_dir.",
+)
 @click.option("--vb", default=False, help="Show also matching lines using green.")
-def compare_inlists(inlist1: str, inlist2: str, pgstar: bool, mesa_dir: str, vb: bool):
-    diff_inlists(inlist1, inlist2, do_pgstar=pgstar, MESA_DIR=mesa_dir, vb=vb)
+@click.option(
+    "--batch",
+    default="",
+    help="Compare the pairs of inlists or work directories listed one pair per line in this file (- for stdin).",
+)
+@click.option("--jobs", default=1, help="Number of worker processes to use with --batch.")
+@click.option("--profile", is_flag=True, help="Print the time spent in each stage and other counters at the end.")
+@click.option("--profile_json", default="", help="Save the time spent in each stage and other counters in this file.")
+@click.option(
+    "--quiet",
+    is_flag=True,
+    help="Print nothing, exit with 0 if the same, 1 as soon as a difference is found, 2 if they can't be compared.",
+)
+@report_errors
+def compare_inlists(
+    inlist1: str,
+    inlist2: str,
+    pgstar: bool,
+    mesa_dir: str,
+    mesa_dir2: str,
+    vb: bool,
+    batch: str,
+    jobs: int,
+    profile: bool,
+    profile_json: str,
+    quiet: bool,
+):
+    if (batch == "") and ((inlist1 is None) or (inlist2 is None)):
+        raise click.UsageError("Need INLIST1 and INLIST2, or --batch")
+    if quiet:
+        from .batch_compare import read_pairs
+        from .compare_all_workdir_inlists import quiet_exit_status
+
+        malformed = []
+        pairs = read_pairs(batch, malformed=malformed) if batch != "" else [(inlist1, inlist2)]
+        if malformed:
+            # lines that are not pairs can't be compared
+            sys.exit(2)
+        sys.exit(quiet_exit_status(pairs, do_pgstar=pgstar, MESA_DIR=mesa_dir, MESA_DIR2=mesa_dir2))
+    if profile or (profile_json != ""):
+        prof = profiling(json_file=profile_json, summary=profile)
+    else:
+        prof = contextlib.nullcontext()
+    with prof:
+        if batch != "":
+            from .batch_compare import compare_batch
+
+            failed = compare_batch(batch, do_pgstar=pgstar, MESA_DIR=mesa_dir, vb=vb, jobs=jobs, MESA_DIR2=mesa_dir2)
+        else:
+            diff_inlists(inlist1, inlist2, do_pgstar=pgstar, MESA_DIR=mesa_dir, vb=vb, MESA_DIR2=mesa_dir2)
+            failed = 0
+    sys.exit(1 if failed else 0)
 
 
 if __name__ == "__main__":
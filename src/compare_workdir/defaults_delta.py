@@ -0,0 +1,214 @@
+#!/usr/bin/python3
+# author: Mathieu Renzo
+
+# Author: Mathieu Renzo <mathren90@gmail.com>
+# Keywords: files
+
+# Copyright (C) 2019-2021 Mathieu Renzo
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or (at
+# your option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see http://www.gnu.org/licenses/.
+
+
+# Differences between the defaults of two MESA versions (changed default
+# values, options removed, added, or renamed), to compare inlists and work
+# directories for different MESA versions. The delta is computed once
+# per pair of versions and namelist, and reused for all the comparisons.
+
+# pip install -U termcolor
+from termcolor import colored
+
+# pip install -U click
+import click
+
+from .compare_inlists import (
+    DEFAULTS_FILES,
+    get_MESA_DIR,
+    get_mesa_version,
+    get_defaults,
+    get_option,
+    iter_options,
+    diff_namelist,
+    namelists_equal,
+    FortranArray,
+)
+from .validate_inlists import build_trigram_index, nearest_keys
+from .errors import report_errors
+
+# (namelist, MESA_DIR1, MESA_DIR2) -> delta
+_delta_cache = {}
+# (namelist, MESA_DIR1, MESA_DIR2) -> defaults of MESA_DIR1 with the new names of the renamed options
+_renamed_defaults_cache = {}
+
+
+def get_defaults_delta(namelist: "str", MESA_DIR1: "str", MESA_DIR2: "str") -> "dict":
+    """
+    returns the differences between the defaults of namelist in MESA_DIR1 and MESA_DIR2 as a dictionary with
+    changed: {option: (default 1, default 2)} (array elements as x_ctrl(1), or x_ctrl(:) for all of them),
+    removed: options only in MESA_DIR1, added: options only in MESA_DIR2,
+    renamed: {old option: new option} guessed from the removed and added options with similar names.
+    The result is cached and shared: do not modify it.
+    """
+    key = (namelist, MESA_DIR1, MESA_DIR2)
+    if key in _delta_cache:
+        return _delta_cache[key]
+    defaults1 = get_defaults(namelist, MESA_DIR1)
+    defaults2 = get_defaults(namelist, MESA_DIR2)
+    removed = set(defaults1.keys() - defaults2.keys())
+    added = set(defaults2.keys() - defaults1.keys())
+    renamed = {}
+    if removed and added:
+        index = build_trigram_index(added)
+        for old in sorted(removed):
+            new = nearest_keys(old, index, n=1, cutoff=0.8)
+            if new and new[0] in added:
+                renamed[old] = new[0]
+                added.discard(new[0])
+        removed.difference_update(renamed)
+    flat1 = dict(iter_options({k: v for k, v in defaults1.items() if k in defaults2}))
+    flat2 = dict(iter_options({k: v for k, v in defaults2.items() if k in defaults1}))
+    changed = {}
+    for k in flat1.keys() | flat2.keys():
+        v1 = flat1.get(k, get_option(defaults1, k))
+        v2 = flat2.get(k, get_option(defaults2, k))
+        if v1 != v2:
+            changed[k] = (v1, v2)
+    delta = {"changed": changed, "removed": sorted(removed), "added": sorted(added), "renamed": renamed}
+    _delta_cache[key] = delta
+    return delta
+
+
+def renamed_defaults(namelist: "str", MESA_DIR1: "str", MESA_DIR2: "str") -> "dict":
+    """
+    defaults of namelist in MESA_DIR1 with the renamed options under their name in MESA_DIR2,
+    to compare with namelists whose options were renamed the same way.
+    The result is cached and shared: do not modify it.
+    """
+    key = (namelist, MESA_DIR1, MESA_DIR2)
+    if key in _renamed_defaults_cache:
+        return _renamed_defaults_cache[key]
+    defaults1 = get_defaults(namelist, MESA_DIR1)
+    renamed = get_defaults_delta(namelist, MESA_DIR1, MESA_DIR2)["renamed"]
+    if renamed:
+        defaults1 = {renamed.get(k, k): v for k, v in defaults1.items()}
+    _renamed_defaults_cache[key] = defaults1
+    return defaults1
+
+
+def warm_defaults_delta(MESA_DIR1: "str", MESA_DIR2: "str"):
+    """computes the deltas of all the namelists (e.g., before forking worker processes)"""
+    if MESA_DIR1 == "":
+        MESA_DIR1 = get_MESA_DIR()
+    for namelist in DEFAULTS_FILES:
+        renamed_defaults(namelist, MESA_DIR1, MESA_DIR2)
+
+
+def is_set(namelist: "dict", option_name: "str") -> "bool":
+    """True if option_name (possibly an array element, or name(:) for the whole array) is set in namelist"""
+    name, _, index = option_name.partition("(")
+    if index == ":)":
+        return isinstance(namelist.get(name), FortranArray) and namelist[name].fill is not None
+    return get_option(namelist, option_name) is not None
+
+
+def diff_across_versions(
+    namelist: "str", nml1: "dict", nml2: "dict", string1: "str", string2: "str", MESA_DIR1="", MESA_DIR2="", vb=False
+):
+    """
+    prints the differences between nml1 for the MESA version in MESA_DIR1 and nml2 for the one in MESA_DIR2:
+    options set only on one side are compared with the defaults of the other version, renamed options are
+    compared with their new name, and changed defaults of options not set on either side are reported too.
+    """
+    if MESA_DIR1 == "":
+        MESA_DIR1 = get_MESA_DIR()
+    delta = get_defaults_delta(namelist, MESA_DIR1, MESA_DIR2)
+    renamed = delta["renamed"]
+    version2 = get_mesa_version(MESA_DIR2)
+    for old in sorted(renamed.keys() & nml1.keys()):
+        print(colored(f"{string1:<30}\t{old} is {renamed[old]} in {version2}", "yellow"))
+    for old in sorted(renamed.keys() & nml2.keys()):
+        # MESA would not read this, but it's clear what was meant
+        print(colored(f"{string2:<30}\t{old} is not in {version2}, compared as {renamed[old]}", "yellow"))
+    nml1 = {renamed.get(k, k): v for k, v in nml1.items()}
+    nml2 = {renamed.get(k, k): v for k, v in nml2.items()}
+    diff_namelist(
+        nml1,
+        nml2,
+        renamed_defaults(namelist, MESA_DIR1, MESA_DIR2),
+        string1,
+        string2,
+        vb,
+        defaults2=get_defaults(namelist, MESA_DIR2),
+    )
+    # not set on either side, but the two versions use different defaults
+    default1 = string1.split(":")[0] + ": default"
+    default2 = string2.split(":")[0] + ": default"
+    for k in sorted(delta["changed"]):
+        if is_set(nml1, k) or is_set(nml2, k):
+            continue
+        v1, v2 = delta["changed"][k]
+        print(colored(f"{default1:<30}\t{k}={str(v1):<45}", "red"))
+        print(colored(f"{default2:<30}\t{k}={str(v2):<45}", "red"))
+        print("")
+
+
+def equal_across_versions(namelist: "str", nml1: "dict", nml2: "dict", MESA_DIR1="", MESA_DIR2="") -> "bool":
+    """True if diff_across_versions would find no difference, stopping at the first one"""
+    if MESA_DIR1 == "":
+        MESA_DIR1 = get_MESA_DIR()
+    delta = get_defaults_delta(namelist, MESA_DIR1, MESA_DIR2)
+    renamed = delta["renamed"]
+    nml1 = {renamed.get(k, k): v for k, v in nml1.items()}
+    nml2 = {renamed.get(k, k): v for k, v in nml2.items()}
+    if not namelists_equal(
+        nml1,
+        nml2,
+        lambda: renamed_defaults(namelist, MESA_DIR1, MESA_DIR2),
+        lambda: get_defaults(namelist, MESA_DIR2),
+    ):
+        return False
+    return all(is_set(nml1, k) or is_set(nml2, k) for k in delta["changed"])
+
+
+def print_defaults_delta(MESA_DIR1: "str", MESA_DIR2: "str"):
+    """prints the changes in the defaults of all namelists between MESA_DIR1 and MESA_DIR2"""
+    version1 = get_mesa_version(MESA_DIR1)
+    version2 = get_mesa_version(MESA_DIR2)
+    for namelist in DEFAULTS_FILES:
+        delta = get_defaults_delta(namelist, MESA_DIR1, MESA_DIR2)
+        print("")
+        print("&" + namelist)
+        for old, new in sorted(delta["renamed"].items()):
+            print(colored(f"renamed\t{old} -> {new}", "yellow"))
+        for k in delta["removed"]:
+            print(colored(f"removed\t{k}", "yellow"))
+        for k in delta["added"]:
+            print(colored(f"added\t{k}", "yellow"))
+        for k in sorted(delta["changed"]):
+            v1, v2 = delta["changed"][k]
+            print(colored(f"{version1:<30}\t{k}={str(v1):<45}", "red"))
+            print(colored(f"{version2:<30}\t{k}={str(v2):<45}", "red"))
+        print("/ !end " + namelist + " namelist")
+
+
+# command line wrapper
+@click.command(context_settings={"ignore_unknown_options": True})
+@click.argument("mesa_dir1", nargs=1, type=click.Path(exists=True))
+@click.argument("mesa_dir2", nargs=1, type=click.Path(exists=True))
+@report_errors
+def compare_mesa_defaults(mesa_dir1, mesa_dir2):
+    print_defaults_delta(mesa_dir1, mesa_dir2)
+
+
+if __name__ == "__main__":
+    compare_mesa_defaults()
@@ -0,0 +1,132 @@
+#!/usr/bin/python3
+# author: Mathieu Renzo
+
+# Author: Mathieu Renzo <mathren90@gmail.com>
+# Keywords: files
+
+# Copyright (C) 2019-2021 Mathieu Renzo
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or (at
+# your option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see http://www.gnu.org/licenses/.
+
+
+# Save the defaults of all the namelists of a MESA installation in a
+# single compressed file, which can be used instead of $MESA_DIR (e.g.,
+# --mesa_dir defaults_r24.03.1.json.gz) where MESA is not installed.
+# Loading it is a single file read.
+
+import os
+import gzip
+import json
+
+# pip install -U termcolor
+from termcolor import colored
+
+# pip install -U click
+import click
+
+from .compare_inlists import DEFAULTS_FILES, FortranArray, get_MESA_DIR, get_mesa_version, get_defaults
+from .profiling import count
+from .errors import BadSnapshot, report_errors
+
+# increase when the content of the snapshots changes
+SNAPSHOT_FORMAT = 1
+
+# path -> ((mtime, size), snapshot)
+_snapshot_cache = {}
+
+
+def encode_value(val):
+    """values of the defaults as JSON, arrays as [fill, [[index, value], ...]]"""
+    if isinstance(val, FortranArray):
+        return [val.fill, [[i, v] for i, v in sorted(val.items())]]
+    return val
+
+
+def decode_value(val):
+    if isinstance(val, list):
+        return FortranArray(((i, v) for i, v in val[1]), fill=val[0])
+    return val
+
+
+def write_defaults_snapshot(outfile: "str", MESA_DIR="") -> "list":
+    """writes the defaults of all the namelists found in MESA_DIR to outfile, returns the namelists written"""
+    if MESA_DIR == "":
+        MESA_DIR = get_MESA_DIR()
+    namelists = {}
+    for namelist, fname in DEFAULTS_FILES.items():
+        # e.g. no eos and kap namelists before MESA r15140
+        if os.path.isfile(os.path.join(MESA_DIR, fname)):
+            defaults = get_defaults(namelist, MESA_DIR)
+            namelists[namelist] = {k: encode_value(v) for k, v in defaults.items()}
+    snapshot = {
+        "format": SNAPSHOT_FORMAT,
+        "mesa_version": get_mesa_version(MESA_DIR),
+        "namelists": namelists,
+    }
+    with gzip.open(outfile, "wt") as F:
+        json.dump(snapshot, F, separators=(",", ":"))
+    return list(namelists)
+
+
+def load_defaults_snapshot(path: "str") -> "dict":
+    """
+    returns the snapshot in path as a dictionary with the mesa_version and the namelists,
+    each a dictionary as returned by get_defaults. Cached until the file changes: do not modify it.
+    """
+    st = os.stat(path)
+    cached = _snapshot_cache.get(path)
+    if cached is not None and cached[0] == (st.st_mtime_ns, st.st_size):
+        return cached[1]
+    count("files opened")
+    try:
+        with gzip.open(path, "rt") as F:
+            snapshot = json.load(F)
+        snapshot_format = snapshot.get("format")
+    except (OSError, EOFError, ValueError, AttributeError) as e:
+        # not gzip, truncated, not JSON, or not a dictionary
+        raise BadSnapshot(f"{path} is not a defaults snapshot ({type(e).__name__}: {e})")
+    if snapshot_format != SNAPSHOT_FORMAT:
+        raise BadSnapshot(
+            f"{path} is a defaults snapshot in format {snapshot_format}, "
+            f"this version reads format {SNAPSHOT_FORMAT}: write it again with snapshot_mesa_defaults"
+        )
+    try:
+        snapshot["namelists"] = {
+            namelist: {k: decode_value(v) for k, v in defaults.items()}
+            for namelist, defaults in snapshot["namelists"].items()
+        }
+        if "mesa_version" not in snapshot:
+            raise KeyError("mesa_version")
+    except (KeyError, TypeError, AttributeError, IndexError) as e:
+        raise BadSnapshot(f"{path} is not a valid defaults snapshot ({type(e).__name__}: {e})")
+    _snapshot_cache[path] = ((st.st_mtime_ns, st.st_size), snapshot)
+    return snapshot
+
+
+# command line wrapper
+@click.command(context_settings={"ignore_unknown_options": True})
+@click.argument("outfile", nargs=1)
+@click.option(
+    "--mesa_dir",
+    default="",
+    help="use customized location of $MESA_DIR. Will use environment variable if empty and return an error if empty.",
+)
+@report_errors
+def snapshot_mesa_defaults(outfile, mesa_dir):
+    namelists = write_defaults_snapshot(outfile, MESA_DIR=mesa_dir)
+    print(colored(f"written the defaults of {', '.join(namelists)} to {outfile}", "blue"))
+
+
+if __name__ == "__main__":
+    snapshot_mesa_defaults()
@@ -0,0 +1,312 @@
+#!/usr/bin/python3
+# author: Mathieu Renzo
+
+# Author: Mathieu Renzo <mathren90@gmail.com>
+# Keywords: files
+
+# Copyright (C) 2019-2021 Mathieu Renzo
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or (at
+# your option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see http://www.gnu.org/licenses/.
+
+
+# Differences between two inlists or work directories as data, i.e. the
+# options (not set to their default) with different values, cached on
+# disk by the fingerprints of both configurations and the MESA version
+# (packed with serialize.py). The fingerprint of each path is cached too,
+# with the stamps of the inlists read to compute it, so comparing again a
+# pair in which nothing changed (e.g., the nightly runs of a regression
+# dashboard) only checks the stamps and reads the result.
+
+import os
+import json
+import hashlib
+import tempfile
+
+# pip install -U termcolor
+from termcolor import colored
+
+# pip install -U click
+import click
+
+from .compare_inlists import get_MESA_DIR, get_mesa_version, get_defaults
+from .compare_all_workdir_inlists import resolve_path, defaults_name
+from .fingerprint import path_fingerprints, canonical_options, canonical_value, option_default
+from .cluster_inlists import path_options, different_options
+from .defaults_delta import get_defaults_delta, renamed_defaults
+from .serialize import pack_configurations, unpack_configurations
+from .file_access import ExistingPath, file_key, file_stamp
+from .errors import report_errors
+
+# bump when the content of the cached results changes
+CACHE_FORMAT = 4
+CACHE_SUFFIX = ".pack"
+
+# cache_dir -> number of entries (at least those written by this process since it was last pruned)
+_entry_counts = {}
+
+
+# ------------------------- the cache ----------------------------------
+
+
+def default_cache_dir() -> "str":
+    cache_home = os.environ.get("XDG_CACHE_HOME", os.path.join(os.path.expanduser("~"), ".cache"))
+    return os.path.join(cache_home, "compare_workdir", "diffs")
+
+
+def diff_key(fingerprint1: "str", fingerprint2: "str", mesa_version: "str", do_pgstar: "bool") -> "str":
+    """name of the cached result for a pair of configurations"""
+    key = f"{CACHE_FORMAT}\n{fingerprint1}\n{fingerprint2}\n{mesa_version}\n{do_pgstar}"
+    return hashlib.sha256(key.encode()).hexdigest()
+
+
+def fingerprint_key(path: "str", mesa_version: "str", do_pgstar: "bool") -> "str":
+    """name of the cached fingerprint of path"""
+    key = f"{CACHE_FORMAT}\nfingerprint\n{file_key(path)}\n{mesa_version}\n{do_pgstar}"
+    return hashlib.sha256(key.encode()).hexdigest()
+
+
+def read_entry(cache_dir: "str", key: "str"):
+    """the configurations saved for key (without the header), or None"""
+    path = os.path.join(cache_dir, key + CACHE_SUFFIX)
+    try:
+        with open(path, "rb") as F:
+            header, *configurations = unpack_configurations(F.read())
+        # mark it as recently used, see prune_cache
+        os.utime(path)
+    except (OSError, ValueError):
+        # missing, or removed by someone else pruning
+        return None
+    if header.get("format") != CACHE_FORMAT:
+        return None
+    return configurations
+
+
+def write_entry(cache_dir: "str", key: "str", configurations: "list", max_entries=1000):
+    """saves configurations for key, removing the least recently used entries beyond max_entries"""
+    os.makedirs(cache_dir, exist_ok=True)
+    # write and rename, so that concurrent readers never see half a file
+    fd, tmp = tempfile.mkstemp(dir=cache_dir, suffix=".tmp")
+    with os.fdopen(fd, "wb") as F:
+        F.write(pack_configurations([{"format": CACHE_FORMAT}] + configurations))
+    os.replace(tmp, os.path.join(cache_dir, key + CACHE_SUFFIX))
+    # list the folder only when it may have too many entries
+    n = _entry_counts.get(cache_dir)
+    if n is None or n >= max_entries:
+        prune_cache(cache_dir, max_entries)
+    else:
+        _entry_counts[cache_dir] = n + 1
+
+
+def read_cached(cache_dir: "str", key: "str"):
+    """the cached differences for key, or None"""
+    cached = read_entry(cache_dir, key)
+    if cached is None or len(cached) != 2:
+        return None
+    values1, values2 = cached
+    return [[o, values1[o], values2[o]] for o in values1]
+
+
+def write_cached(cache_dir: "str", key: "str", differences: "list", max_entries=1000):
+    """saves differences for key"""
+    # the values in path1 and in path2, by option
+    values1 = {o: v1 for o, v1, v2 in differences}
+    values2 = {o: v2 for o, v1, v2 in differences}
+    write_entry(cache_dir, key, [values1, values2], max_entries=max_entries)
+
+
+def _mtime(entry) -> "float":
+    try:
+        return entry.stat().st_mtime
+    except FileNotFoundError:
+        return 0.0
+
+
+def prune_cache(cache_dir: "str", max_entries=1000):
+    """removes the least recently used entries if there are more than max_entries"""
+    entries, old = [], []
+    for e in os.scandir(cache_dir):
+        if e.name.endswith(CACHE_SUFFIX):
+            entries.append(e)
+        elif e.name.endswith(".json"):
+            # results of CACHE_FORMAT 1, never read again
+            old.append(e)
+    remove = old
+    if len(entries) > max_entries:
+        entries.sort(key=_mtime)
+        remove = old + entries[: len(entries) - max_entries]
+    for e in remove:
+        try:
+            os.remove(e.path)
+        except FileNotFoundError:
+            # removed by someone else pruning at the same time
+            pass
+    _entry_counts[cache_dir] = min(len(entries), max_entries)
+
+
+def cached_fingerprint(path: "str", do_pgstar=False, MESA_DIR="", cache_dir="", max_entries=1000) -> "str":
+    """
+    fingerprint of the inlist or work directory path (see fingerprint.py), read from cache_dir
+    if none of the inlists read to compute it changed since then
+    """
+    mesa_version = get_mesa_version(MESA_DIR)
+    key = fingerprint_key(path, mesa_version, do_pgstar)
+    cached = read_entry(cache_dir, key)
+    if cached is not None and len(cached) == 2:
+        fingerprint, stamps = cached
+        try:
+            if all(repr(file_stamp(inlist)) == stamp for inlist, stamp in stamps.items()):
+                return fingerprint["fingerprint"]
+        except FileNotFoundError:
+            pass
+    chain = []
+    fingerprint = path_fingerprints(path, do_pgstar=do_pgstar, MESA_DIR=MESA_DIR, chain=chain)[0]
+    stamps = {}
+    for inlist, namelist in chain:
+        inlist = file_key(inlist)
+        if inlist not in stamps:
+            stamps[inlist] = repr(file_stamp(inlist))
+    write_entry(cache_dir, key, [{"fingerprint": fingerprint}, stamps], max_entries=max_entries)
+    return fingerprint
+
+
+# ------------------------- the differences ----------------------------------
+
+
+def diff_across_versions(path1: "str", path2: "str", do_pgstar=False, MESA_DIR="", MESA_DIR2="") -> "list":
+    """
+    the differences of structured_diff between path1 for the MESA version in MESA_DIR and path2 for the
+    one in MESA_DIR2, as defaults_delta.diff_across_versions finds them: options set on one side only are
+    compared with the defaults of the other version, renamed options with their new name, and the options
+    not set on either side whose default changed are listed with the two default values
+    """
+    namelists1 = resolve_path(path1, do_pgstar=do_pgstar, MESA_DIR=MESA_DIR)
+    namelists2 = resolve_path(path2, do_pgstar=do_pgstar, MESA_DIR=MESA_DIR2)
+    differences = []
+    for section in namelists1.keys() | namelists2.keys():
+        name = section.split("/")[-1]
+        if defaults_name(section) == name:
+            delta = get_defaults_delta(name, MESA_DIR, MESA_DIR2)
+            defaults1 = renamed_defaults(name, MESA_DIR, MESA_DIR2)
+            defaults2 = get_defaults(name, MESA_DIR2)
+        else:
+            # there are no separate defaults for binary_pgstar
+            delta = {"changed": {}, "renamed": {}}
+            defaults1 = defaults2 = {}
+        # with the new names also on side 2: MESA would not read the old ones, but it's clear what was meant
+        nml1 = {delta["renamed"].get(k, k): v for k, v in namelists1.get(section, {}).items()}
+        nml2 = {delta["renamed"].get(k, k): v for k, v in namelists2.get(section, {}).items()}
+        options1 = dict(o.partition("=")[::2] for o in canonical_options(nml1, defaults1))
+        options2 = dict(o.partition("=")[::2] for o in canonical_options(nml2, defaults2))
+        for k in options1.keys() | options2.keys() | delta["changed"].keys():
+            default1 = option_default(defaults1, k)
+            default2 = option_default(defaults2, k)
+            value1 = options1.get(k, None if default1 is None else canonical_value(default1))
+            value2 = options2.get(k, None if default2 is None else canonical_value(default2))
+            if value1 == value2:
+                continue
+            if k in options1 or k in options2:
+                # None for the side using its default, as in structured_diff
+                value1, value2 = options1.get(k), options2.get(k)
+            differences.append([f"{section}/{k}", value1, value2])
+    return sorted(differences)
+
+
+def structured_diff(
+    path1: "str", path2: "str", do_pgstar=False, MESA_DIR="", cache_dir="", max_entries=1000, MESA_DIR2=""
+):
+    """
+    returns the sorted list of [namelist/option, value in path1, value in path2] for the options with
+    different values in the inlists or work directories path1 and path2 (None for options not set or
+    set to their default). Results are cached in cache_dir (see default_cache_dir), unless it is None.
+    If MESA_DIR2 is given, path2 is for the MESA version in MESA_DIR2 (see diff_across_versions).
+    """
+    if MESA_DIR == "":
+        MESA_DIR = get_MESA_DIR()
+    if MESA_DIR2 == "":
+        MESA_DIR2 = MESA_DIR
+    if cache_dir is None:
+        fingerprint1 = path_fingerprints(path1, do_pgstar=do_pgstar, MESA_DIR=MESA_DIR)[0]
+        fingerprint2 = path_fingerprints(path2, do_pgstar=do_pgstar, MESA_DIR=MESA_DIR2)[0]
+    else:
+        cache_dir = cache_dir if cache_dir != "" else default_cache_dir()
+        fingerprint1, fingerprint2 = (
+            cached_fingerprint(
+                path, do_pgstar=do_pgstar, MESA_DIR=mesa_dir, cache_dir=cache_dir, max_entries=max_entries
+            )
+            for path, mesa_dir in ((path1, MESA_DIR), (path2, MESA_DIR2))
+        )
+    # the same options can differ across versions, through their defaults
+    if fingerprint1 == fingerprint2 and MESA_DIR2 == MESA_DIR:
+        return []
+    if cache_dir is not None:
+        mesa_version = get_mesa_version(MESA_DIR)
+        if MESA_DIR2 != MESA_DIR:
+            mesa_version += "\n" + get_mesa_version(MESA_DIR2)
+        key = diff_key(fingerprint1, fingerprint2, mesa_version, do_pgstar)
+        differences = read_cached(cache_dir, key)
+        if differences is not None:
+            return differences
+    if MESA_DIR2 != MESA_DIR:
+        differences = diff_across_versions(path1, path2, do_pgstar=do_pgstar, MESA_DIR=MESA_DIR, MESA_DIR2=MESA_DIR2)
+    else:
+        options1 = path_options(path1, do_pgstar=do_pgstar, MESA_DIR=MESA_DIR)
+        options2 = path_options(path2, do_pgstar=do_pgstar, MESA_DIR=MESA_DIR)
+        differences = [[o, options1.get(o), options2.get(o)] for o in different_options(options1, options2)]
+    if cache_dir is not None:
+        write_cached(cache_dir, key, differences, max_entries=max_entries)
+    return differences
+
+
+# command line wrapper
+@click.command(context_settings={"ignore_unknown_options": True})
+@click.argument("path1", nargs=1, type=ExistingPath())
+@click.argument("path2", nargs=1, type=ExistingPath())
+@click.option("--pgstar", default=False, help="Include the pgstar namelists.")
+@click.option("--json", "as_json", is_flag=True, help="Print the differences as JSON.")
+@click.option("--cache_dir", default="", help="Folder of the cached results (default ~/.cache/compare_workdir/diffs).")
+@click.option("--max_entries", default=1000, help="Maximum number of results kept in the cache.")
+@click.option("--no_cache", is_flag=True, help="Neither read nor save cached results.")
+@click.option(
+    "--mesa_dir",
+    default="",
+    help="use customized location of $MESA_DIR. Will use environment variable if empty and return an error if empty.",
+)
+@click.option(
+    "--mesa_dir2",
+    default="",
+    help="$MESA_DIR of the MESA version of PATH2, if different from --mesa_dir.",
+)
+@report_errors
+def cached_diff_inlists(path1, path2, pgstar, as_json, cache_dir, max_entries, no_cache, mesa_dir, mesa_dir2):
+    differences = structured_diff(
+        path1,
+        path2,
+        do_pgstar=pgstar,
+        MESA_DIR=mesa_dir,
+        cache_dir=None if no_cache else cache_dir,
+        max_entries=max_entries,
+        MESA_DIR2=mesa_dir2,
+    )
+    if as_json:
+        print(json.dumps(differences))
+        return
+    for option, value1, value2 in differences:
+        value1 = "default" if value1 is None else value1
+        value2 = "default" if value2 is None else value2
+        print(f"{option}: {value1} -> {value2}")
+    print(colored(f"{len(differences)} options differ", "blue"))
+
+
+if __name__ == "__main__":
+    cached_diff_inlists()
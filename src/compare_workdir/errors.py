@@ -0,0 +1,73 @@
+#!/usr/bin/python3
+# author: Mathieu Renzo
+
+# Author: Mathieu Renzo <mathren90@gmail.com>
+# Keywords: files
+
+# Copyright (C) 2019-2021 Mathieu Renzo
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or (at
+# your option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see http://www.gnu.org/licenses/.
+
+
+# Errors raised by the functions of this package, instead of exiting,
+# so that they can be used from notebooks and long running services.
+# The command line tools print them and exit with 1.
+
+import sys
+import functools
+
+# pip install -U termcolor
+from termcolor import colored
+
+
+class CompareWorkdirError(Exception):
+    """base class of the errors raised by compare_workdir"""
+
+
+class MESADirNotFound(CompareWorkdirError):
+    """no MESA_DIR given and $MESA_DIR not set"""
+
+
+class DefaultsNotFound(CompareWorkdirError):
+    """the defaults of a namelist are not in MESA_DIR (e.g., eos and kap before r15140)"""
+
+
+class BadSnapshot(CompareWorkdirError):
+    """a file given as MESA_DIR is not a defaults snapshot this version can read"""
+
+
+class InlistNotFound(CompareWorkdirError):
+    """a work directory has no inlist to start from"""
+
+
+class GitError(CompareWorkdirError):
+    """git is not available or the current directory is not in a git repository (for REV:path)"""
+
+
+class ArchiveError(CompareWorkdirError):
+    """a tar or zip archive can't be read"""
+
+
+def report_errors(func):
+    """decorator for the command line tools: print the error and exit with 1 instead of a traceback"""
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        try:
+            return func(*args, **kwargs)
+        except CompareWorkdirError as e:
+            print(colored(str(e), "yellow"))
+            sys.exit(1)
+
+    return wrapper
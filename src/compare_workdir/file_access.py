@@ -0,0 +1,375 @@
+#!/usr/bin/python3
+# author: Mathieu Renzo
+
+# Author: Mathieu Renzo <mathren90@gmail.com>
+# Keywords: files
+
+# Copyright (C) 2019-2021 Mathieu Renzo
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or (at
+# your option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see http://www.gnu.org/licenses/.
+
+
+# Access to the inlists, either files on disk or REV:path specs for files
+# in the git repository of the current directory, at any revision (e.g.
+# HEAD~3:work_dir/inlist), without checking them out. Git objects are
+# read through a single long-lived `git cat-file --batch` process.
+# Paths can also go through tar or zip archives (e.g. runs.tar.gz/run1/inlist),
+# which are read without extracting them.
+
+import os
+import tarfile
+import zipfile
+import threading
+import posixpath
+import contextlib
+import subprocess
+
+# pip install -U click
+import click
+
+from .errors import GitError, ArchiveError
+
+# ------------------------- git objects ----------------------------------
+
+
+class GitCatFile:
+    """a `git cat-file --batch` process for the repository in cwd, shared by all threads"""
+
+    def __init__(self, cwd: "str"):
+        try:
+            self.process = subprocess.Popen(
+                ["git", "cat-file", "--batch"],
+                cwd=cwd,
+                stdin=subprocess.PIPE,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.DEVNULL,
+            )
+        except OSError as e:
+            raise GitError(f"could not run git: {e}")
+        self.lock = threading.Lock()
+
+    def get(self, spec: "str"):
+        """returns (sha, type, content) of the object spec (e.g. HEAD:inlist), or None if it doesn't exist"""
+        with self.lock:
+            try:
+                self.process.stdin.write(spec.encode() + b"\n")
+                self.process.stdin.flush()
+                header = self.process.stdout.readline()
+            except BrokenPipeError:
+                header = b""
+            if header == b"":
+                raise GitError(f"git cat-file stopped reading {spec}, is {os.getcwd()} in a git repository?")
+            parts = header.split()
+            if len(parts) != 3:
+                # "<spec> missing" or "<spec> ambiguous"
+                return None
+            sha, kind, size = parts
+            content = self.process.stdout.read(int(size))
+            self.process.stdout.read(1)  # newline after the content
+        return sha.decode(), kind.decode(), content
+
+    def close(self):
+        self.process.stdin.close()
+        self.process.wait()
+
+
+_git_lock = threading.Lock()
+_git_processes = {}  # cwd -> GitCatFile
+_git_revisions = set()  # (cwd, revision) known to exist
+# spec -> object read in the current git_objects_cached block of each thread
+_git_scope = threading.local()
+
+
+def _forget_git_processes():
+    # a forked child must not share the pipes with the parent, it starts its own process if needed
+    _git_processes.clear()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_forget_git_processes)
+
+
+@contextlib.contextmanager
+def git_objects_cached():
+    """in the with block, each REV:path is read from git only once by this thread (e.g. for its stamp and content)"""
+    outer = getattr(_git_scope, "objects", None)
+    if outer is None:
+        _git_scope.objects = {}
+    try:
+        yield
+    finally:
+        if outer is None:
+            _git_scope.objects = None
+
+
+def normalize_git_spec(spec: "str") -> "str":
+    """
+    REV:path with the path normalized as for archive members (git doesn't resolve
+    .. in the path, e.g. in HEAD:work/../common/inlist_common for a nested inlist)
+    """
+    rev, colon, path = spec.partition(":")
+    if not colon or path == "":
+        return spec
+    # ./ and ../ at the start mean relative to the current directory for git
+    relative = path.startswith(("./", "../"))
+    path = posixpath.normpath(path)
+    if path == ".":
+        path = "./" if relative else ""
+    elif relative and not path.startswith("../"):
+        path = "./" + path
+    return rev + colon + path
+
+
+def get_git_object(spec: "str"):
+    """(sha, type, content) of the git object spec, using the repository of the current directory"""
+    spec = normalize_git_spec(spec)
+    objects = getattr(_git_scope, "objects", None)
+    if objects is not None and spec in objects:
+        return objects[spec]
+    cwd = os.getcwd()
+    with _git_lock:
+        git = _git_processes.get(cwd)
+        if git is None:
+            git = _git_processes[cwd] = GitCatFile(cwd)
+    obj = git.get(spec)
+    if objects is not None:
+        objects[spec] = obj
+    return obj
+
+
+def is_git_revision(rev: "str") -> "bool":
+    """True if rev is a revision (commit, branch, tag...) of the repository of the current directory"""
+    key = (os.getcwd(), rev)
+    if key in _git_revisions:
+        return True
+    try:
+        obj = get_git_object(rev)
+    except GitError:
+        # not in a git repository
+        return False
+    if obj is None:
+        return False
+    _git_revisions.add(key)
+    return True
+
+
+# ------------------------- archives ----------------------------------
+
+ARCHIVE_SUFFIXES = (".tar", ".tar.gz", ".tgz", ".tar.bz2", ".tbz2", ".tar.xz", ".txz", ".zip")
+# MESA outputs, never needed to compare inlists
+OUTPUT_DIRS = ("LOGS", "photos", "png", ".mesa_temp_cache")
+# larger members are read only if asked for
+MAX_MEMBER_SIZE = 1 << 20
+
+
+def split_archive_path(path: "str") -> "tuple":
+    """
+    returns (archive, member) if path goes through a tar or zip archive
+    (the member is "" for the archive itself), otherwise ("", "")
+    """
+    head, parts = path.rstrip("/") or path, []
+    while head != "" and not os.path.exists(head):
+        parent, tail = os.path.split(head)
+        if parent == head:
+            break
+        parts.append(tail)
+        head = parent
+    if head == "" or not head.lower().endswith(ARCHIVE_SUFFIXES) or not os.path.isfile(head):
+        return "", ""
+    return head, member_name("/".join(reversed(parts)))
+
+
+def member_name(name: "str") -> "str":
+    """name of a member as used in the index (no ./ or trailing /)"""
+    name = posixpath.normpath(name).lstrip("/")
+    return "" if name == "." else name
+
+
+def keep_member(name: "str", size: "int") -> "bool":
+    """True for the small members outside the MESA output folders, read while indexing the archive"""
+    return size <= MAX_MEMBER_SIZE and not any(part.startswith(OUTPUT_DIRS) for part in name.split("/"))
+
+
+def index_archive(archive: "str") -> "tuple":
+    """
+    reads archive once and returns ({member: size, or None for directories}, {member: content}),
+    with the content of the members kept by keep_member. The bulky outputs are skipped:
+    their data is never decompressed for zip files, and seeked over for uncompressed tar files.
+    """
+    members = {"": None}
+    contents = {}
+
+    def add(name, size):
+        members[name] = size
+        parent = posixpath.dirname(name)
+        while parent not in members:
+            members[parent] = None
+            parent = posixpath.dirname(parent)
+
+    if archive.lower().endswith(".zip"):
+        with zipfile.ZipFile(archive) as Z:
+            for info in Z.infolist():
+                name = member_name(info.filename)
+                if info.is_dir():
+                    add(name, None)
+                    continue
+                add(name, info.file_size)
+                if keep_member(name, info.file_size):
+                    contents[name] = Z.read(info)
+    else:
+        with tarfile.open(archive, "r:*") as T:
+            for info in T:
+                name = member_name(info.name)
+                if info.isdir():
+                    add(name, None)
+                elif info.isfile():
+                    add(name, info.size)
+                    if keep_member(name, info.size):
+                        contents[name] = T.extractfile(info).read()
+    return members, contents
+
+
+_archive_lock = threading.Lock()
+_archive_indexes = {}  # archive -> (mtime and size, members, contents)
+
+
+def get_archive_index(archive: "str") -> "tuple":
+    """index_archive(archive), cached until the archive size or modification time change"""
+    st = os.stat(archive)
+    stamp = (st.st_mtime_ns, st.st_size)
+    key = os.path.abspath(archive)
+    with _archive_lock:
+        cached = _archive_indexes.get(key)
+        if cached is None or cached[0] != stamp:
+            try:
+                cached = _archive_indexes[key] = (stamp,) + index_archive(archive)
+            except (tarfile.TarError, zipfile.BadZipFile) as e:
+                raise ArchiveError(f"could not read {archive}: {e}")
+    return cached
+
+
+def read_archive_member(archive: "str", member: "str") -> "bytes":
+    """content of member in archive"""
+    stamp, members, contents = get_archive_index(archive)
+    if members.get(member, None) is None:
+        raise FileNotFoundError(archive + "/" + member)
+    if member in contents:
+        return contents[member]
+    # large or output file, not kept in the index
+    if archive.lower().endswith(".zip"):
+        with zipfile.ZipFile(archive) as Z:
+            for info in Z.infolist():
+                if member_name(info.filename) == member:
+                    return Z.read(info)
+    else:
+        with tarfile.open(archive, "r:*") as T:
+            for info in T:
+                if info.isfile() and member_name(info.name) == member:
+                    return T.extractfile(info).read()
+    raise FileNotFoundError(archive + "/" + member)
+
+
+# ------------------------- files, git objects or archive members ----------------------------------
+
+
+def is_git_spec(path: "str") -> "bool":
+    """True for REV:path specs with an existing REV (paths on disk containing : are still files)"""
+    rev, colon, _ = path.partition(":")
+    return bool(colon) and (rev != "") and not os.path.exists(path) and is_git_revision(rev)
+
+
+def is_virtual(path: "str") -> "bool":
+    """True for files read from git or from an archive rather than from disk"""
+    return split_archive_path(path)[0] != "" or is_git_spec(path)
+
+
+def file_key(path: "str") -> "str":
+    """key identifying path in the caches"""
+    return normalize_git_spec(path) if is_git_spec(path) else os.path.abspath(path)
+
+
+def file_stamp(path: "str") -> "tuple":
+    """something that changes when the content of path changes (raises FileNotFoundError if missing)"""
+    archive, member = split_archive_path(path)
+    if archive != "":
+        stamp, members, contents = get_archive_index(archive)
+        if members.get(member, None) is None:
+            raise FileNotFoundError(path)
+        return stamp
+    if is_git_spec(path):
+        obj = get_git_object(path)
+        if obj is None or obj[1] != "blob":
+            raise FileNotFoundError(path)
+        return ("git", obj[0])
+    st = os.stat(path)
+    return (st.st_mtime_ns, st.st_size)
+
+
+def read_bytes(path: "str") -> "bytes":
+    """content of the file, archive member or git blob path"""
+    archive, member = split_archive_path(path)
+    if archive != "":
+        return read_archive_member(archive, member)
+    if is_git_spec(path):
+        obj = get_git_object(path)
+        if obj is None or obj[1] != "blob":
+            raise FileNotFoundError(path)
+        return obj[2]
+    with open(path, "rb") as F:
+        return F.read()
+
+
+def is_file(path: "str") -> "bool":
+    archive, member = split_archive_path(path)
+    if archive != "":
+        return get_archive_index(archive)[1].get(member, None) is not None
+    if is_git_spec(path):
+        obj = get_git_object(path)
+        return obj is not None and obj[1] == "blob"
+    return os.path.isfile(path)
+
+
+def is_dir(path: "str") -> "bool":
+    """True for directories, also in git or in archives (and for archives themselves)"""
+    archive, member = split_archive_path(path)
+    if archive != "":
+        members = get_archive_index(archive)[1]
+        return member in members and members[member] is None
+    if is_git_spec(path):
+        obj = get_git_object(path.rstrip("/"))
+        return obj is not None and obj[1] == "tree"
+    return os.path.isdir(path)
+
+
+def exists(path: "str") -> "bool":
+    return is_file(path) or is_dir(path)
+
+
+class ExistingPath(click.ParamType):
+    """click argument for an existing file or directory, on disk or as REV:path"""
+
+    name = "path"
+
+    def convert(self, value, param, ctx):
+        try:
+            found = exists(value)
+        except (GitError, ArchiveError) as e:
+            self.fail(str(e), param, ctx)
+        if not found and ":" in value:
+            self.fail(
+                f"{value} does not exist, on disk or as REV:path in the git repository of {os.getcwd()}", param, ctx
+            )
+        if not found:
+            self.fail(f"{value} does not exist", param, ctx)
+        return value
@@ -0,0 +1,150 @@
+#!/usr/bin/python3
+# author: Mathieu Renzo
+
+# Author: Mathieu Renzo <mathren90@gmail.com>
+# Keywords: files
+
+# Copyright (C) 2019-2021 Mathieu Renzo
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or (at
+# your option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see http://www.gnu.org/licenses/.
+
+
+# Fingerprints of the options MESA uses in an inlist or work directory,
+# which don't depend on the order of the options, on how values are
+# written (1d0 or 1.0), on nested inlists, or on options explicitly set
+# to their default value. Identical fingerprints mean identical
+# configurations, so there is no need to compare them.
+
+import hashlib
+
+# pip install -U termcolor
+from termcolor import colored
+
+# pip install -U click
+import click
+
+from .compare_inlists import get_MESA_DIR, get_defaults, iter_options, FortranArray
+from .compare_all_workdir_inlists import resolve_path, defaults_name, is_nesting_option
+from .batch_compare import read_paths
+from .errors import report_errors
+from .file_access import ExistingPath
+
+
+def canonical_value(val) -> "str":
+    """same string for values that MESA reads the same"""
+    if isinstance(val, float):
+        return repr(val)
+    if isinstance(val, str) and len(val) > 1 and val[0] in "'\"" and val[-1] == val[0]:
+        return "'" + val[1:-1] + "'"
+    return str(val)
+
+
+def option_default(defaults: "dict", k: "str"):
+    """default value of the option k (as from iter_options, e.g. x_ctrl(1)) in defaults, None if unknown"""
+    name, _, index = k.partition("(")
+    default = defaults.get(name)
+    if isinstance(default, FortranArray):
+        index = index[:-1]
+        if index == ":":
+            return default.fill
+        try:
+            return default.element(int(index))
+        except ValueError:
+            # elements of multi-dimensional arrays, e.g. Text_Summary1_name(1,1), are kept as options
+            return defaults.get(k, default.fill)
+    return default
+
+
+def canonical_options(namelist: "dict", defaults: "dict") -> "list":
+    """sorted list of the option=value strings of namelist, without default values and nested inlists"""
+    options = []
+    for k, v in iter_options(namelist):
+        if is_nesting_option(k):
+            continue
+        default = option_default(defaults, k)
+        if (default is not None) and canonical_value(v) == canonical_value(default):
+            continue
+        options.append(f"{k}={canonical_value(v)}")
+    return sorted(options)
+
+
+def namelist_fingerprint(namelist: "dict", defaults: "dict") -> "str":
+    """hex digest of the canonical options of namelist"""
+    return hashlib.sha256("\n".join(canonical_options(namelist, defaults)).encode()).hexdigest()
+
+
+def path_fingerprints(path: "str", do_pgstar=False, MESA_DIR="", chain=None) -> "tuple":
+    """
+    returns the fingerprint of the work directory or inlist path, and a dictionary
+    with the fingerprint of each namelist (with the keys of resolve_work_dir).
+    If a list chain is given, it is filled as in resolve_work_dir.
+    """
+    if MESA_DIR == "":
+        MESA_DIR = get_MESA_DIR()
+    namelists = resolve_path(path, do_pgstar=do_pgstar, MESA_DIR=MESA_DIR, chain=chain)
+    fingerprints = {}
+    for section, namelist in namelists.items():
+        name = section.split("/")[-1]
+        # there are no separate defaults for binary_pgstar
+        defaults = get_defaults(name, MESA_DIR) if defaults_name(section) == name else {}
+        fingerprints[section] = namelist_fingerprint(namelist, defaults)
+    combined = "\n".join(f"{section}:{fp}" for section, fp in sorted(fingerprints.items()))
+    return hashlib.sha256(combined.encode()).hexdigest(), fingerprints
+
+
+def group_by_fingerprint(paths: "list", do_pgstar=False, MESA_DIR="") -> "dict":
+    """returns a dictionary with the fingerprints as keys and the list of paths with that fingerprint as values"""
+    groups = {}
+    for path in paths:
+        fingerprint = path_fingerprints(path, do_pgstar=do_pgstar, MESA_DIR=MESA_DIR)[0]
+        groups.setdefault(fingerprint, []).append(path)
+    return groups
+
+
+# command line wrapper
+@click.command(context_settings={"ignore_unknown_options": True})
+@click.argument("paths", nargs=-1, type=ExistingPath())
+@click.option(
+    "--batch", default="", help="Also fingerprint the work directories or inlists listed in this file (- for stdin)."
+)
+@click.option("--pgstar", default=False, help="Include the pgstar namelists.")
+@click.option("--namelists", is_flag=True, help="Print also the fingerprint of each namelist.")
+@click.option(
+    "--mesa_dir",
+    default="",
+    help="use customized location of $MESA_DIR. Will use environment variable if empty and return an error if empty.",
+)
+@report_errors
+def fingerprint_inlists(paths, batch, pgstar, namelists, mesa_dir):
+    paths = list(paths)
+    if batch != "":
+        paths += read_paths(batch)
+    if mesa_dir == "":
+        mesa_dir = get_MESA_DIR()
+    groups = {}
+    for path in paths:
+        fingerprint, fingerprints = path_fingerprints(path, do_pgstar=pgstar, MESA_DIR=mesa_dir)
+        groups.setdefault(fingerprint, []).append(path)
+        print(f"{fingerprint}  {path}")
+        if namelists:
+            for section, fp in fingerprints.items():
+                print(f"  {fp}  &{section}")
+    duplicates = [group for group in groups.values() if len(group) > 1]
+    for group in duplicates:
+        print(colored("identical: " + " ".join(group), "yellow"))
+    print(colored(f"{len(groups)} different configurations in {len(paths)} work directories or inlists", "blue"))
+
+
+if __name__ == "__main__":
+    fingerprint_inlists()
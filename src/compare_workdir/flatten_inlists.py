@@ -0,0 +1,145 @@
+#!/usr/bin/python3
+# author: Mathieu Renzo
+
+# Author: Mathieu Renzo <mathren90@gmail.com>
+# Keywords: files
+
+# Copyright (C) 2019-2021 Mathieu Renzo
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or (at
+# your option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see http://www.gnu.org/licenses/.
+
+
+# Write the options MESA actually uses in a work directory, after
+# following all the nested inlists, in a single flat inlist without
+# nested inlists (optionally with all the defaults written explicitly).
+# The flat inlists are quick to read back and compare, e.g. with
+# compare_inlists, and can be archived together with the results.
+
+import os
+
+# pip install -U termcolor
+from termcolor import colored
+
+# pip install -U click
+import click
+
+from .compare_inlists import get_MESA_DIR, get_defaults, merge_namelists, FortranArray
+from .compare_all_workdir_inlists import resolve_work_dir, defaults_name, is_folder_binary, is_nesting_option
+from .errors import report_errors
+from .file_access import ExistingPath, file_key
+
+
+def format_value(val) -> "str":
+    """writes a value returned by clean_val as it should appear in an inlist"""
+    if isinstance(val, float):
+        if val.is_integer() and abs(val) < 1e15:
+            return str(int(val))
+        s = repr(val)
+        if "e" in s:
+            return s.replace("e", "d")
+        if s[-1].isdigit():
+            return s + "d0"
+    return str(val)
+
+
+def namelist_lines(name: "str", namelist: "dict", defaults=None) -> "list":
+    """
+    returns the lines of the namelist &name with the options in namelist, sorted,
+    without the options to read nested inlists. If defaults are given,
+    the options not set in namelist are written with their default value.
+    """
+    if defaults is not None:
+        namelist = merge_namelists(defaults, namelist)
+    lines = [f"&{name}\n"]
+    for k in sorted(namelist):
+        if is_nesting_option(k):
+            continue
+        v = namelist[k]
+        if isinstance(v, FortranArray):
+            if v.fill is not None:
+                # the size of the array is not known here, MESA sets the elements not listed to this
+                lines.append(f"  ! {k}(:) = {format_value(v.fill)}\n")
+            for i in sorted(v):
+                lines.append(f"  {k}({i}) = {format_value(v[i])}\n")
+        else:
+            lines.append(f"  {k} = {format_value(v)}\n")
+    lines.append(f"/ ! end of {name} namelist\n\n")
+    return lines
+
+
+def write_namelists(outfile: "str", namelists: "dict", header: "str", MESA_DIR="", with_defaults=False):
+    """writes the namelists (as returned by resolve_work_dir, all for the same star) in outfile"""
+    with open(outfile, "w") as F:
+        F.write(header)
+        for section, namelist in namelists.items():
+            name = section.split("/")[-1]
+            defaults = None
+            # there are no separate defaults for binary_pgstar
+            if with_defaults and defaults_name(section) == name:
+                defaults = get_defaults(name, MESA_DIR)
+            # MESA reads the binary_pgstar options from the &pgstar namelist of the binary inlist
+            header_name = "pgstar" if name == "binary_pgstar" else name
+            # one write per namelist
+            F.write("".join(namelist_lines(header_name, namelist, defaults)))
+
+
+def flatten_work_dir(work_dir: "str", outfile: "str", with_defaults=False, do_pgstar=True, MESA_DIR="") -> "list":
+    """
+    writes all the namelists read by MESA in work_dir, after following the nested inlists,
+    to outfile. For binaries, the namelists of each star are written to outfile_star1 and
+    outfile_star2, and inlist_names in outfile points to them (so they should stay in the same folder).
+    Returns the list of files written.
+    """
+    if MESA_DIR == "":
+        MESA_DIR = get_MESA_DIR()
+    namelists = resolve_work_dir(work_dir, do_pgstar=do_pgstar, MESA_DIR=MESA_DIR)
+    header = f"! options read by MESA in {file_key(work_dir)}"
+    header += ", including the defaults\n\n" if with_defaults else "\n\n"
+    if not is_folder_binary(work_dir):
+        write_namelists(outfile, namelists, header, MESA_DIR, with_defaults)
+        return [outfile]
+    written = [outfile]
+    binary_namelists = {section: nml for section, nml in namelists.items() if "/" not in section}
+    job = dict(binary_namelists["binary_job"])
+    job["inlist_names"] = FortranArray()
+    for i, star in enumerate(("star1", "star2")):
+        star_outfile = f"{outfile}_{star}"
+        job["inlist_names"][i + 1] = f"'{os.path.basename(star_outfile)}'"
+        star_namelists = {section: nml for section, nml in namelists.items() if section.startswith(star + "/")}
+        write_namelists(star_outfile, star_namelists, header, MESA_DIR, with_defaults)
+        written.append(star_outfile)
+    binary_namelists["binary_job"] = job
+    write_namelists(outfile, binary_namelists, header, MESA_DIR, with_defaults)
+    return written
+
+
+# command line wrapper
+@click.command(context_settings={"ignore_unknown_options": True})
+@click.argument("work_dir", nargs=1, type=ExistingPath())
+@click.argument("outfile", nargs=1)
+@click.option("--defaults", is_flag=True, help="Write also the options not set, with their default value.")
+@click.option("--pgstar", default=True, help="Write also the pgstar namelists.")
+@click.option(
+    "--mesa_dir",
+    default="",
+    help="use customized location of $MESA_DIR. Will use environment variable if empty and return an error if empty.",
+)
+@report_errors
+def flatten_inlists(work_dir, outfile, defaults, pgstar, mesa_dir):
+    written = flatten_work_dir(work_dir, outfile, with_defaults=defaults, do_pgstar=pgstar, MESA_DIR=mesa_dir)
+    print(colored("written " + " ".join(written), "blue"))
+
+
+if __name__ == "__main__":
+    flatten_inlists()
@@ -25,6 +25,8 @@ from termcolor import colored
 # pip install -U click
 import click
 
+from .file_access import ExistingPath, read_bytes
+
 
 def list_type(col_list):
     if "profile_columns.list" in col_list:
@@ -41,15 +43,15 @@ def list_type(col_list):
 def read_col_list(col_list):
     """reads a file and returns a list of columns ignoring empty lines and comments"""
     col = []
-    with open(col_list, "r") as F:
-        for i, line in enumerate(F):
-            l = line.strip("\n\r").rstrip().lstrip()  # remove \n and white spaces
-            if (l == "") or (l[0] == "!"):
-                # skip empty lines and comments
-                pass
-            else:
-                # remove comments and add to list
-                col.append(l.split('!')[0].rstrip())
+    # col_list can also be in git or in an archive
+    for i, line in enumerate(read_bytes(col_list).decode().splitlines()):
+        l = line.strip("\n\r").rstrip().lstrip()  # remove \n and white spaces
+        if (l == "") or (l[0] == "!"):
+            # skip empty lines and comments
+            pass
+        else:
+            # remove comments and add to list
+            col.append(l.split('!')[0].rstrip())
     return col
 
 
@@ -75,8 +77,8 @@ def merge_columns(list1: "str", list2: "str", outlist="", MESA_DIR=""):
 
 
 @click.command(context_settings={"ignore_unknown_options": True})
-@click.argument("list1", nargs=1, type=click.Path(exists=True))
-@click.argument("list2", nargs=1, type=click.Path(exists=True))
+@click.argument("list1", nargs=1, type=ExistingPath())
+@click.argument("list2", nargs=1, type=ExistingPath())
 @click.argument("outlist", nargs=1)
 @click.option(
     "--mesa_dir",
@@ -0,0 +1,173 @@
+#!/usr/bin/python3
+# author: Mathieu Renzo
+
+# Author: Mathieu Renzo <mathren90@gmail.com>
+# Keywords: files
+
+# Copyright (C) 2019-2021 Mathieu Renzo
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or (at
+# your option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see http://www.gnu.org/licenses/.
+
+# Opt-in timing of each stage of a comparison (reading inlists and
+# defaults, following nested inlists, diff, printing) and counters
+# (files opened, lines scanned, cache hits/misses, keys compared, bytes written).
+# Nothing is recorded unless profiling is enabled, e.g.:
+#
+#   with profiling():
+#       check_folders_consistency(work1, work2)
+#
+# prints a summary table at the end. Use get_profile() for the raw numbers.
+
+import sys
+import json
+import time
+import functools
+import threading
+import contextlib
+
+_enabled = False
+_lock = threading.Lock()
+_stages = {}  # stage name -> [number of calls, seconds]
+_counters = {}  # counter name -> value
+
+
+def enable_profiling():
+    global _enabled
+    _enabled = True
+
+
+def disable_profiling():
+    global _enabled
+    _enabled = False
+
+
+def is_profiling() -> "bool":
+    return _enabled
+
+
+def reset_profile():
+    """forget the timings and counters recorded so far"""
+    with _lock:
+        _stages.clear()
+        _counters.clear()
+
+
+def count(name: "str", n=1):
+    """adds n to the counter name, if profiling"""
+    if _enabled:
+        with _lock:
+            _counters[name] = _counters.get(name, 0) + n
+
+
+def add_time(stage: "str", seconds: "float", calls=1):
+    with _lock:
+        entry = _stages.setdefault(stage, [0, 0.0])
+        entry[0] += calls
+        entry[1] += seconds
+
+
+def profiled(func):
+    """
+    decorator recording number of calls and time spent in func
+    (including the functions it calls) under the name of func, if profiling
+    """
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        if not _enabled:
+            return func(*args, **kwargs)
+        t_start = time.perf_counter()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            add_time(func.__name__, time.perf_counter() - t_start)
+
+    return wrapper
+
+
+def get_profile() -> "dict":
+    """returns a copy of the timings and counters recorded so far"""
+    with _lock:
+        return {
+            "stages": {stage: {"calls": v[0], "seconds": v[1]} for stage, v in _stages.items()},
+            "counters": dict(_counters),
+        }
+
+
+def merge_profile(profile: "dict"):
+    """adds the timings and counters of profile (e.g., from a worker process) to the current ones"""
+    for stage, v in profile["stages"].items():
+        add_time(stage, v["seconds"], calls=v["calls"])
+    with _lock:
+        for name, n in profile["counters"].items():
+            _counters[name] = _counters.get(name, 0) + n
+
+
+def print_profile_summary(file=sys.stderr):
+    """prints the table of timings (inclusive of nested stages) and counters"""
+    profile = get_profile()
+    print("", file=file)
+    print(f"{'stage':<35}\t{'calls':>8}\t{'seconds':>10}", file=file)
+    for stage, v in sorted(profile["stages"].items(), key=lambda kv: kv[1]["seconds"], reverse=True):
+        print(f"{stage:<35}\t{v['calls']:>8}\t{v['seconds']:>10.6f}", file=file)
+    print("", file=file)
+    for name, n in sorted(profile["counters"].items()):
+        print(f"{name:<35}\t{n:>8}", file=file)
+
+
+def dump_profile_json(path: "str"):
+    with open(path, "w") as F:
+        json.dump(get_profile(), F, indent=1)
+
+
+class CountingStream:
+    """wraps a text stream counting the bytes written to it"""
+
+    def __init__(self, stream):
+        self.stream = stream
+
+    def write(self, s):
+        count("bytes written", len(s.encode("utf-8", errors="replace")))
+        return self.stream.write(s)
+
+    def __getattr__(self, name):
+        return getattr(self.stream, name)
+
+
+@contextlib.contextmanager
+def profiling(json_file="", summary=True):
+    """
+    enables profiling (and counts the bytes written to stdout) for the duration
+    of the with block, then prints a summary to stderr and/or dumps the
+    profile to json_file
+    """
+    reset_profile()
+    enable_profiling()
+    stdout = sys.stdout
+    counting = sys.stdout = CountingStream(stdout)
+    t_start = time.perf_counter()
+    try:
+        yield
+    finally:
+        add_time("total", time.perf_counter() - t_start)
+        if sys.stdout is counting:
+            sys.stdout = stdout
+        elif getattr(sys.stdout, "stream", None) is counting:
+            # another wrapper was installed over it meanwhile (e.g. comparator.ThreadOutput), keep that one
+            sys.stdout.stream = stdout
+        disable_profiling()
+        if summary:
+            print_profile_summary()
+        if json_file != "":
+            dump_profile_json(json_file)
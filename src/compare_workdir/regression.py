@@ -0,0 +1,203 @@
+#!/usr/bin/python3
+# author: Mathieu Renzo
+
+# Author: Mathieu Renzo <mathren90@gmail.com>
+# Keywords: files
+
+# Copyright (C) 2019-2021 Mathieu Renzo
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or (at
+# your option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see http://www.gnu.org/licenses/.
+
+# Compare all pairs of inlists in the MESA test_suite as a regression
+# test. The pairs can be split in shards to run on several machines,
+# each shard writes one JSON record per pair in its results file, which
+# is also the checkpoint to resume from. Results of the shards are then merged.
+
+import os
+import sys
+import glob
+import json
+import time
+import itertools
+import traceback
+import contextlib
+
+# pip install -U termcolor
+from termcolor import colored
+
+# pip install -U click
+import click
+
+from .compare_inlists import get_MESA_DIR, diff_inlists
+from .errors import report_errors
+
+
+# ------------------------- the pairs to compare ----------------------------------
+
+
+def get_test_suite_inlists(MESA_DIR="") -> "list":
+    """returns the sorted list of inlists of the single and binary test_suite of MESA_DIR"""
+    if MESA_DIR == "":
+        MESA_DIR = get_MESA_DIR()
+    inlists_single = glob.glob(MESA_DIR + "/star/test_suite/*/inlist*")
+    inlists_binary = glob.glob(MESA_DIR + "/binary/test_suite/*/inlist*")
+    # sorted so that every machine agrees on the shards
+    return sorted(f for f in set().union(inlists_binary, inlists_single) if os.path.isfile(f))
+
+
+def parse_shard(shard: "str") -> "tuple":
+    """parses a shard specification i/N with 0 <= i < N"""
+    try:
+        i, N = (int(x) for x in shard.split("/"))
+    except ValueError:
+        raise ValueError(f"shard {shard} should be i/N, e.g. 0/4")
+    if (N < 1) or (i < 0) or (i >= N):
+        raise ValueError(f"shard {shard} should be i/N with 0 <= i < N")
+    return i, N
+
+
+def get_shard_pairs(inlists: "list", shard="0/1") -> "list":
+    """
+    returns the pairs of inlists (including each inlist with itself) of the given shard,
+    assigning the pairs to the shards round robin
+    """
+    i, N = parse_shard(shard)
+    pairs = itertools.combinations_with_replacement(inlists, 2)
+    return [pair for j, pair in enumerate(pairs) if j % N == i]
+
+
+# ------------------------- results and checkpoints ----------------------------------
+
+
+def read_results(results_file: "str") -> "dict":
+    """
+    reads the records of a results file, returns a dictionary with (inlist1, inlist2) as keys
+    (the last record of each pair, e.g. after a failed pair was tried again).
+    A truncated last line (e.g. the job was killed while writing) is ignored.
+    """
+    results = {}
+    if not os.path.isfile(results_file):
+        return results
+    with open(results_file, "r") as F:
+        for line in F:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue
+            results[(record["inlist1"], record["inlist2"])] = record
+    return results
+
+
+def run_pair(inlist1: "str", inlist2: "str", MESA_DIR="") -> "dict":
+    """compares two inlists discarding the output and returns the record for the results file"""
+    record = {"inlist1": inlist1, "inlist2": inlist2, "status": "ok"}
+    t_start = time.perf_counter()
+    try:
+        with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+            diff_inlists(inlist1, inlist2, do_pgstar=True, MESA_DIR=MESA_DIR)
+    except (Exception, SystemExit):
+        record["status"] = "failed"
+        record["traceback"] = traceback.format_exc()
+    record["seconds"] = round(time.perf_counter() - t_start, 6)
+    return record
+
+
+def run_regression(results_file: "str", shard="0/1", MESA_DIR="", vb=False) -> "int":
+    """
+    compares all the pairs of inlists of the shard of the test_suite, skipping those already
+    compared successfully in results_file (failed pairs are tried again), and appends one record
+    per pair to results_file. Returns the number of failed pairs in the shard.
+    """
+    if MESA_DIR == "":
+        MESA_DIR = get_MESA_DIR()
+    t_start = time.time()
+    pairs = get_shard_pairs(get_test_suite_inlists(MESA_DIR), shard)
+    done = read_results(results_file)
+    # a failure may have been transient or fixed since, the new record replaces it (see read_results)
+    todo = [pair for pair in pairs if pair not in done or done[pair]["status"] != "ok"]
+    retry = sum(1 for pair in todo if pair in done)
+    print(f"shard {shard}: {len(pairs)} pairs, {len(pairs) - len(todo)} already done, {retry} failed tried again")
+    with open(results_file, "a") as F:
+        for inlist1, inlist2 in todo:
+            record = run_pair(inlist1, inlist2, MESA_DIR)
+            F.write(json.dumps(record) + "\n")
+            F.flush()
+            done[(inlist1, inlist2)] = record
+            if record["status"] != "ok":
+                print(colored("FAILED: " + inlist1 + " " + inlist2, "yellow"))
+                if vb:
+                    print(colored(record["traceback"], "yellow"))
+    failed = sum(1 for pair in pairs if done[pair]["status"] != "ok")
+    print(f"...shard {shard} took {time.time() - t_start:.1f} seconds, {failed} failed")
+    return failed
+
+
+def merge_results(results_files: "list", outfile="") -> "dict":
+    """
+    merges the results of several shards (later files win for repeated pairs),
+    prints a summary and writes the merged records in outfile if given
+    """
+    merged = {}
+    for results_file in results_files:
+        merged.update(read_results(results_file))
+    failed = [record for record in merged.values() if record["status"] != "ok"]
+    total_time = sum(record["seconds"] for record in merged.values())
+    slowest = sorted(merged.values(), key=lambda record: record["seconds"], reverse=True)[:5]
+    print(f"{len(merged)} pairs, {len(failed)} failed, {total_time:.1f} seconds in total")
+    for record in slowest:
+        print(f"{record['seconds']:10.3f} s\t{record['inlist1']} {record['inlist2']}")
+    for record in failed:
+        print(colored("FAILED: " + record["inlist1"] + " " + record["inlist2"], "yellow"))
+    if outfile != "":
+        with open(outfile, "w") as F:
+            for pair in sorted(merged):
+                F.write(json.dumps(merged[pair]) + "\n")
+    return merged
+
+
+# command line wrapper
+@click.group()
+def test_suite_regression():
+    """Compare all pairs of inlists of the MESA test_suite, in shards."""
+
+
+@test_suite_regression.command("run")
+@click.option("--results", default="regression_results.jsonl", help="Results file, also used to resume.")
+@click.option("--shard", default="0/1", help="Do only the shard i/N of the pairs (0 <= i < N).")
+@click.option(
+    "--mesa_dir",
+    default="",
+    help="use customized location of $MESA_DIR. Will use environment variable if empty and return an error if empty.",
+)
+@click.option("--vb", default=False, help="Show also the tracebacks of failed pairs.")
+@report_errors
+def run(results, shard, mesa_dir, vb):
+    try:
+        parse_shard(shard)
+    except ValueError as e:
+        raise click.BadParameter(str(e))
+    failed = run_regression(results, shard=shard, MESA_DIR=mesa_dir, vb=vb)
+    sys.exit(1 if failed else 0)
+
+
+@test_suite_regression.command("merge")
+@click.argument("results_files", nargs=-1, type=click.Path(exists=True))
+@click.option("--output", default="", help="Write the merged records to this file.")
+def merge(results_files, output):
+    merged = merge_results(list(results_files), outfile=output)
+    sys.exit(1 if any(record["status"] != "ok" for record in merged.values()) else 0)
+
+
+if __name__ == "__main__":
+    test_suite_regression()
@@ -0,0 +1,182 @@
+#!/usr/bin/python3
+# author: Mathieu Renzo
+
+# Author: Mathieu Renzo <mathren90@gmail.com>
+# Keywords: files
+
+# Copyright (C) 2019-2021 Mathieu Renzo
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or (at
+# your option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see http://www.gnu.org/licenses/.
+
+
+# Compact binary encoding of resolved configurations (e.g. the namelists
+# of a work directory by section, or the options of path_options) to send
+# them between processes or save them on disk. Every value (option names
+# and strings, numbers, namelists, arrays) is an entry of a table written
+# once, in which the values equal for the comparisons are shared, and the
+# namelists and arrays are columns of the ids of their options and values,
+# so that most of the decoding is done by dict(zip(...)) on arrays.
+
+import array
+import struct
+
+from .compare_inlists import FortranArray
+
+MAGIC = b"CWPK"
+# increase when the layout changes
+PACK_FORMAT = 1
+
+# type tags of the entries
+_NONE, _TRUE, _FALSE, _FLOAT, _INT, _STR, _ARRAY, _DICT = b"NTFfisad"
+_CONSTANTS = {_NONE: None, _TRUE: True, _FALSE: False}
+# magic, format, then the length of each column
+_HEADER = struct.Struct("<4sI9I")
+
+
+class _Packer:
+    """the entries of the values being packed, in the order of their ids"""
+
+    def __init__(self):
+        self.ids = {}
+        self.tags = bytearray()
+        self.strings = []
+        self.floats = array.array("d")
+        self.ints = array.array("q")
+        self.sizes = array.array("I")
+        self.keys = array.array("I")
+        self.items = array.array("I")
+
+    def _new(self, tag: "int") -> "int":
+        self.tags.append(tag)
+        return len(self.tags) - 1
+
+    def add(self, value) -> "int":
+        """id of the entry of value"""
+        # True, 1 and 1.0 are different entries
+        try:
+            i = self.ids.get((value.__class__, value))
+        except TypeError:
+            # dictionaries aren't hashable
+            return self._add_container(value)
+        return i if i is not None else self._add_scalar(value)
+
+    def _add_container(self, value) -> "int":
+        if not isinstance(value, dict):
+            raise TypeError(f"can't pack {type(value).__name__}: {value!r}")
+        # containers after their values, so that they can be decoded in order
+        if isinstance(value, FortranArray):
+            indices = sorted(value)
+            keys = [self.add(i) for i in indices]
+            items = [self.add(value.fill)] + [self.add(value[i]) for i in indices]
+            tag = _ARRAY
+        else:
+            keys = [self.add(k) for k in value]
+            items = [self.add(v) for v in value.values()]
+            tag = _DICT
+        self.sizes.append(len(keys))
+        self.keys.extend(keys)
+        self.items.extend(items)
+        return self._new(tag)
+
+    def _add_scalar(self, value) -> "int":
+        if isinstance(value, str):
+            if "\0" in value:
+                raise ValueError(f"can't pack strings with NUL characters: {value!r}")
+            self.strings.append(value)
+            tag = _STR
+        elif value is None or isinstance(value, bool):
+            tag = _NONE if value is None else (_TRUE if value else _FALSE)
+        elif isinstance(value, float):
+            self.floats.append(value)
+            tag = _FLOAT
+        elif isinstance(value, int):
+            self.ints.append(value)
+            tag = _INT
+        else:
+            raise TypeError(f"can't pack {type(value).__name__}: {value!r}")
+        i = self.ids[(value.__class__, value)] = self._new(tag)
+        return i
+
+
+def pack_configurations(configurations: "list") -> "bytes":
+    """
+    encodes a list of configurations: dictionaries of (dictionaries of) options with values
+    that are None, logicals, floats, ints, strings or FortranArray
+    """
+    packer = _Packer()
+    roots = array.array("I", (packer.add(configuration) for configuration in configurations))
+    strings = "\0".join(packer.strings).encode()
+    columns = [packer.floats, packer.ints, packer.sizes, packer.keys, packer.items, roots]
+    header = _HEADER.pack(
+        MAGIC, PACK_FORMAT, len(packer.tags), len(strings), len(packer.strings), *(len(c) for c in columns)
+    )
+    return b"".join([header, bytes(packer.tags), strings] + [c.tobytes() for c in columns])
+
+
+def unpack_configurations(data: "bytes") -> "list":
+    """decodes the configurations packed with pack_configurations, raises ValueError if data is not one"""
+    if len(data) < _HEADER.size or data[:4] != MAGIC:
+        raise ValueError("not packed configurations")
+    _, pack_format, n_tags, n_bytes, n_strings, *lengths = _HEADER.unpack_from(data, 0)
+    if pack_format != PACK_FORMAT:
+        raise ValueError(f"packed configurations in format {pack_format}, expected {PACK_FORMAT}")
+    typecodes = "dqIIII"
+    size = _HEADER.size + n_tags + n_bytes + sum(array.array(t).itemsize * n for t, n in zip(typecodes, lengths))
+    if len(data) != size:
+        raise ValueError("truncated packed configurations")
+    offset = _HEADER.size
+    tags = data[offset : offset + n_tags]
+    offset += n_tags
+    strings = data[offset : offset + n_bytes].decode().split("\0") if n_strings else []
+    offset += n_bytes
+    columns = []
+    for typecode, n in zip(typecodes, lengths):
+        column = array.array(typecode)
+        column.frombytes(data[offset : offset + n * column.itemsize])
+        offset += n * column.itemsize
+        columns.append(column)
+    floats, ints, sizes, keys, items, roots = columns
+    if len(strings) != n_strings:
+        raise ValueError("corrupted packed configurations")
+    strings, floats, ints, sizes = iter(strings), iter(floats), iter(ints), iter(sizes)
+    values = []
+    get = values.__getitem__
+    k = v = 0
+    try:
+        for tag in tags:
+            if tag == _STR:
+                values.append(next(strings))
+            elif tag == _FLOAT:
+                values.append(next(floats))
+            elif tag == _DICT:
+                n = next(sizes)
+                values.append(dict(zip(map(get, keys[k : k + n]), map(get, items[v : v + n]))))
+                k += n
+                v += n
+            elif tag == _ARRAY:
+                # the fill is the first item
+                n = next(sizes)
+                elements = zip(map(get, keys[k : k + n]), map(get, items[v + 1 : v + n + 1]))
+                values.append(FortranArray(elements, fill=get(items[v])))
+                k += n
+                v += n + 1
+            elif tag == _INT:
+                values.append(next(ints))
+            elif tag in _CONSTANTS:
+                values.append(_CONSTANTS[tag])
+            else:
+                raise ValueError(f"unknown type {chr(tag)} in packed configurations")
+        return [values[i] for i in roots]
+    except (StopIteration, IndexError):
+        raise ValueError("corrupted packed configurations")
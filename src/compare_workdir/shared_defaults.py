@@ -0,0 +1,190 @@
+#!/usr/bin/python3
+# author: Mathieu Renzo
+
+# Author: Mathieu Renzo <mathren90@gmail.com>
+# Keywords: files
+
+# Copyright (C) 2019-2021 Mathieu Renzo
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or (at
+# your option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see http://www.gnu.org/licenses/.
+
+
+# The defaults in a read-only file that the worker processes of --batch
+# --jobs N memory map instead of each building its own dictionaries:
+# the pages are shared by all the workers. Each namelist is stored as
+# sorted keys and JSON values with their offsets, so a lookup is a
+# binary search and only decodes the value asked for (once per process).
+
+import os
+import json
+import mmap
+import array
+import struct
+import tempfile
+import contextlib
+import collections.abc
+
+from .compare_inlists import DEFAULTS_FILES, get_defaults, cache_defaults
+from .defaults_snapshot import encode_value, decode_value
+from .errors import DefaultsNotFound
+
+MAGIC = b"CWSD"
+# increase when the layout changes
+SHARED_FORMAT = 1
+
+
+# ------------------------- layout of a namelist ----------------------------------
+
+
+def _offsets(blobs: "list") -> "array.array":
+    offsets = array.array("I", [0])
+    for b in blobs:
+        offsets.append(offsets[-1] + len(b))
+    return offsets
+
+
+def pack_namelist(defaults: "dict") -> "bytes":
+    """
+    the number of options n, the n+1 offsets of the keys and of the values, the sorted keys,
+    and the values as JSON (see defaults_snapshot.encode_value)
+    """
+    keys = sorted(defaults)
+    key_blobs = [k.encode() for k in keys]
+    value_blobs = [json.dumps(encode_value(defaults[k]), separators=(",", ":")).encode() for k in keys]
+    parts = [struct.pack("I", len(keys)), _offsets(key_blobs).tobytes(), _offsets(value_blobs).tobytes()]
+    return b"".join(parts + key_blobs + value_blobs)
+
+
+class SharedDefaults(collections.abc.Mapping):
+    """read-only view of the defaults of a namelist packed with pack_namelist at offset start of buf"""
+
+    def __init__(self, buf, start: "int"):
+        view = memoryview(buf)[start:]
+        (self.n,) = struct.unpack_from("I", view, 0)
+        size = 4 * (self.n + 1)
+        self.key_offsets = view[4 : 4 + size].cast("I")
+        self.value_offsets = view[4 + size : 4 + 2 * size].cast("I")
+        self.key_bytes = view[4 + 2 * size :]
+        self.value_bytes = self.key_bytes[self.key_offsets[self.n] :]
+        # key -> value decoded so far (the same options are looked up for every pair)
+        self.values = {}
+
+    def _key(self, i: "int") -> "bytes":
+        return self.key_bytes[self.key_offsets[i] : self.key_offsets[i + 1]].tobytes()
+
+    def _find(self, key) -> "int":
+        """position of key, or -1"""
+        if not isinstance(key, str):
+            return -1
+        target = key.encode()
+        lo, hi = 0, self.n
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._key(mid) < target:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo if lo < self.n and self._key(lo) == target else -1
+
+    def __getitem__(self, key):
+        if key in self.values:
+            return self.values[key]
+        i = self._find(key)
+        if i < 0:
+            raise KeyError(key)
+        value = decode_value(json.loads(self.value_bytes[self.value_offsets[i] : self.value_offsets[i + 1]].tobytes()))
+        self.values[key] = value
+        return value
+
+    def __contains__(self, key):
+        return key in self.values or self._find(key) >= 0
+
+    def __iter__(self):
+        for i in range(self.n):
+            yield self._key(i).decode()
+
+    def __len__(self):
+        return self.n
+
+
+# ------------------------- the file ----------------------------------
+
+
+def write_shared_defaults(outfile: "str", MESA_DIRs: "list") -> "list":
+    """writes the defaults of all the namelists of each MESA_DIR to outfile, returns the (namelist, MESA_DIR) written"""
+    sections, header = [], []
+    for MESA_DIR in MESA_DIRs:
+        for namelist in DEFAULTS_FILES:
+            try:
+                sections.append(pack_namelist(get_defaults(namelist, MESA_DIR)))
+            except DefaultsNotFound:
+                # e.g. no eos and kap namelists before MESA r15140
+                continue
+            header.append([namelist, MESA_DIR])
+    header_blob = json.dumps(header).encode()
+    offset = 12 + len(header_blob)
+    with open(outfile, "wb") as F:
+        F.write(MAGIC + struct.pack("II", SHARED_FORMAT, len(header_blob)) + header_blob)
+        offsets = []
+        for section in sections:
+            # keep the offsets aligned
+            padding = -offset % 4
+            F.write(b"\0" * padding)
+            offset += padding
+            offsets.append(offset)
+            F.write(section)
+            offset += len(section)
+        F.write(struct.pack(f"{len(offsets)}I", *offsets))
+    return [tuple(h) for h in header]
+
+
+def attach_shared_defaults(path: "str") -> "dict":
+    """
+    use the defaults in path (see write_shared_defaults) in this process, without copying them.
+    Returns the defaults cached before, as {(namelist, MESA_DIR): defaults or None}.
+    """
+    with open(path, "rb") as F:
+        buf = mmap.mmap(F.fileno(), 0, access=mmap.ACCESS_READ)
+    format_version, header_size = struct.unpack_from("II", buf, 4)
+    if buf[:4] != MAGIC or format_version != SHARED_FORMAT:
+        raise ValueError(f"{path} is not a file of shared defaults (format {SHARED_FORMAT})")
+    header = json.loads(buf[12 : 12 + header_size])
+    offsets = struct.unpack_from(f"{len(header)}I", buf, len(buf) - 4 * len(header))
+    previous = {}
+    for (namelist, MESA_DIR), offset in zip(header, offsets):
+        # the views keep buf mapped
+        previous[(namelist, MESA_DIR)] = cache_defaults(namelist, MESA_DIR, SharedDefaults(buf, offset))
+    return previous
+
+
+@contextlib.contextmanager
+def shared_defaults(MESA_DIRs: "list"):
+    """
+    writes the defaults of MESA_DIRs to a temporary file and uses it in this process (so forked
+    processes inherit the views rather than the dictionaries). Yields the path of the file,
+    to pass to attach_shared_defaults in processes not forked from this one. The file is
+    removed at the end, the processes still using it keep their mapping, and this process
+    uses again the defaults it had before.
+    """
+    fd, path = tempfile.mkstemp(prefix="compare_workdir_defaults_")
+    os.close(fd)
+    previous = {}
+    try:
+        write_shared_defaults(path, MESA_DIRs)
+        previous = attach_shared_defaults(path)
+        yield path
+    finally:
+        for (namelist, MESA_DIR), defaults in previous.items():
+            cache_defaults(namelist, MESA_DIR, defaults)
+        os.remove(path)
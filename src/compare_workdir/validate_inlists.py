@@ -0,0 +1,169 @@
+#!/usr/bin/python3
+# author: Mathieu Renzo
+
+# Author: Mathieu Renzo <mathren90@gmail.com>
+# Keywords: files
+
+# Copyright (C) 2019-2021 Mathieu Renzo
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or (at
+# your option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see http://www.gnu.org/licenses/.
+
+# Check that all the options set in inlists or work directories exist in
+# the defaults of MESA_DIR, and suggest the closest existing options
+# for those that don't (typically typos, or options renamed between MESA versions).
+
+import sys
+import difflib
+
+# pip install -U termcolor
+from termcolor import colored
+
+# pip install -U click
+import click
+
+from .compare_inlists import get_MESA_DIR, get_defaults
+from .compare_all_workdir_inlists import resolve_path, defaults_name
+from .batch_compare import read_paths
+from .errors import report_errors
+from .file_access import ExistingPath
+
+
+# ------------------------- nearest options ----------------------------------
+
+
+def trigrams(key: "str") -> "set":
+    """set of the 3-characters substrings of key (padded, so that short keys have some)"""
+    padded = "  " + key + " "
+    return {padded[i : i + 3] for i in range(len(padded) - 2)}
+
+
+def build_trigram_index(keys) -> "dict":
+    """returns a dictionary with each trigram as keys and the set of keys containing it as values"""
+    index = {}
+    for key in keys:
+        for t in trigrams(key):
+            index.setdefault(t, set()).add(key)
+    return index
+
+
+def nearest_keys(key: "str", index: "dict", n=3, cutoff=0.6) -> "list":
+    """
+    returns up to n keys in the trigram index similar to key, best first. Candidates are
+    the keys sharing the most trigrams with key, ranked by their similarity to key.
+    """
+    shared = {}
+    for t in trigrams(key):
+        for candidate in index.get(t, ()):
+            shared[candidate] = shared.get(candidate, 0) + 1
+    candidates = sorted(shared, key=lambda c: shared[c], reverse=True)[: 10 * n]
+    return difflib.get_close_matches(key, candidates, n=n, cutoff=cutoff)
+
+
+# ------------------------- check the options ----------------------------------
+
+
+def option_base_name(key: "str") -> "str":
+    """name of the option without array indices, e.g. x_ctrl for x_ctrl(1)"""
+    return key.split("(")[0].strip()
+
+
+# option names of each defaults, their trigram index and the suggestions
+# already computed, shared by all the inlists checked
+_known_keys = {}
+_trigram_indexes = {}
+_suggestions = {}
+
+
+def get_known_keys(namelist: "str", MESA_DIR: "str") -> "set":
+    """set of the option names in the defaults of namelist"""
+    if (namelist, MESA_DIR) not in _known_keys:
+        _known_keys[(namelist, MESA_DIR)] = {option_base_name(k) for k in get_defaults(namelist, MESA_DIR)}
+    return _known_keys[(namelist, MESA_DIR)]
+
+
+def suggest_keys(key: "str", namelist: "str", MESA_DIR: "str") -> "list":
+    """closest options to key in the defaults of namelist"""
+    # the same typo is usually repeated in many inlists of a grid
+    if (key, namelist, MESA_DIR) not in _suggestions:
+        if (namelist, MESA_DIR) not in _trigram_indexes:
+            _trigram_indexes[(namelist, MESA_DIR)] = build_trigram_index(get_known_keys(namelist, MESA_DIR))
+        _suggestions[(key, namelist, MESA_DIR)] = nearest_keys(key, _trigram_indexes[(namelist, MESA_DIR)])
+    return _suggestions[(key, namelist, MESA_DIR)]
+
+
+def unknown_keys(namelist: "dict", defaults_namelist: "str", MESA_DIR: "str") -> "list":
+    """returns the sorted list of (key, suggestions) for the options in namelist not in the defaults"""
+    known = get_known_keys(defaults_namelist, MESA_DIR)
+    unknown = []
+    for key in namelist:
+        name = option_base_name(key)
+        if name not in known:
+            unknown.append((key, suggest_keys(name, defaults_namelist, MESA_DIR)))
+    return sorted(unknown)
+
+
+def validate_paths(paths: "list", do_pgstar=True, MESA_DIR="") -> "dict":
+    """
+    checks all the options (after following nested inlists) in each work directory or inlist in paths
+    against the defaults, and returns a dictionary {path: {namelist: [(unknown key, suggestions)]}}
+    with only the paths and namelists with unknown options
+    """
+    if MESA_DIR == "":
+        MESA_DIR = get_MESA_DIR()
+    report = {}
+    for path in paths:
+        namelists = resolve_path(path, do_pgstar=do_pgstar, MESA_DIR=MESA_DIR)
+        for section, namelist in namelists.items():
+            unknown = unknown_keys(namelist, defaults_name(section), MESA_DIR)
+            if unknown:
+                report.setdefault(path, {})[section] = unknown
+    return report
+
+
+def print_report(report: "dict", n_paths: "int"):
+    for path, sections in report.items():
+        print(colored(path, "yellow"))
+        for section, unknown in sections.items():
+            for key, suggestions in unknown:
+                hint = ", did you mean " + " or ".join(suggestions) + "?" if suggestions else ""
+                print(colored(f"  &{section:<25}\t{key} not in defaults{hint}", "yellow"))
+    n_bad = len(report)
+    color = "yellow" if n_bad else "green"
+    print(colored(f"{n_bad} of {n_paths} work directories or inlists set options not in the defaults", color))
+
+
+# command line wrapper
+@click.command(context_settings={"ignore_unknown_options": True})
+@click.argument("paths", nargs=-1, type=ExistingPath())
+@click.option(
+    "--batch", default="", help="Also check the work directories or inlists listed in this file (- for stdin)."
+)
+@click.option("--pgstar", default=True, help="Check also the pgstar namelists.")
+@click.option(
+    "--mesa_dir",
+    default="",
+    help="use customized location of $MESA_DIR. Will use environment variable if empty and return an error if empty.",
+)
+@report_errors
+def validate_inlists(paths, batch, pgstar, mesa_dir):
+    paths = list(paths)
+    if batch != "":
+        paths += read_paths(batch)
+    report = validate_paths(paths, do_pgstar=pgstar, MESA_DIR=mesa_dir)
+    print_report(report, len(paths))
+    sys.exit(1 if report else 0)
+
+
+if __name__ == "__main__":
+    validate_inlists()
@@ -0,0 +1,11 @@
+from compare_workdir.batch_compare import read_pairs, compare_batch
+
+
+def test_malformed_lines_fail(tmp_path, capsys):
+    batch_file = tmp_path / "pairs.txt"
+    batch_file.write_text("# not compared\n\nwork_dir1\nwork_dir1 work_dir2 work_dir3\n")
+    malformed = []
+    assert read_pairs(str(batch_file), malformed=malformed) == []
+    assert malformed == [(2, "work_dir1"), (3, "work_dir1 work_dir2 work_dir3")]
+    assert compare_batch(str(batch_file), MESA_DIR=str(tmp_path)) == 2
+    assert "compared 0 of 2 pairs" in capsys.readouterr().out
@@ -0,0 +1,44 @@
+import os
+
+from compare_workdir.compare_inlists import DEFAULTS_FILES
+from compare_workdir.catalog import update_catalog, query_catalog
+
+TOP_INLIST = """&star_job
+/
+&eos
+/
+&kap
+/
+&controls
+  read_extra_controls_inlist(1) = .true.
+  extra_controls_inlist_name(1) = 'inlist_a'
+  read_extra_controls_inlist(2) = .true.
+  extra_controls_inlist_name(2) = 'inlist_b'
+/
+&pgstar
+/
+"""
+
+
+def write(path, text):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w") as F:
+        F.write(text)
+
+
+def test_overridden_nested_inlist_is_tracked(tmp_path):
+    mesa_dir = str(tmp_path / "mesa")
+    for fname in DEFAULTS_FILES.values():
+        write(os.path.join(mesa_dir, fname), "")
+    work_dir = str(tmp_path / "work")
+    write(os.path.join(work_dir, "inlist"), TOP_INLIST)
+    # all the options of inlist_a are overridden by inlist_b
+    write(os.path.join(work_dir, "inlist_a"), "&controls\n  initial_mass = 10\n/\n")
+    write(os.path.join(work_dir, "inlist_b"), "&controls\n  initial_mass = 15\n/\n")
+    database = str(tmp_path / "catalog.db")
+    assert update_catalog(database, [work_dir], MESA_DIR=mesa_dir) == (1, 0, 0)
+    assert update_catalog(database, [work_dir], MESA_DIR=mesa_dir) == (0, 1, 0)
+    write(os.path.join(work_dir, "inlist_a"), "&controls\n  initial_mass = 10\n  initial_z = 0.01\n/\n")
+    assert update_catalog(database, [work_dir], MESA_DIR=mesa_dir) == (1, 0, 0)
+    rows = query_catalog(database, "initial_z")
+    assert [row[3] for row in rows] == ["0.01"]
@@ -0,0 +1,35 @@
+import os
+
+from compare_workdir.compare_inlists import DEFAULTS_FILES
+from compare_workdir.defaults_delta import get_defaults_delta, diff_across_versions, equal_across_versions
+
+
+def write(path, text):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w") as F:
+        F.write(text)
+
+
+def make_mesa_dir(tmp_path, name, controls):
+    mesa_dir = str(tmp_path / name)
+    for namelist, fname in DEFAULTS_FILES.items():
+        write(os.path.join(mesa_dir, fname), controls if namelist == "controls" else "")
+    return mesa_dir
+
+
+def test_renamed_option_set_on_one_side(tmp_path, capsys):
+    mesa_dir1 = make_mesa_dir(tmp_path, "mesa1", "      old_name_for_thing = 3\n")
+    mesa_dir2 = make_mesa_dir(tmp_path, "mesa2", "      new_name_for_thing = 3\n")
+    assert get_defaults_delta("controls", mesa_dir1, mesa_dir2)["renamed"] == {
+        "old_name_for_thing": "new_name_for_thing"
+    }
+    nml1 = {}
+    nml2 = {"new_name_for_thing": 5}
+    assert not equal_across_versions("controls", nml1, nml2, mesa_dir1, mesa_dir2)
+    diff_across_versions("controls", nml1, nml2, "inlist1", "inlist2", mesa_dir1, mesa_dir2)
+    out = capsys.readouterr().out
+    assert "not in defaults" not in out
+    assert "new_name_for_thing=3" in out
+    assert "new_name_for_thing=5" in out
+    # the default under its new name is the same as the value set on side 2
+    assert equal_across_versions("controls", nml1, {"new_name_for_thing": 3}, mesa_dir1, mesa_dir2)
@@ -0,0 +1,37 @@
+import os
+
+from compare_workdir.compare_inlists import DEFAULTS_FILES
+from compare_workdir.diff_cache import structured_diff
+
+
+def write(path, text):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w") as F:
+        F.write(text)
+
+
+def make_mesa_dir(tmp_path, name, controls):
+    mesa_dir = str(tmp_path / name)
+    for namelist, fname in DEFAULTS_FILES.items():
+        write(os.path.join(mesa_dir, fname), controls if namelist == "controls" else "")
+    return mesa_dir
+
+
+def test_across_versions(tmp_path):
+    mesa_dir1 = make_mesa_dir(tmp_path, "mesa1", "      initial_mass = 1\n      old_name_for_thing = 3\n")
+    mesa_dir2 = make_mesa_dir(tmp_path, "mesa2", "      initial_mass = 2\n      new_name_for_thing = 3\n")
+    inlist1 = str(tmp_path / "inlist1")
+    write(inlist1, "&controls\n  initial_z = 0.02\n/\n")
+    inlist2 = str(tmp_path / "inlist2")
+    write(inlist2, "&controls\n  initial_z = 0.02\n  new_name_for_thing = 5\n/\n")
+    for cache_dir in (None, str(tmp_path / "cache")):
+        # same options, but the default of initial_mass changed
+        assert structured_diff(inlist1, inlist1, MESA_DIR=mesa_dir1, MESA_DIR2=mesa_dir2, cache_dir=cache_dir) == [
+            ["controls/initial_mass", "1.0", "2.0"]
+        ]
+        # old_name_for_thing was renamed, its old default is compared with the value set on side 2
+        assert structured_diff(inlist1, inlist2, MESA_DIR=mesa_dir1, MESA_DIR2=mesa_dir2, cache_dir=cache_dir) == [
+            ["controls/initial_mass", "1.0", "2.0"],
+            ["controls/new_name_for_thing", None, "5.0"],
+        ]
+        assert structured_diff(inlist1, inlist1, MESA_DIR=mesa_dir1, cache_dir=cache_dir) == []
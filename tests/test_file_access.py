@@ -0,0 +1,64 @@
+import os
+import subprocess
+
+from compare_workdir.compare_inlists import DEFAULTS_FILES
+from compare_workdir.compare_all_workdir_inlists import resolve_work_dir
+from compare_workdir.file_access import normalize_git_spec
+
+WORK_INLIST = """&star_job
+/
+&eos
+/
+&kap
+/
+&controls
+  read_extra_controls_inlist(1) = .true.
+  extra_controls_inlist_name(1) = '../common/inlist_common'
+/
+&pgstar
+/
+"""
+
+COMMON_INLIST = """&controls
+  initial_mass = 15
+/
+"""
+
+
+def write(path, text):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w") as F:
+        F.write(text)
+
+
+def git(repo, *args):
+    subprocess.run(
+        ["git", "-c", "user.name=test", "-c", "user.email=test@example.com", *args],
+        cwd=repo,
+        check=True,
+        stdout=subprocess.DEVNULL,
+    )
+
+
+def test_normalize_git_spec():
+    assert normalize_git_spec("HEAD:work/../common/inlist_common") == "HEAD:common/inlist_common"
+    assert normalize_git_spec("HEAD~1:./work/./inlist") == "HEAD~1:./work/inlist"
+    assert normalize_git_spec("HEAD:work/..") == "HEAD:"
+    assert normalize_git_spec("HEAD") == "HEAD"
+
+
+def test_git_nested_inlist_in_parent_dir(tmp_path, monkeypatch):
+    mesa_dir = str(tmp_path / "mesa")
+    for fname in DEFAULTS_FILES.values():
+        write(os.path.join(mesa_dir, fname), "")
+    repo = str(tmp_path / "repo")
+    write(os.path.join(repo, "work", "inlist"), WORK_INLIST)
+    write(os.path.join(repo, "common", "inlist_common"), COMMON_INLIST)
+    git(repo, "init", "-q")
+    git(repo, "add", ".")
+    git(repo, "commit", "-q", "-m", "inlists")
+    monkeypatch.chdir(repo)
+    from_git = resolve_work_dir("HEAD:work", MESA_DIR=mesa_dir)
+    on_disk = resolve_work_dir("work", MESA_DIR=mesa_dir)
+    assert from_git["controls"]["initial_mass"] == 15
+    assert from_git == on_disk
@@ -0,0 +1,38 @@
+import os
+
+from compare_workdir.compare_inlists import DEFAULTS_FILES
+from compare_workdir.fingerprint import path_fingerprints
+from compare_workdir.cluster_inlists import path_options
+
+PGSTAR_DEFAULTS = """
+      Grid1_win_flag = .false.
+      Text_Summary1_name(:,:) = ''
+"""
+
+
+def write(path, text):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w") as F:
+        F.write(text)
+
+
+def make_inlist(tmp_path, name, text):
+    mesa_dir = str(tmp_path / "mesa")
+    for namelist, fname in DEFAULTS_FILES.items():
+        write(os.path.join(mesa_dir, fname), PGSTAR_DEFAULTS if namelist == "pgstar" else "")
+    inlist = str(tmp_path / name)
+    write(inlist, "&pgstar\n" + text + "/\n")
+    return inlist, mesa_dir
+
+
+def test_2d_pgstar_element(tmp_path):
+    inlist1, mesa_dir = make_inlist(tmp_path, "inlist1", "  Text_Summary1_name(1,1) = 'model_number'\n")
+    inlist2, _ = make_inlist(
+        tmp_path, "inlist2", "  Text_Summary1_name(1,1) = 'model_number'\n  Text_Summary1_name(2,1) = ''\n"
+    )
+    options = path_options(inlist1, do_pgstar=True, MESA_DIR=mesa_dir)
+    assert options == {"pgstar/text_summary1_name(1,1)": "'model_number'"}
+    # element (2,1) is set to the default of the whole array
+    fingerprint1 = path_fingerprints(inlist1, do_pgstar=True, MESA_DIR=mesa_dir)[0]
+    fingerprint2 = path_fingerprints(inlist2, do_pgstar=True, MESA_DIR=mesa_dir)[0]
+    assert fingerprint1 == fingerprint2
@@ -0,0 +1,65 @@
+import os
+
+from compare_workdir.compare_inlists import DEFAULTS_FILES
+from compare_workdir.flatten_inlists import flatten_work_dir
+from compare_workdir.fingerprint import path_fingerprints, namelist_fingerprint
+
+DEFAULTS = {
+    "binary_job": "      inlist_names(1) = 'inlist1'\n      inlist_names(2) = 'inlist2'\n",
+    "pgstar": "      Grid1_win_flag = .false.\n",
+}
+
+BINARY_INLIST = """&binary_job
+  evolve_both_stars = .true.
+/
+&binary_controls
+  m1 = 20d0
+  m2 = 15d0
+/
+&pgstar
+  read_extra_binary_pgstar_inlist(1) = .true.
+  extra_binary_pgstar_inlist_name(1) = 'inlist_pgstar_binary'
+/
+"""
+
+STAR_INLIST = """&star_job
+  pgstar_flag = .true.
+/
+&eos
+/
+&kap
+/
+&controls
+  initial_z = {z}
+/
+&pgstar
+  Grid1_win_flag = .true.
+/
+"""
+
+
+def write(path, text):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w") as F:
+        F.write(text)
+
+
+def test_flatten_binary_round_trip(tmp_path):
+    mesa_dir = str(tmp_path / "mesa")
+    for namelist, fname in DEFAULTS_FILES.items():
+        write(os.path.join(mesa_dir, fname), DEFAULTS.get(namelist, ""))
+    work_dir = str(tmp_path / "binary")
+    write(os.path.join(work_dir, "inlist"), BINARY_INLIST)
+    write(os.path.join(work_dir, "inlist_pgstar_binary"), "&pgstar\n  Grid1_win_flag = .true.\n/\n")
+    write(os.path.join(work_dir, "inlist1"), STAR_INLIST.format(z=0.02))
+    write(os.path.join(work_dir, "inlist2"), STAR_INLIST.format(z=0.01))
+    flat_dir = str(tmp_path / "flat")
+    os.makedirs(flat_dir)
+    written = flatten_work_dir(work_dir, os.path.join(flat_dir, "inlist"), MESA_DIR=mesa_dir)
+    assert len(written) == 3
+    original = path_fingerprints(work_dir, do_pgstar=True, MESA_DIR=mesa_dir)[1]
+    flat = path_fingerprints(flat_dir, do_pgstar=True, MESA_DIR=mesa_dir)[1]
+    # inlist_names of binary_job point to the flat inlists of the stars
+    del original["binary_job"], flat["binary_job"]
+    assert original["binary_pgstar"] != namelist_fingerprint({}, {})
+    assert flat == original
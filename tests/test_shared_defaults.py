@@ -0,0 +1,25 @@
+import os
+
+from compare_workdir.compare_inlists import DEFAULTS_FILES, get_defaults
+from compare_workdir.shared_defaults import shared_defaults, SharedDefaults
+
+
+def write(path, text):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w") as F:
+        F.write(text)
+
+
+def test_shared_defaults(tmp_path):
+    mesa_dir = str(tmp_path / "mesa")
+    for namelist, fname in DEFAULTS_FILES.items():
+        write(os.path.join(mesa_dir, fname), "      x_ctrl(1:3) = 1d0\n" if namelist == "controls" else "")
+    before = get_defaults("controls", mesa_dir)
+    with shared_defaults([mesa_dir]) as path:
+        shared = get_defaults("controls", mesa_dir)
+        assert isinstance(shared, SharedDefaults)
+        assert shared["x_ctrl"] == before["x_ctrl"]
+        # decoded once
+        assert shared["x_ctrl"] is shared["x_ctrl"]
+    assert not os.path.exists(path)
+    assert get_defaults("controls", mesa_dir) is before